@@ -1,12 +1,12 @@
 # run_collection.py
-from src.loader import download_data
+import asyncio
+from src.loader import download_many
 
 TICKERS_TO_DOWNLOAD = ["SBER", "FLOT", "SELG"]
 
 if __name__ == "__main__":
     print("Запуск сборщика данных...")
     
-    for ticker in TICKERS_TO_DOWNLOAD:
-        download_data(ticker, days_back=60)
+    asyncio.run(download_many(TICKERS_TO_DOWNLOAD, days_back=60))
         
-    print("Сбор данных завершен. Проверьте папку data/")
\ No newline at end of file
+    print("Сбор данных завершен. Проверьте папку data/")
@@ -2,7 +2,7 @@ import time
 import pandas as pd
 from datetime import datetime
 from src.storage import load_ticker_data, get_last_candle_time
-from src.physics import calculate_square_root_law, calculate_deviations
+from src.physics import OnlineSquareRootLaw, ZScoreScorer, closed_candles
 from src.loader import download_data
 
 WATCHLIST = ["FLOT", "SELG","SBER"]
@@ -12,6 +12,8 @@ def monitor_market():
     print(f"Отслеживаем активы: {WATCHLIST}")
     print("Нажмите Ctrl+C для остановки.\n")
 
+    # закон по каждому тикеру ведется потоково: на каждом круге доливаются только новые закрытые свечи
+    laws = {}
     try:
         while True:
             print(f"[{datetime.now().strftime('%H:%M:%S')}] Обновление данных...", end=" ")
@@ -25,13 +27,17 @@ def monitor_market():
                 df = load_ticker_data(ticker)
                 if len(df) < 100: continue
                 
-                model = calculate_square_root_law(df)
-                if not model: continue
+                closed = closed_candles(df)
+                if ticker in laws:
+                    laws[ticker].update_frame(closed)
+                else:
+                    laws[ticker] = OnlineSquareRootLaw.from_frame(closed)
+                scorer = ZScoreScorer.from_estimator(laws[ticker])
+                if not scorer: continue
                 
-                df_dev = calculate_deviations(df, model)
-                
-                last_candle = df_dev.iloc[-1]
-                z_score = last_candle['z_score']
+                last_candle = df.iloc[-1]
+                z_score = scorer.score(last_candle)
+                if z_score is None: continue
                 
 
                 if z_score < -2.5:
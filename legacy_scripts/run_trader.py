@@ -9,7 +9,7 @@ from src.storage import load_ticker_data
 from src.loader import download_data
 from src.ml.model import PhysicsLSTMPredictor
 from src.ml.dataset import MarketDataset
-from src.physics import calculate_square_root_law, calculate_deviations
+from src.physics import OnlineSquareRootLaw, ZScoreScorer, closed_candles
 
 SANDBOX_MODE = True
 TICKER = "SELG"
@@ -30,6 +30,9 @@ class PhysicsBot:
             logger.error("Модель не найдена! Сначала запустите run_training.py")
             exit()
 
+        # закон I ~ sqrt(Q) ведется потоково, как в SandboxBot: без перерасчета истории на каждом тике
+        self.law = None
+
     def get_signal(self):
         """Анализирует рынок и ищет аномалии"""
         download_data(TICKER, days_back=3)
@@ -37,11 +40,17 @@ class PhysicsBot:
         df = load_ticker_data(TICKER)
         if len(df) < 100: return None
         
-        phys_model = calculate_square_root_law(df)
-        if not phys_model: return None
+        closed = closed_candles(df)
+        if self.law is None:
+            self.law = OnlineSquareRootLaw.from_frame(closed)
+        else:
+            self.law.update_frame(closed)
+        scorer = ZScoreScorer.from_estimator(self.law)
+        if not scorer: return None
         
-        df_phys = calculate_deviations(df, phys_model)
-        last_candle = df_phys.iloc[-1]
+        last_candle = df.iloc[-1]
+        z_score = scorer.score(last_candle)
+        if z_score is None: return None
         
         ds = MarketDataset(df.tail(80))
         if len(ds) < 1: return None
@@ -53,7 +62,7 @@ class PhysicsBot:
         return {
             'time': last_candle['time'],
             'price': last_candle['close'],
-            'z_score': last_candle['z_score'],
+            'z_score': z_score,
             'ai_vol': ai_volatility
         }
 
@@ -1,7 +1,7 @@
 import torch
 from torch.utils.data import DataLoader
 from src.storage import load_ticker_data
-from src.ml.dataset import MarketDataset
+from src.ml.dataset import MarketDataset, WindowBatchSampler
 from src.ml.model import PhysicsLSTMPredictor
 from src.ml.loss import pinn_loss_function
 
@@ -17,7 +17,8 @@ def train():
         return
         
     dataset = MarketDataset(df)
-    loader = DataLoader(dataset, batch_size=32, shuffle=True)
+    # пачки целиком: одна выборка окон на пачку вместо поштучного collate
+    loader = DataLoader(dataset, sampler=WindowBatchSampler(len(dataset), batch_size=32, shuffle=True), batch_size=None)
     
     model = PhysicsLSTMPredictor()
     optimizer = torch.optim.Adam(model.parameters(), lr=0.001)
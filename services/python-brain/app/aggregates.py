@@ -0,0 +1,125 @@
+"""
+Производные таймфреймы (5m, 15m, 1h, 1d) из минутных свечей.
+
+Инкрементальное обновление вызывается после записи новых минуток,
+полная пересборка для бэкфилла:
+    python -m app.aggregates rebuild [--ticker SBER] [--interval 1h]
+"""
+import argparse
+from datetime import timedelta
+
+import pandas as pd
+
+from .config import logger
+from .storage import AGGREGATE_INTERVALS, save_candles_to_db, list_tickers, get_first_candle_time
+from .archive import load_archived_history, archived_days
+
+REBUILD_BATCH_DAYS = 30
+
+
+def resample_candles(df: pd.DataFrame, interval: str) -> pd.DataFrame:
+    """Собирает бары таймфрейма interval из минутных свечей. Пустые бакеты выкидываются."""
+    rule = AGGREGATE_INTERVALS[interval]
+    bars = df.set_index('time').resample(rule, label='left', closed='left').agg({
+        'open': 'first',
+        'high': 'max',
+        'low': 'min',
+        'close': 'last',
+        'volume': 'sum'
+    }).dropna(subset=['open'])
+
+    bars['volatility'] = bars['high'] - bars['low']
+    return bars.reset_index()
+
+
+def _utc(ts) -> pd.Timestamp:
+    ts = pd.Timestamp(ts)
+    return ts.tz_localize('UTC') if ts.tzinfo is None else ts.tz_convert('UTC')
+
+
+def _first_day(ticker: str):
+    """Первый день минутной истории с учетом архива (после --prune его в БД уже нет)."""
+    days = archived_days(ticker)
+    if days:
+        return days[0]
+    first_time = get_first_candle_time(ticker)
+    return pd.Timestamp(first_time).date() if first_time is not None else None
+
+
+def _save_bars(ticker: str, df: pd.DataFrame, intervals: list) -> dict:
+    saved = {}
+    for interval in intervals:
+        bars = resample_candles(df, interval)
+        bars.insert(0, 'ticker', ticker)
+        saved[interval] = save_candles_to_db(bars.to_dict('records'), interval=interval)
+    return saved
+
+
+def update_aggregates(ticker: str, start, end=None, intervals: list = None) -> dict:
+    """
+    Пересчитывает бары, задетые минутками из [start, end].
+    Читается только диапазон от начала самого крупного затронутого бакета.
+    """
+    intervals = intervals or list(AGGREGATE_INTERVALS)
+    start = _utc(start)
+
+    read_from = min(start.floor(AGGREGATE_INTERVALS[i]) for i in intervals)
+    read_to = None
+    if end is not None:
+        end = _utc(end)
+        read_to = max(end.floor(AGGREGATE_INTERVALS[i]) + pd.Timedelta(AGGREGATE_INTERVALS[i]) for i in intervals)
+        read_to -= pd.Timedelta(microseconds=1)
+
+    df = load_archived_history(ticker, start=read_from, end=read_to,
+                               columns=['time', 'open', 'high', 'low', 'close', 'volume'])
+    if df.empty:
+        return {}
+    return _save_bars(ticker, df, intervals)
+
+
+def rebuild_aggregates(ticker: str = None, intervals: list = None) -> dict:
+    """Полная пересборка производных таблиц по всей минутной истории (БД + архив)."""
+    intervals = intervals or list(AGGREGATE_INTERVALS)
+    tickers = [ticker] if ticker else list_tickers()
+    today = pd.Timestamp.now(tz='UTC').date()
+    result = {}
+
+    for t in tickers:
+        first_day = _first_day(t)
+        if first_day is None:
+            continue
+
+        total = dict.fromkeys(intervals, 0)
+        batch_start = first_day
+        # пачки выровнены по границам суток, поэтому дневные бары не режутся
+        while batch_start <= today:
+            batch_end = batch_start + timedelta(days=REBUILD_BATCH_DAYS)
+            df = load_archived_history(
+                t, start=_utc(batch_start), end=_utc(batch_end) - pd.Timedelta(microseconds=1),
+                columns=['time', 'open', 'high', 'low', 'close', 'volume']
+            )
+            if not df.empty:
+                for interval, count in _save_bars(t, df, intervals).items():
+                    total[interval] += count
+            batch_start = batch_end
+
+        result[t] = total
+        logger.info(f"{t}: пересобраны таймфреймы {total}")
+
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Производные таймфреймы свечей")
+    sub = parser.add_subparsers(dest="command", required=True)
+    rebuild = sub.add_parser("rebuild", help="Пересобрать таблицы таймфреймов из минуток")
+    rebuild.add_argument("--ticker", default=None)
+    rebuild.add_argument("--interval", choices=list(AGGREGATE_INTERVALS), default=None)
+    args = parser.parse_args()
+
+    if args.command == "rebuild":
+        rebuild_aggregates(args.ticker, [args.interval] if args.interval else None)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+"""
+Архивный слой истории свечей.
+
+Закрытые дни выгружаются из таблицы candles в файлы Arrow IPC без сжатия:
+ARCHIVE_DIR/ticker=<TICKER>/date=<YYYY-MM-DD>.arrow
+Такие файлы открываются через memory map, без чтения целиком в память,
+а свежие дни по-прежнему берутся из БД.
+
+Выгрузка:
+    python -m app.archive export [--ticker SBER] [--prune]
+"""
+import argparse
+from datetime import date, datetime, time, timedelta, timezone
+
+import pandas as pd
+from sqlalchemy import delete
+
+from .config import ARCHIVE_DIR, logger
+from .storage import engine, Candle, CANDLE_COLUMNS, load_ticker_window, list_tickers, get_first_candle_time
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+except ImportError:
+    pa = None
+
+EXPORT_BATCH_DAYS = 30
+
+
+def _ticker_dir(ticker: str):
+    return ARCHIVE_DIR / f"ticker={ticker}"
+
+
+def _partition_path(ticker: str, day: date):
+    return _ticker_dir(ticker) / f"date={day.isoformat()}.arrow"
+
+
+def _day_start(day: date) -> datetime:
+    return datetime.combine(day, time.min, tzinfo=timezone.utc)
+
+
+def _utc(ts) -> pd.Timestamp:
+    ts = pd.Timestamp(ts)
+    return ts.tz_localize('UTC') if ts.tzinfo is None else ts.tz_convert('UTC')
+
+
+def archived_days(ticker: str) -> list:
+    """Отсортированный список дней, уже лежащих в архиве."""
+    ticker_dir = _ticker_dir(ticker)
+    if pa is None or not ticker_dir.exists():
+        return []
+    return sorted(date.fromisoformat(p.stem.split("=", 1)[1]) for p in ticker_dir.glob("date=*.arrow"))
+
+
+def has_archive(ticker: str) -> bool:
+    return bool(archived_days(ticker))
+
+
+def write_day(ticker: str, day: date, df: pd.DataFrame):
+    """Пишет один день тикера. Файл подменяется атомарно через временный."""
+    path = _partition_path(ticker, day)
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    data = df[CANDLE_COLUMNS].drop(columns=['ticker']).reset_index(drop=True)
+    table = pa.Table.from_pandas(data, preserve_index=False)
+
+    tmp_path = path.with_suffix(".tmp")
+    with pa.OSFile(str(tmp_path), "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    tmp_path.replace(path)
+
+
+def patch_day(ticker: str, day: date, df: pd.DataFrame):
+    """Доливает свечи в уже заархивированный день (совпадения по time заменяются новыми)."""
+    old = read_archive(ticker, start=_day_start(day), end=_day_start(day + timedelta(days=1)) - timedelta(microseconds=1))
+    merged = pd.concat([old, df[CANDLE_COLUMNS]], ignore_index=True) if not old.empty else df[CANDLE_COLUMNS]
+    merged = merged.drop_duplicates(subset='time', keep='last').sort_values('time')
+    write_day(ticker, day, merged)
+
+
+def read_archive(ticker: str, start=None, end=None, columns: list = None) -> pd.DataFrame:
+    """
+    Читает архив тикера за [start, end] через memory map.
+    Без копирования в DataFrame попадают только числовые колонки одного дня без
+    фильтра по времени; несколько дней склеиваются в чанкованные колонки, и
+    to_pandas (как и фильтр по start/end) копирует данные один раз.
+    """
+    start = _utc(start) if start is not None else None
+    end = _utc(end) if end is not None else None
+
+    days = archived_days(ticker)
+    if start is not None:
+        days = [d for d in days if d >= start.date()]
+    if end is not None:
+        days = [d for d in days if d <= end.date()]
+    if not days:
+        return pd.DataFrame()
+
+    tables = []
+    for day in days:
+        source = pa.memory_map(str(_partition_path(ticker, day)), "r")
+        tables.append(pa.ipc.open_file(source).read_all())
+    table = pa.concat_tables(tables)
+
+    time_type = table.schema.field('time').type
+    if start is not None:
+        table = table.filter(pc.greater_equal(table['time'], pa.scalar(start.to_pydatetime(), time_type)))
+    if end is not None:
+        table = table.filter(pc.less_equal(table['time'], pa.scalar(end.to_pydatetime(), time_type)))
+    if columns is not None:
+        table = table.select([col for col in columns if col != 'ticker'])
+
+    df = table.to_pandas(split_blocks=True)
+    if columns is None or 'ticker' in columns:
+        df.insert(0, 'ticker', ticker)
+    return df
+
+
+def load_archived_history(ticker: str, start=None, end=None, columns: list = None) -> pd.DataFrame:
+    """Склеивает архив с днями, которых в архиве еще нет (они читаются из БД)."""
+    days = archived_days(ticker)
+    if not days:
+        return load_ticker_window(ticker, start=start, end=end, columns=columns)
+
+    archive_end = _utc(_day_start(days[-1] + timedelta(days=1)))
+    old = read_archive(ticker, start=start, end=end, columns=columns)
+
+    if end is not None and _utc(end) < archive_end:
+        return old
+    db_start = archive_end if start is None else max(_utc(start), archive_end)
+
+    recent = load_ticker_window(ticker, start=db_start, end=end, columns=columns)
+    if old.empty:
+        return recent
+    if recent.empty:
+        return old
+    return pd.concat([old, recent[old.columns]], ignore_index=True)
+
+
+def _prune_db(ticker: str, before: datetime):
+    table = Candle.__table__
+    with engine.begin() as conn:
+        result = conn.execute(
+            delete(table).where(table.c.ticker == ticker, table.c.time < before.replace(tzinfo=None))
+        )
+    logger.info(f"{ticker}: удалено из БД {result.rowcount} заархивированных свечей")
+
+
+def export_closed_days(ticker: str = None, prune: bool = False) -> dict:
+    """
+    Выгружает в архив все закрытые (до сегодняшнего UTC-дня) дни, которых там еще нет.
+    prune=True удаляет выгруженные дни из таблицы candles.
+    Возвращает {ticker: число выгруженных дней}.
+    """
+    if pa is None:
+        logger.error("pyarrow не установлен, архив недоступен")
+        return {}
+
+    tickers = [ticker] if ticker else list_tickers()
+    today = datetime.now(timezone.utc).date()
+    exported = {}
+
+    for t in tickers:
+        days = archived_days(t)
+        if days:
+            first_day = days[-1] + timedelta(days=1)
+        else:
+            first_time = get_first_candle_time(t)
+            if first_time is None:
+                continue
+            first_day = pd.Timestamp(first_time).date()
+
+        count = 0
+        batch_start = first_day
+        while batch_start < today:
+            batch_end = min(batch_start + timedelta(days=EXPORT_BATCH_DAYS), today)
+            df = load_ticker_window(
+                t, start=_day_start(batch_start), end=_day_start(batch_end) - timedelta(microseconds=1)
+            )
+            if not df.empty:
+                for day, day_df in df.groupby(df['time'].dt.date):
+                    write_day(t, day, day_df)
+                    count += 1
+            batch_start = batch_end
+
+        exported[t] = count
+        logger.info(f"{t}: в архив выгружено {count} дней")
+
+        days = archived_days(t)
+        if prune and days:
+            _prune_db(t, _day_start(days[-1] + timedelta(days=1)))
+
+    return exported
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Архив свечей в Arrow-файлах")
+    sub = parser.add_subparsers(dest="command", required=True)
+    export = sub.add_parser("export", help="Выгрузить закрытые дни в архив")
+    export.add_argument("--ticker", default=None)
+    export.add_argument("--prune", action="store_true", help="Удалить выгруженные дни из БД")
+    args = parser.parse_args()
+
+    if args.command == "export":
+        export_closed_days(args.ticker, prune=args.prune)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+"""
+Шина событий между сервисами.
+
+Muscle публикует каждую закрытую минутную свечу в канал CANDLES_CHANNEL,
+brain подписывается и доливает ее в кэш свечей без опроса БД.
+Адрес шины берется из BUS_URL:
+    redis://...  - Redis pub/sub
+    loopback://  - очередь в пределах процесса (тесты, локальный запуск)
+    пусто        - шины нет, все работает опросом БД, как раньше
+"""
+import json
+import random
+import asyncio
+import threading
+
+import pandas as pd
+
+from .config import BUS_URL, logger
+
+CANDLES_CHANNEL = "candles.closed"
+
+
+def encode_candle(row: dict) -> str:
+    return json.dumps({**row, 'time': pd.Timestamp(row['time']).isoformat()})
+
+
+def decode_candle(message) -> dict:
+    row = json.loads(message)
+    row['time'] = pd.Timestamp(row['time'])
+    return row
+
+
+class LoopbackBus:
+    """Шина в пределах одного процесса: каждый подписчик получает свою asyncio-очередь."""
+    def __init__(self):
+        self._queues = {}
+
+    async def publish(self, channel: str, messages: list):
+        for queue in self._queues.get(channel, []):
+            for message in messages:
+                queue.put_nowait(message)
+
+    async def subscribe(self, channel: str):
+        """Регистрирует подписчика и возвращает асинхронный итератор сообщений."""
+        queue = asyncio.Queue()
+        self._queues.setdefault(channel, []).append(queue)
+        return self._messages(channel, queue)
+
+    async def _messages(self, channel: str, queue: asyncio.Queue):
+        try:
+            while True:
+                yield await queue.get()
+        finally:
+            self._queues[channel].remove(queue)
+
+    async def close(self):
+        pass
+
+
+class RedisBus:
+    """Redis pub/sub: доставка без гарантий, потерянное после разрыва добирается сверкой с БД."""
+    def __init__(self, url: str):
+        import redis.asyncio as redis
+        self.client = redis.from_url(url)
+
+    async def publish(self, channel: str, messages: list):
+        async with self.client.pipeline(transaction=False) as pipe:
+            for message in messages:
+                pipe.publish(channel, message)
+            await pipe.execute()
+
+    async def subscribe(self, channel: str):
+        """Подписывается и возвращает асинхронный итератор сообщений."""
+        pubsub = self.client.pubsub()
+        await pubsub.subscribe(channel)
+        return self._messages(pubsub)
+
+    async def _messages(self, pubsub):
+        try:
+            async for message in pubsub.listen():
+                if message['type'] == 'message':
+                    yield message['data']
+        finally:
+            await pubsub.aclose()
+
+    async def close(self):
+        await self.client.aclose()
+
+
+_loopback = LoopbackBus()
+
+
+def make_bus(url: str = BUS_URL):
+    """Шина по адресу или None, если шина не настроена."""
+    if not url:
+        return None
+    if url.startswith("loopback://"):
+        return _loopback
+    if url.startswith(("redis://", "rediss://")):
+        return RedisBus(url)
+    raise ValueError(f"Неизвестная шина {url}")
+
+
+async def listen_candles(bus, on_candles, on_state=None, channel: str = CANDLES_CHANNEL):
+    """
+    Бесконечно слушает закрытые свечи и отдает их в on_candles(list[dict]).
+    on_state(True/False) сообщает о подключении и разрыве; после разрыва переподключается с backoff.
+    """
+    attempt = 0
+    while True:
+        try:
+            messages = await bus.subscribe(channel)
+            if on_state:
+                on_state(True)
+            logger.info(f"Шина: подписка на {channel}")
+            attempt = 0
+            async for message in messages:
+                on_candles([decode_candle(message)])
+            reason = "подписка закрыта"
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            reason = str(e) or type(e).__name__
+
+        if on_state:
+            on_state(False)
+        delay = random.uniform(0, min(30.0, 2 ** attempt))
+        attempt += 1
+        logger.warning(f"Шина: {reason}. Повтор через {delay:.1f} сек")
+        await asyncio.sleep(delay)
+
+
+class CandleListener:
+    """
+    Подписка на шину в фоновом потоке для синхронного кода (бот).
+    wait(ticker, timeout) возвращает True, как только пришла новая закрытая свеча тикера.
+    connected - реальное состояние подписки (по on_state), а не наличие BUS_URL.
+    """
+    def __init__(self, bus_url: str = BUS_URL, on_candles=None, on_state=None):
+        self.bus_url = bus_url
+        self.on_candles = on_candles
+        self.on_state = on_state
+        self._events = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self._connected = threading.Event()
+
+    @property
+    def connected(self) -> bool:
+        return self._connected.is_set()
+
+    def _state(self, live: bool):
+        if live:
+            self._connected.set()
+        else:
+            self._connected.clear()
+        if self.on_state:
+            self.on_state(live)
+
+    def _event(self, ticker: str) -> threading.Event:
+        with self._lock:
+            return self._events.setdefault(ticker, threading.Event())
+
+    def _handle(self, candles: list):
+        if self.on_candles:
+            self.on_candles(candles)
+        for ticker in {c['ticker'] for c in candles}:
+            self._event(ticker).set()
+
+    def start(self) -> bool:
+        """Запускает поток; False, если шина не настроена. Подписка поднимается асинхронно, см. connected."""
+        bus = make_bus(self.bus_url)
+        if bus is None:
+            return False
+        self._thread = threading.Thread(
+            target=lambda: asyncio.run(listen_candles(bus, self._handle, self._state)), name="candle-listener", daemon=True
+        )
+        self._thread.start()
+        return True
+
+    def wait(self, ticker: str, timeout: float) -> bool:
+        event = self._event(ticker)
+        fired = event.wait(timeout)
+        event.clear()
+        return fired
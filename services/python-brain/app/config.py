@@ -8,6 +8,7 @@ load_dotenv()
 
 BASE_DIR = Path(__file__).parent.parent 
 DATA_DIR = BASE_DIR / "models"
+ARCHIVE_DIR = Path(os.getenv("ARCHIVE_DIR", BASE_DIR / "archive"))
 
 
 DATABASE_URL = os.getenv(
@@ -17,6 +18,34 @@ DATABASE_URL = os.getenv(
 
 TOKEN = os.getenv("T_BANK_TOKEN")
 
+# Размер пачки для массовой записи свечей (коммит после каждой пачки)
+BULK_CHUNK_SIZE = int(os.getenv("BULK_CHUNK_SIZE", "5000"))
+# С какого объема Postgres пишется через COPY во временную таблицу
+COPY_THRESHOLD = int(os.getenv("COPY_THRESHOLD", "20000"))
+# Лимит запросов к API брокера (MarketDataService: 600 запросов в минуту) и допустимый всплеск
+API_RATE_PER_MIN = int(os.getenv("API_RATE_PER_MIN", "600"))
+API_BURST = int(os.getenv("API_BURST", "20"))
+# Сколько секунд запись справочника инструментов считается свежей
+INSTRUMENTS_TTL = int(os.getenv("INSTRUMENTS_TTL", str(24 * 3600)))
+# Шина событий: redis://... или loopback:// (в пределах процесса); пусто - шины нет
+BUS_URL = os.getenv("BUS_URL", os.getenv("REDIS_URL", ""))
+# Как часто кэш с живой шиной все равно сверяется с БД (на случай потерянных сообщений)
+CACHE_RESYNC_SECONDS = int(os.getenv("CACHE_RESYNC_SECONDS", "300"))
+# Бэкенд вычислительных ядер (app.kernels): auto - numba, если установлена, иначе numpy
+KERNELS_BACKEND = os.getenv("KERNELS_BACKEND", "auto")
+# Микро-пачки прогнозов: сколько запросов собирать в один прогон модели и сколько ждать (мс)
+PREDICT_MAX_BATCH = int(os.getenv("PREDICT_MAX_BATCH", "64"))
+PREDICT_MAX_WAIT_MS = float(os.getenv("PREDICT_MAX_WAIT_MS", "5"))
+# Сколько секунд запрос прогноза ждет своей пачки, прежде чем сдаться
+PREDICT_TIMEOUT_SECONDS = float(os.getenv("PREDICT_TIMEOUT_SECONDS", "10"))
+# Бэкенд инференса модели (app.ml.runtime): eager, torchscript или onnx; MODEL_INT8=1 - int8-вариант
+MODEL_BACKEND = os.getenv("MODEL_BACKEND", "eager")
+MODEL_INT8 = os.getenv("MODEL_INT8", "0") == "1"
+# Праздники MOEX (YYYY-MM-DD через запятую): в эти будни поиск дыр сессию не ждет
+MOEX_HOLIDAYS = [d.strip() for d in os.getenv("MOEX_HOLIDAYS", "").split(",") if d.strip()]
+# Бюджет памяти кэша свечей в байтах
+CANDLE_CACHE_BYTES = int(os.getenv("CANDLE_CACHE_BYTES", str(512 * 1024 * 1024)))
+
 logging.basicConfig(
     format="%(asctime)s [%(levelname)s] %(name)s: %(message)s",
     level=logging.INFO
@@ -0,0 +1,132 @@
+"""
+Поиск дыр в минутной истории.
+
+Ожидаемые минуты берутся из календаря основной сессии MOEX (10:00-18:40 МСК,
+07:00-15:40 UTC) для всех будних дней запрошенного диапазона, так что целиком
+пропавшие дни тоже видны как дыры. Праздники задаются в MOEX_HOLIDAYS; без start
+диапазон начинается с первого дня истории. Короткие пропуски (меньше min_gap
+минут) - это обычно минуты без сделок, их не трогаем.
+
+    python -m app.gaps scan [--ticker SBER] [--days 30]
+    python -m app.gaps repair [--ticker SBER] [--days 30]
+"""
+import argparse
+import asyncio
+
+import numpy as np
+import pandas as pd
+
+from .config import MOEX_HOLIDAYS, logger
+from .storage import list_tickers
+from .archive import load_archived_history
+
+SESSION_OPEN = pd.Timedelta(hours=7)
+SESSION_CLOSE = pd.Timedelta(hours=15, minutes=40)
+MIN_GAP_MINUTES = 5
+
+_SESSION_OFFSETS = np.arange(
+    SESSION_OPEN // pd.Timedelta(minutes=1), SESSION_CLOSE // pd.Timedelta(minutes=1)
+).astype('timedelta64[m]')
+
+
+def _to_minutes(ts) -> np.datetime64:
+    ts = pd.Timestamp(ts)
+    if ts.tzinfo is not None:
+        ts = ts.tz_convert('UTC').tz_localize(None)
+    return np.datetime64(ts, 'm')
+
+
+def session_calendar(days: np.ndarray) -> np.ndarray:
+    """Все минуты основной сессии для дней (datetime64[D]) одним массивом datetime64[m]."""
+    days = np.asarray(days, dtype='datetime64[D]').astype('datetime64[m]')
+    return (days[:, None] + _SESSION_OFFSETS[None, :]).ravel()
+
+
+def trading_days(lower: np.datetime64, upper: np.datetime64, holidays=MOEX_HOLIDAYS) -> np.ndarray:
+    """Будние дни (без праздников), задевающие минуты [lower, upper)."""
+    days = np.arange(lower.astype('datetime64[D]'), (upper - 1).astype('datetime64[D]') + 1, dtype='datetime64[D]')
+    return days[np.is_busday(days, holidays=holidays)]
+
+
+def _runs(missing: np.ndarray):
+    """Режет отсортированные пропущенные минуты на непрерывные отрезки: (начала, концы)."""
+    breaks = np.flatnonzero(np.diff(missing.astype(np.int64)) != 1) + 1
+    starts = missing[np.r_[0, breaks]]
+    ends = missing[np.r_[breaks - 1, len(missing) - 1]]
+    return starts, ends
+
+
+def find_gaps(ticker: str, start=None, end=None, min_gap: int = MIN_GAP_MINUTES) -> dict:
+    """
+    Сравнивает минутки тикера с календарем сессий на [start, end] и возвращает покрытие и дыры:
+    {'ticker', 'expected', 'present', 'coverage', 'gaps': [{'start', 'end', 'minutes'}]}.
+    start по умолчанию - начало первого дня истории; end - текущая минута
+    (она еще не закрыта и дырой не считается).
+    """
+    df = load_archived_history(ticker, start=start, end=end, columns=['time'])
+    report = {'ticker': ticker, 'expected': 0, 'present': 0, 'coverage': None, 'gaps': []}
+    if df.empty and start is None:
+        return report
+
+    times = pd.to_datetime(df['time'], utc=True).dt.tz_localize(None).values.astype('datetime64[m]')
+    if start is not None:
+        lower = _to_minutes(start)
+    else:
+        lower = times.min().astype('datetime64[D]').astype('datetime64[m]')
+    upper = _to_minutes(end) + 1 if end is not None else _to_minutes(pd.Timestamp.now(tz='UTC'))
+    if upper <= lower:
+        return report
+
+    expected = session_calendar(trading_days(lower, upper))
+    expected = expected[(expected >= lower) & (expected < upper)]
+
+    missing = expected[~np.isin(expected, times)]
+    report['expected'] = int(len(expected))
+    report['present'] = int(len(expected) - len(missing))
+    report['coverage'] = round(report['present'] / len(expected), 6) if len(expected) else None
+
+    if len(missing):
+        starts, ends = _runs(missing)
+        lengths = (ends - starts).astype(np.int64) + 1
+        keep = lengths >= min_gap
+        report['gaps'] = [
+            {'start': pd.Timestamp(s).tz_localize('UTC'), 'end': pd.Timestamp(e).tz_localize('UTC'), 'minutes': int(n)}
+            for s, e, n in zip(starts[keep], ends[keep], lengths[keep])
+        ]
+    return report
+
+
+def scan_gaps(tickers: list = None, start=None, end=None, min_gap: int = MIN_GAP_MINUTES) -> dict:
+    """find_gaps для списка тикеров (по умолчанию всех, что есть в БД)."""
+    result = {}
+    for ticker in tickers or list_tickers():
+        report = find_gaps(ticker, start, end, min_gap)
+        logger.info(
+            f"{ticker}: покрытие {report['coverage']}, дыр {len(report['gaps'])} "
+            f"({sum(g['minutes'] for g in report['gaps'])} мин)"
+        )
+        result[ticker] = report
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Поиск и починка дыр в минутной истории")
+    parser.add_argument("command", choices=["scan", "repair"])
+    parser.add_argument("--ticker", default=None)
+    parser.add_argument("--days", type=int, default=None, help="Глубина проверки в днях (по умолчанию вся история)")
+    parser.add_argument("--min-gap", type=int, default=MIN_GAP_MINUTES)
+    args = parser.parse_args()
+
+    tickers = [args.ticker] if args.ticker else None
+    if args.command == "scan":
+        start = pd.Timestamp.now(tz='UTC') - pd.Timedelta(days=args.days) if args.days else None
+        for report in scan_gaps(tickers, start=start, min_gap=args.min_gap).values():
+            for gap in report['gaps']:
+                print(f"{report['ticker']}: {gap['start']} - {gap['end']} ({gap['minutes']} мин)")
+    else:
+        from .loader import repair_gaps
+        asyncio.run(repair_gaps(tickers, days_back=args.days, min_gap=args.min_gap))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+"""
+Реестр инструментов: (тикер, режим торгов) -> UID, лот, шаг цены.
+
+Справочник лежит в таблице instruments и держится в памяти процесса.
+Недостающие и устаревшие (старше INSTRUMENTS_TTL) записи подтягиваются
+одним запросом на весь список тикеров вместо find_instrument на каждый:
+shares(), etfs(), bonds(), futures() или currencies() - по режиму торгов.
+Что не нашлось в списке (или список не скачался), ищется через find_instrument.
+"""
+import threading
+from datetime import datetime, timedelta, timezone
+
+from t_tech.invest.utils import quotation_to_decimal
+
+from .config import INSTRUMENTS_TTL, logger
+from .storage import load_instruments, save_instruments
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+# режим торгов -> метод InstrumentsService, отдающий все инструменты этого типа
+CATALOGS = {
+    'TQBR': 'shares',
+    'TQTF': 'etfs',
+    'TQOB': 'bonds',
+    'TQCB': 'bonds',
+    'TQIR': 'bonds',
+    'SPBFUT': 'futures',
+    'CETS': 'currencies',
+}
+
+
+def catalog_for(class_code: str) -> str:
+    return CATALOGS.get(class_code, 'shares')
+
+
+def matching(instruments, ticker: str, class_code: str) -> list:
+    """Результаты find_instrument, совпадающие с тикером и режимом торгов."""
+    return [item for item in instruments if item.ticker == ticker and item.class_code == class_code]
+
+
+def _instrument_to_row(item, updated_at) -> dict:
+    # у find_instrument (InstrumentShort) нет лота и шага цены
+    increment = getattr(item, 'min_price_increment', None)
+    return {
+        'ticker': item.ticker,
+        'class_code': item.class_code,
+        'uid': item.uid,
+        'figi': getattr(item, 'figi', None),
+        'name': item.name,
+        'lot': getattr(item, 'lot', None),
+        'min_price_increment': float(quotation_to_decimal(increment)) if increment is not None else None,
+        'updated_at': updated_at
+    }
+
+
+class InstrumentRegistry:
+    """
+    Справочник в памяти поверх таблицы instruments.
+    Таблица читается один раз при первом обращении, дальше API трогается только
+    когда нужного тикера нет или его запись старше ttl.
+    """
+    def __init__(self, ttl: int = INSTRUMENTS_TTL):
+        self.ttl = timedelta(seconds=ttl)
+        self._items = {}
+        self._loaded = False
+        self._refreshed_at = {}  # метод-справочник -> когда его список целиком обновлялся
+        self._lock = threading.Lock()
+
+    def _ensure_loaded(self):
+        if not self._loaded:
+            self._items = {(r['ticker'], r['class_code']): r for r in load_instruments()}
+            self._loaded = True
+            logger.info(f"Справочник инструментов: загружено {len(self._items)} записей из БД")
+
+    def _is_fresh(self, item) -> bool:
+        return bool(item and item.get('updated_at') and _utcnow() - item['updated_at'] < self.ttl)
+
+    def missing(self, tickers: list, class_code: str = 'TQBR') -> list:
+        """
+        Тикеры, которых нет в справочнике или чья запись устарела.
+        Если полный список этого типа только что обновлялся, неизвестный тикер повторного запроса не вызывает.
+        """
+        with self._lock:
+            self._ensure_loaded()
+            refreshed_at = self._refreshed_at.get(catalog_for(class_code))
+            if refreshed_at and _utcnow() - refreshed_at < self.ttl:
+                return []
+            return [t for t in tickers if not self._is_fresh(self._items.get((t, class_code)))]
+
+    def unknown(self, tickers: list, class_code: str = 'TQBR') -> list:
+        """Тикеры, которых в справочнике нет совсем (даже устаревшей записи)."""
+        with self._lock:
+            return [t for t in tickers if (t, class_code) not in self._items]
+
+    def update(self, instruments, catalog: str = None) -> int:
+        """
+        Сохраняет инструменты (ответ shares()/bonds()/... или find_instrument) в таблицу и в память.
+        catalog - метод, которым скачан полный список; для find_instrument не передается.
+        Возвращает число записей.
+        """
+        updated_at = _utcnow()
+        rows = [_instrument_to_row(item, updated_at) for item in instruments]
+        if not rows and not catalog:
+            return 0
+        save_instruments(rows)
+        with self._lock:
+            self._items.update({(r['ticker'], r['class_code']): r for r in rows})
+            if catalog:
+                self._refreshed_at[catalog] = updated_at
+        logger.info(f"Справочник инструментов обновлен: {len(rows)} записей")
+        return len(rows)
+
+    def lookup(self, tickers: list, class_code: str = 'TQBR') -> dict:
+        """{ticker: запись} по тому, что уже есть в справочнике (устаревшие записи тоже годятся)."""
+        with self._lock:
+            self._ensure_loaded()
+            found = {t: self._items[(t, class_code)] for t in tickers if (t, class_code) in self._items}
+        for ticker in tickers:
+            if ticker not in found:
+                logger.error(f"Инструмент {ticker} не найден в режиме {class_code}")
+        return found
+
+    def resolve_many(self, client, tickers: list, class_code: str = 'TQBR') -> dict:
+        """
+        Разрешает весь список за один запрос к API (и ни одного, если справочник свежий).
+        Чего нет в списке нужного типа, ищется через find_instrument по одному.
+        При ошибке API используются устаревшие записи, если они есть.
+        """
+        if self.missing(tickers, class_code):
+            catalog = catalog_for(class_code)
+            try:
+                self.update(getattr(client.instruments, catalog)().instruments, catalog)
+            except Exception as e:
+                logger.error(f"Ошибка обновления справочника инструментов ({catalog}): {e}")
+            for ticker in self.unknown(tickers, class_code):
+                try:
+                    self.update(matching(client.instruments.find_instrument(query=ticker).instruments, ticker, class_code))
+                except Exception as e:
+                    logger.error(f"Ошибка поиска инструмента {ticker}: {e}")
+        return self.lookup(tickers, class_code)
+
+    def get_uid(self, client, ticker: str, class_code: str = 'TQBR'):
+        item = self.resolve_many(client, [ticker], class_code).get(ticker)
+        return item['uid'] if item else None
+
+    def invalidate(self):
+        """Сбрасывает память: следующее обращение заново прочитает таблицу."""
+        with self._lock:
+            self._items = {}
+            self._loaded = False
+            self._refreshed_at = {}
+
+
+registry = InstrumentRegistry()
@@ -0,0 +1,39 @@
+"""
+Вычислительные ядра физики и признаков: квантильные корзины и средние в них, МНК,
+остатки и z-score, признаки модели.
+
+Две реализации с одинаковыми сигнатурами: numba_backend (если numba установлена)
+и numpy_backend. Бэкенд выбирается один раз при импорте по KERNELS_BACKEND:
+auto (numba, если есть), numba или numpy.
+"""
+import importlib
+
+from ..config import KERNELS_BACKEND, logger
+
+
+def load_backend(name: str):
+    """Модуль бэкенда по имени; ImportError, если для него нет зависимостей."""
+    return importlib.import_module(f"{__name__}.{name}_backend")
+
+
+def _select_backend():
+    if KERNELS_BACKEND not in ("auto", "numba", "numpy"):
+        raise ValueError(f"Неизвестный KERNELS_BACKEND={KERNELS_BACKEND}, доступны: auto, numba, numpy")
+    if KERNELS_BACKEND != "numpy":
+        try:
+            return load_backend("numba")
+        except ImportError:
+            if KERNELS_BACKEND == "numba":
+                logger.warning("KERNELS_BACKEND=numba, но numba не установлена: ядра на NumPy")
+    return load_backend("numpy")
+
+
+backend = _select_backend()
+BACKEND = backend.NAME
+
+binned_means = backend.binned_means
+least_squares = backend.least_squares
+smart_fit = backend.smart_fit
+residuals = backend.residuals
+zscores = backend.zscores
+market_features = backend.market_features
@@ -0,0 +1,146 @@
+"""
+Ядра на numba: те же сигнатуры, что в numpy_backend, но построчные циклы
+компилируются в машинный код. cache=True кладет скомпилированное на диск
+(__pycache__ или NUMBA_CACHE_DIR), поэтому компиляция - только при первом запуске.
+"""
+import numpy as np
+from numba import njit
+
+NAME = "numba"
+
+# error_model='numpy': деление на ноль дает inf/NaN, как в NumPy, а не исключение
+_jit = njit(cache=True, error_model='numpy', nogil=True)
+
+
+@_jit
+def _sorted_bins(ordered, ordered_i, count, q):
+    """Границы, численности и суммы логарифмов по строкам, уже отсортированным по объему."""
+    batch = ordered.shape[0]
+    bins = len(q) - 1
+    edges = np.full((batch, bins + 1), np.nan)
+    counts = np.zeros((batch, bins), dtype=np.int64)
+    sum_q = np.zeros((batch, bins))
+    sum_i = np.zeros((batch, bins))
+
+    for r in range(batch):
+        m = count[r]
+        if m == 0:
+            continue
+        last = m - 1
+        for k in range(bins + 1):
+            pos = q[k] * last
+            lo = int(np.floor(pos))
+            t = pos - lo
+            a = ordered[r, lo]
+            b = ordered[r, min(lo + 1, last)]
+            edges[r, k] = b - (b - a) * (1 - t) if t >= 0.5 else a + (b - a) * t
+
+        # повторяющиеся нижние границы: минимум попадает в первую непустую корзину, как у qcut
+        target = 0
+        for k in range(1, bins):
+            if edges[r, k] == edges[r, 0]:
+                target += 1
+        # корзина (edges[j], edges[j + 1]]: один проход по отсортированной строке
+        for p in range(m):
+            while target < bins - 1 and ordered[r, p] > edges[r, target + 1]:
+                target += 1
+            counts[r, target] += 1
+            sum_q[r, target] += np.log(ordered[r, p])
+            sum_i[r, target] += np.log(ordered_i[r, p])
+
+    return edges, counts, sum_q / counts, sum_i / counts
+
+
+def binned_means(volume, volatility, q):
+    # сортировку оставляем NumPy: векторный argsort заметно быстрее np.sort внутри numba
+    valid = (volatility > 0) & ~np.isnan(volume)
+    order = np.argsort(np.where(valid, volume, np.inf), axis=1)
+    ordered = np.take_along_axis(volume, order, axis=1)
+    ordered_i = np.take_along_axis(volatility, order, axis=1)
+    return _sorted_bins(ordered, ordered_i, valid.sum(axis=1), q)
+
+
+@_jit
+def least_squares(x, y):
+    batch, width = x.shape
+    slope = np.empty(batch)
+    intercept = np.empty(batch)
+    r2 = np.empty(batch)
+    for r in range(batch):
+        n = 0
+        sx = 0.0
+        sy = 0.0
+        for j in range(width):
+            if not np.isnan(x[r, j]) and not np.isnan(y[r, j]):
+                n += 1
+                sx += x[r, j]
+                sy += y[r, j]
+        mean_x = sx / n
+        mean_y = sy / n
+        sxx = 0.0
+        syy = 0.0
+        sxy = 0.0
+        for j in range(width):
+            if not np.isnan(x[r, j]) and not np.isnan(y[r, j]):
+                dx = x[r, j] - mean_x
+                dy = y[r, j] - mean_y
+                sxx += dx * dx
+                syy += dy * dy
+                sxy += dx * dy
+        slope[r] = sxy / sxx
+        intercept[r] = mean_y - slope[r] * mean_x
+        fit = sxy * sxy / (sxx * syy)
+        r2[r] = 1.0 if fit > 1.0 else (0.0 if fit < 0.0 else fit)
+    return slope, intercept, r2
+
+
+@_jit
+def smart_fit(log_q, log_i):
+    batch, bins = log_q.shape
+    smart = np.zeros((batch, bins), dtype=np.bool_)
+    x = np.full((batch, bins), np.nan)
+    y = np.full((batch, bins), np.nan)
+    for r in range(batch):
+        filled = log_q[r][~np.isnan(log_q[r])]
+        if len(filled) == 0:
+            continue
+        median = np.median(filled)
+        for j in range(bins):
+            if log_q[r, j] > median:
+                smart[r, j] = True
+                x[r, j] = log_q[r, j]
+                y[r, j] = log_i[r, j]
+    alpha, intercept, r2 = least_squares(x, y)
+    return alpha, intercept, r2, smart, smart.sum(axis=1)
+
+
+@_jit
+def residuals(volume, volatility, slope, intercept):
+    out = np.empty(len(volume))
+    for j in range(len(volume)):
+        if volume[j] > 0 and volatility[j] > 0:
+            out[j] = np.log(volatility[j]) - (slope * np.log(volume[j]) + intercept)
+        else:
+            out[j] = np.nan
+    return out
+
+
+@_jit
+def zscores(volume, volatility, slope, intercept, std):
+    return residuals(volume, volatility, slope, intercept) / std
+
+
+@_jit
+def market_features(close, volume, high, low):
+    n = len(close)
+    log_ret = np.zeros(n)
+    log_vol = np.empty(n)
+    volatility = np.empty(n)
+    for j in range(n):
+        if j > 0:
+            value = np.log(close[j] / close[j - 1])
+            log_ret[j] = 0.0 if np.isnan(value) else value
+        value = np.log(volume[j] + 1)
+        log_vol[j] = 0.0 if np.isnan(value) else value
+        volatility[j] = high[j] - low[j]
+    return log_ret, log_vol, volatility
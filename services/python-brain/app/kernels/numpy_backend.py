@@ -0,0 +1,124 @@
+"""Ядра на чистом NumPy: работают везде, строки пачки обрабатываются векторно."""
+import numpy as np
+
+NAME = "numpy"
+
+
+def _row_quantiles(ordered, count, q):
+    """
+    np.quantile(method='linear') по первым count значениям каждой строки уже отсортированной
+    пачки: одна сортировка на всю пачку вместо построчного nanquantile.
+    """
+    last = np.maximum(count - 1, 0)[:, None]
+    pos = q[None, :] * last
+    lo = np.floor(pos).astype(np.intp)
+    t = pos - lo
+    a = np.take_along_axis(ordered, lo, axis=1)
+    b = np.take_along_axis(ordered, np.minimum(lo + 1, last), axis=1)
+    # та же формула интерполяции, что в numpy
+    return np.where(t >= 0.5, b - (b - a) * (1 - t), a + (b - a) * t)
+
+
+def _bin_starts(ordered, count, edges):
+    """
+    Начало каждой корзины (edges[j], edges[j + 1]] в отсортированной строке.
+    Повторяющиеся границы дают пустые корзины, минимум попадает в первую непустую,
+    как include_lowest у qcut.
+    """
+    batch, bins = edges.shape[0], edges.shape[1] - 1
+    starts = np.zeros((batch, bins), dtype=np.intp)
+    for r in range(batch):
+        starts[r, 1:] = np.searchsorted(ordered[r, :count[r]], edges[r, 1:-1], side='right')
+    lowest = np.minimum((edges[:, 1:] == edges[:, :1]).sum(axis=1), bins - 1)
+    return np.where(np.arange(bins)[None, :] <= lowest[:, None], 0, starts)
+
+
+def _bin_sums(values, starts, ends):
+    """
+    Суммы values по отрезкам [starts, ends) каждой строки через накопленную сумму.
+    -inf (log нулевого объема) в накопленную сумму не идет, иначе все корзины правее
+    получили бы -inf - -inf = NaN: такие корзины считаются отдельно, как у groupby.mean.
+    """
+    def segment(cumulative_of):
+        cumulative = np.zeros((values.shape[0], values.shape[1] + 1))
+        np.cumsum(cumulative_of, axis=1, out=cumulative[:, 1:])
+        return np.take_along_axis(cumulative, ends, axis=1) - np.take_along_axis(cumulative, starts, axis=1)
+
+    negative_inf = values == -np.inf
+    sums = segment(np.where(negative_inf, 0.0, values))
+    return np.where(segment(negative_inf) > 0, -np.inf, sums)
+
+
+def binned_means(volume, volatility, q):
+    """
+    Квантильные корзины объема по каждой строке (volume, volatility - (batch, n)) и средние
+    log Q, log I в них. Точки с NaN или volatility <= 0 не учитываются.
+    Возвращает edges (batch, len(q)), counts, log_q, log_i (batch, len(q) - 1; NaN - пустая корзина).
+    """
+    valid = (volatility > 0) & ~np.isnan(volume)
+    count = valid.sum(axis=1)
+
+    # сортировка по объему; выброшенные точки уходят в хвост строки и в суммы не попадают
+    # (inf, а не NaN: с NaN argsort теряет быстрый путь)
+    order = np.argsort(np.where(valid, volume, np.inf), axis=1)
+    ordered = np.take_along_axis(volume, order, axis=1)
+    edges = _row_quantiles(ordered, count, q)
+
+    # в отсортированной строке корзина - непрерывный отрезок [starts, ends)
+    starts = _bin_starts(ordered, count, edges)
+    ends = np.concatenate([starts[:, 1:], count[:, None]], axis=1)
+    counts = ends - starts
+    log_q = _bin_sums(np.log(ordered), starts, ends) / counts
+    log_i = _bin_sums(np.log(np.take_along_axis(volatility, order, axis=1)), starts, ends) / counts
+    return edges, counts, log_q, log_i
+
+
+def least_squares(x, y):
+    """МНК y = slope * x + intercept по каждой строке; NaN в x или y выбрасываются. -> slope, intercept, r2."""
+    mask = ~np.isnan(x) & ~np.isnan(y)
+    n = mask.sum(axis=1)
+    xs = np.where(mask, x, 0.0)
+    ys = np.where(mask, y, 0.0)
+    mean_x = xs.sum(axis=1) / n
+    mean_y = ys.sum(axis=1) / n
+    dx = np.where(mask, xs - mean_x[:, None], 0.0)
+    dy = np.where(mask, ys - mean_y[:, None], 0.0)
+    sxx, syy, sxy = (dx * dx).sum(axis=1), (dy * dy).sum(axis=1), (dx * dy).sum(axis=1)
+
+    slope = sxy / sxx
+    return slope, mean_y - slope * mean_x, np.clip(sxy * sxy / (sxx * syy), 0.0, 1.0)
+
+
+def smart_fit(log_q, log_i):
+    """
+    Регрессия по корзинам выше медианы log Q (smart money) по каждой строке.
+    -> alpha, intercept, r2, smart (маска корзин), n (число корзин в регрессии).
+    """
+    smart = log_q > np.nanmedian(log_q, axis=1)[:, None]
+    alpha, intercept, r2 = least_squares(np.where(smart, log_q, np.nan), np.where(smart, log_i, np.nan))
+    return alpha, intercept, r2, smart, smart.sum(axis=1)
+
+
+def residuals(volume, volatility, slope, intercept):
+    """log I - (slope * log Q + intercept); NaN там, где объем или волатильность не положительны."""
+    valid = (volume > 0) & (volatility > 0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        residual = np.log(volatility) - (slope * np.log(volume) + intercept)
+    return np.where(valid, residual, np.nan)
+
+
+def zscores(volume, volatility, slope, intercept, std):
+    return residuals(volume, volatility, slope, intercept) / std
+
+
+def market_features(close, volume, high, low):
+    """
+    Признаки модели: log-доходность (первая и неопределенные - 0), log(volume + 1)
+    (неопределенные - 0) и волатильность high - low.
+    """
+    log_ret = np.zeros(len(close))
+    log_ret[1:] = np.log(close[1:] / close[:-1])
+    log_vol = np.log(volume + 1)
+    log_ret[np.isnan(log_ret)] = 0.0
+    log_vol[np.isnan(log_vol)] = 0.0
+    return log_ret, log_vol, high - low
@@ -1,39 +1,55 @@
 import time
-import logging
+import random
+import asyncio
+import pandas as pd
 from datetime import timedelta, timezone
-from t_tech.invest import Client, CandleInterval
+from t_tech.invest import Client, AsyncClient, CandleInterval
 from t_tech.invest.utils import now, quotation_to_decimal
-from t_tech.invest.exceptions import RequestError
+from t_tech.invest.exceptions import RequestError, AioRequestError
 
-from .config import TOKEN, logger
-from .storage import save_candles_to_db, get_last_candle_time, init_db
+from .config import TOKEN, API_RATE_PER_MIN, API_BURST, BULK_CHUNK_SIZE, logger
+from .storage import (
+    save_candles_to_db, get_last_candle_time, init_db,
+    get_checkpoint, save_checkpoint, clear_checkpoint, list_tickers, candle_cache
+)
+from .aggregates import update_aggregates
+from .instruments import registry, catalog_for, matching
+from .gaps import find_gaps, MIN_GAP_MINUTES
+from .archive import archived_days, patch_day
 
 init_db()
 
 def get_instrument_uid(client, ticker, class_code='TQBR'):
-    """Находит UID инструмента по тикеру."""
-    try:
-        instruments = client.instruments.find_instrument(query=ticker).instruments
-        for item in instruments:
-            if item.ticker == ticker and item.class_code == class_code:
-                logger.info(f"Инструмент найден: {item.name} (UID: {item.uid})")
-                return item.uid
-        logger.error(f"Инструмент {ticker} не найден в режиме {class_code}")
-        return None
-    except Exception as e:
-        logger.error(f"Ошибка поиска инструмента: {e}")
-        return None
+    """Находит UID инструмента по тикеру через справочник инструментов."""
+    uid = registry.get_uid(client, ticker, class_code)
+    if uid:
+        logger.info(f"Инструмент найден: {ticker} (UID: {uid})")
+    return uid
+
+def _candle_to_row(ticker, candle):
+    return {
+        'ticker': ticker, 
+        'time': candle.time,
+        'open': float(quotation_to_decimal(candle.open)),
+        'close': float(quotation_to_decimal(candle.close)),
+        'high': float(quotation_to_decimal(candle.high)),
+        'low': float(quotation_to_decimal(candle.low)),
+        'volume': candle.volume
+    }
+
 
-def download_data(ticker, days_back=60, class_code='TQBR'):
+def _download_start(ticker, days_back, current_time):
     """
-    Скачивает свечи с механизмом повторных попыток (Retry) и сохраняет в БД.
+    С какого момента качать: с чекпоинта прерванной докачки, после последней свечи в БД или days_back назад.
+    Возвращает (start_time, уже записано строк); start_time=None - данные актуальны.
     """
-    if not TOKEN:
-        logger.error("Нет токена. Прерывание.")
-        return
-    
+    checkpoint = get_checkpoint(ticker)
+    if checkpoint:
+        start_time = checkpoint.last_time.replace(tzinfo=timezone.utc)
+        logger.info(f"{ticker}: Продолжаем прерванную докачку с {start_time} (уже записано {checkpoint.rows_written})")
+        return start_time, checkpoint.rows_written or 0
+
     last_time = get_last_candle_time(ticker)
-    current_time = now()
     
     if last_time:
         if last_time.tzinfo is None:
@@ -47,47 +63,333 @@ def download_data(ticker, days_back=60, class_code='TQBR'):
 
     if (current_time - start_time).total_seconds() < 60:
         logger.info(f"zzz {ticker}: Данные актуальны.")
-        return
+        return None, 0
+    return start_time, 0
+
+
+def _day_windows(start_time, end_time):
+    """Режет период на окна по суткам: GetCandles отдает минутки не больше чем за день."""
+    while start_time < end_time:
+        window_end = min(start_time + timedelta(days=1), end_time)
+        yield start_time, window_end
+        start_time = window_end
+
+
+def _backoff_delay(attempt, base_delay=1.0, max_delay=30.0):
+    """Экспоненциальная задержка с full jitter."""
+    return random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+
+
+def _call_with_retries_sync(call, what, max_retries=5):
+    for attempt in range(max_retries):
+        try:
+            return call()
+        except RequestError as e:
+            if attempt == max_retries - 1:
+                raise
+            delay = _backoff_delay(attempt)
+            logger.warning(f"{what}: ошибка API ({e}). Повтор через {delay:.1f} сек...")
+            time.sleep(delay)
+
+
+def _fetch_windows(client, uid, ticker, start_time, end_time):
+    """Генератор: по одному суточному окну за раз -> (строки свечей, конец окна)."""
+    for from_, to in _day_windows(start_time, end_time):
+        resp = _call_with_retries_sync(
+            lambda: client.market_data.get_candles(
+                instrument_id=uid, from_=from_, to=to,
+                interval=CandleInterval.CANDLE_INTERVAL_1_MIN,
+            ),
+            f"{ticker} {from_:%Y-%m-%d}"
+        )
+        yield [_candle_to_row(ticker, candle) for candle in resp.candles], to
 
-    max_retries = 3
-    attempt = 0
+
+class BackfillWriter:
+    """
+    Пишет скачанные свечи пачками не меньше chunk_size.
+    Пачка закрывается только на границе суточного окна, и после коммита в чекпоинт
+    пишется конец этого окна: перезапуск продолжит ровно с него.
+    progress(ticker, rows_written, fetched_until, target_time) вызывается после каждой пачки.
+    """
+    def __init__(self, ticker, target_time, chunk_size=BULK_CHUNK_SIZE, rows_written=0, progress=None):
+        self.ticker = ticker
+        self.target_time = target_time
+        self.chunk_size = chunk_size
+        self.rows_written = rows_written
+        self.progress = progress
+        self.pending = []
+        self.fetched_until = None
+
+    def add_window(self, rows, window_end):
+        self.pending.extend(rows)
+        self.fetched_until = window_end
+        if len(self.pending) >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        if self.pending:
+            save_candles_to_db(self.pending, raise_errors=True)
+            update_aggregates(self.ticker, self.pending[0]['time'], self.pending[-1]['time'])
+            self.rows_written += len(self.pending)
+            self.pending = []
+
+        if self.fetched_until is not None:
+            save_checkpoint(self.ticker, self.fetched_until, self.target_time, self.rows_written)
+            if self.progress:
+                self.progress(self.ticker, self.rows_written, self.fetched_until, self.target_time)
+
+    def finish(self):
+        """Дописывает хвост и снимает чекпоинт. Возвращает сколько строк записано за всю докачку."""
+        self.flush()
+        clear_checkpoint(self.ticker)
+        return self.rows_written
+
+
+def download_data(ticker, days_back=60, class_code='TQBR', chunk_size=BULK_CHUNK_SIZE, progress=None):
+    """
+    Потоково скачивает свечи (окна по суткам -> пачки по chunk_size -> БД) с повторами на каждом запросе.
+    После каждой пачки сохраняется чекпоинт, прерванная докачка продолжится с него.
+    """
+    if not TOKEN:
+        logger.error("Нет токена. Прерывание.")
+        return
     
-    while attempt < max_retries:
+    current_time = now()
+    start_time, rows_written = _download_start(ticker, days_back, current_time)
+    if start_time is None:
+        return 0
+
+    try:
+        with Client(TOKEN) as client:
+            uid = get_instrument_uid(client, ticker, class_code)
+            if not uid:
+                logger.error(f"Инструмент не найден: {ticker}")
+                return None
+
+            writer = BackfillWriter(ticker, current_time, chunk_size, rows_written, progress)
+            for rows, window_end in _fetch_windows(client, uid, ticker, start_time, current_time):
+                writer.add_window(rows, window_end)
+            saved = writer.finish()
+
+    except RequestError as e:
+        logger.error(f"Не удалось скачать {ticker}: {e}. Прогресс сохранен, продолжим с чекпоинта.")
+        return None
+    except Exception as e:
+        logger.error(f"Критическая ошибка: {e}")
+        return None
+
+    if not saved:
+        logger.info(f"Нет новых данных для {ticker}")
+    return saved
+
+
+class TokenBucket:
+    """
+    Асинхронный token bucket: rate запросов в секунду, всплеск не больше capacity.
+    Один экземпляр делится между всеми задачами, поэтому общий поток укладывается в квоту брокера.
+    """
+    def __init__(self, rate_per_min=API_RATE_PER_MIN, capacity=API_BURST):
+        self.rate = rate_per_min / 60.0
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                current = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (current - self.updated) * self.rate)
+                self.updated = current
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+async def _call_with_retries(call, limiter, what, max_retries=5):
+    """Вызов API под лимитером с экспоненциальной задержкой и full jitter между попытками."""
+    for attempt in range(max_retries):
+        await limiter.acquire()
         try:
-            with Client(TOKEN) as client:
-                uid = get_instrument_uid(client, ticker, class_code)
-                if not uid:
-                    return 
-
-                new_candles = []
-                for candle in client.get_all_candles(
-                    instrument_id=uid,
-                    from_=start_time,
-                    interval=CandleInterval.CANDLE_INTERVAL_1_MIN,
-                ):
-                    new_candles.append({
-                        'ticker': ticker, 
-                        'time': candle.time,
-                        'open': float(quotation_to_decimal(candle.open)),
-                        'close': float(quotation_to_decimal(candle.close)),
-                        'high': float(quotation_to_decimal(candle.high)),
-                        'low': float(quotation_to_decimal(candle.low)),
-                        'volume': candle.volume
-                    })
-
-            if not new_candles:
-                logger.info(f"Нет новых данных для {ticker}")
-                return
-
-            save_candles_to_db(new_candles)
-            return 
+            return await call()
+        except (AioRequestError, RequestError) as e:
+            if attempt == max_retries - 1:
+                raise
+            delay = _backoff_delay(attempt)
+            logger.warning(f"{what}: ошибка API ({e}). Повтор через {delay:.1f} сек...")
+            await asyncio.sleep(delay)
 
-        except RequestError as e:
-            logger.warning(f"Ошибка сети: {e}. Ретрай через 5 сек...")
-            time.sleep(5)
-            attempt += 1
+
+async def _resolve_uids_async(client, limiter, tickers, class_code='TQBR'):
+    """
+    {ticker: uid} для всего списка: один запрос списка инструментов нужного типа, если справочник
+    неполный или устарел, и find_instrument для того, чего в списке не нашлось.
+    """
+    if await asyncio.to_thread(registry.missing, tickers, class_code):
+        catalog = catalog_for(class_code)
+        try:
+            resp = await _call_with_retries(
+                lambda: getattr(client.instruments, catalog)(), limiter, "справочник инструментов"
+            )
+            await asyncio.to_thread(registry.update, resp.instruments, catalog)
         except Exception as e:
-            logger.error(f"Критическая ошибка: {e}")
-            return
+            logger.error(f"Ошибка обновления справочника инструментов ({catalog}): {e}")
+        for ticker in await asyncio.to_thread(registry.unknown, tickers, class_code):
+            try:
+                resp = await _call_with_retries(
+                    lambda: client.instruments.find_instrument(query=ticker), limiter, f"поиск {ticker}"
+                )
+                await asyncio.to_thread(registry.update, matching(resp.instruments, ticker, class_code))
+            except Exception as e:
+                logger.error(f"Ошибка поиска инструмента {ticker}: {e}")
+    found = await asyncio.to_thread(registry.lookup, tickers, class_code)
+    return {ticker: item['uid'] for ticker, item in found.items()}
+
+
+async def _fetch_windows_async(client, limiter, uid, ticker, start_time, end_time):
+    for from_, to in _day_windows(start_time, end_time):
+        resp = await _call_with_retries(
+            lambda: client.market_data.get_candles(
+                instrument_id=uid, from_=from_, to=to,
+                interval=CandleInterval.CANDLE_INTERVAL_1_MIN,
+            ),
+            limiter, f"{ticker} {from_:%Y-%m-%d}"
+        )
+        yield [_candle_to_row(ticker, candle) for candle in resp.candles], to
+
+
+async def _download_ticker_async(client, limiter, ticker, uid, days_back, chunk_size, progress):
+    current_time = now()
+    start_time, rows_written = await asyncio.to_thread(_download_start, ticker, days_back, current_time)
+    if start_time is None:
+        return 0
+
+    writer = BackfillWriter(ticker, current_time, chunk_size, rows_written, progress)
+    async for rows, window_end in _fetch_windows_async(client, limiter, uid, ticker, start_time, current_time):
+        await asyncio.to_thread(writer.add_window, rows, window_end)
+    return await asyncio.to_thread(writer.finish)
+
+
+async def download_many(tickers, days_back=60, concurrency=8, class_code='TQBR',
+                        chunk_size=BULK_CHUNK_SIZE, progress=None):
+    """
+    Параллельная докачка списка тикеров через одно соединение AsyncClient.
+    Все запросы идут через общий token bucket, concurrency ограничивает число тикеров в работе.
+    Запись потоковая, пачками с чекпоинтами, как в download_data.
+    Возвращает {ticker: число сохраненных свечей или None при ошибке}.
+    """
+    if concurrency < 1:
+        raise ValueError(f"concurrency должно быть не меньше 1, получено {concurrency}")
+    if not TOKEN:
+        logger.error("Нет токена. Прерывание.")
+        return {}
+
+    limiter = TokenBucket()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async with AsyncClient(TOKEN) as client:
+        uids = await _resolve_uids_async(client, limiter, tickers, class_code)
+
+        async def worker(ticker):
+            if ticker not in uids:
+                logger.error(f"Инструмент не найден: {ticker}")
+                return ticker, None
+            async with semaphore:
+                try:
+                    return ticker, await _download_ticker_async(
+                        client, limiter, ticker, uids[ticker], days_back, chunk_size, progress
+                    )
+                except Exception as e:
+                    logger.error(f"Не удалось скачать {ticker}: {e}")
+                    return ticker, None
+
+        results = await asyncio.gather(*(worker(t) for t in tickers))
+
+    logger.info(f"Пакетная загрузка завершена: {len(tickers)} тикеров")
+    return dict(results)
+
+
+async def _repair_ticker_async(client, limiter, ticker, uid, start, min_gap):
+    before = await asyncio.to_thread(find_gaps, ticker, start, None, min_gap)
+    filled = 0
+    for gap in before['gaps']:
+        # дыра всегда внутри одной сессии, поэтому хватает одного запроса
+        resp = await _call_with_retries(
+            lambda: client.market_data.get_candles(
+                instrument_id=uid, from_=gap['start'].to_pydatetime(),
+                to=(gap['end'] + pd.Timedelta(minutes=1)).to_pydatetime(),
+                interval=CandleInterval.CANDLE_INTERVAL_1_MIN,
+            ),
+            limiter, f"{ticker} дыра {gap['start']:%Y-%m-%d %H:%M}"
+        )
+        rows = [_candle_to_row(ticker, candle) for candle in resp.candles]
+        if rows:
+            await asyncio.to_thread(_save_repaired, ticker, rows)
+            filled += len(rows)
+
+    if filled:
+        candle_cache.invalidate(ticker)
+    after = await asyncio.to_thread(find_gaps, ticker, start, None, min_gap) if filled else before
+    logger.info(
+        f"{ticker}: дыр {len(before['gaps'])} -> {len(after['gaps'])}, дописано {filled} свечей, "
+        f"покрытие {before['coverage']} -> {after['coverage']}"
+    )
+    return {
+        'gaps_before': len(before['gaps']),
+        'gaps_after': len(after['gaps']),
+        'filled': filled,
+        'coverage_before': before['coverage'],
+        'coverage_after': after['coverage'],
+        'remaining': after['gaps']
+    }
+
+
+def _save_repaired(ticker, rows):
+    save_candles_to_db(rows, raise_errors=True)
+    update_aggregates(ticker, rows[0]['time'], rows[-1]['time'])
+
+    days = set(archived_days(ticker))
+    df = pd.DataFrame(rows)
+    df['time'] = pd.to_datetime(df['time'], utc=True)
+    df['volatility'] = df['high'] - df['low']
+    for day, day_df in df.groupby(df['time'].dt.date):
+        if day in days:
+            patch_day(ticker, day, day_df)
+
+
+async def repair_gaps(tickers=None, days_back=None, concurrency=8, min_gap=MIN_GAP_MINUTES, class_code='TQBR'):
+    """
+    Находит дыры в минутной истории и докачивает только их, по тикерам параллельно.
+    days_back ограничивает глубину проверки (по умолчанию вся история).
+    Возвращает {ticker: отчет о покрытии до и после или None при ошибке}.
+    """
+    if concurrency < 1:
+        raise ValueError(f"concurrency должно быть не меньше 1, получено {concurrency}")
+    if not TOKEN:
+        logger.error("Нет токена. Прерывание.")
+        return {}
+
+    tickers = tickers or await asyncio.to_thread(list_tickers)
+    start = now() - timedelta(days=days_back) if days_back else None
+    limiter = TokenBucket()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async with AsyncClient(TOKEN) as client:
+        uids = await _resolve_uids_async(client, limiter, tickers, class_code)
+
+        async def worker(ticker):
+            if ticker not in uids:
+                logger.error(f"Инструмент не найден: {ticker}")
+                return ticker, None
+            async with semaphore:
+                try:
+                    return ticker, await _repair_ticker_async(client, limiter, ticker, uids[ticker], start, min_gap)
+                except Exception as e:
+                    logger.error(f"Не удалось залатать {ticker}: {e}")
+                    return ticker, None
+
+        results = await asyncio.gather(*(worker(t) for t in tickers))
 
-    logger.error(f"Не удалось скачать {ticker} после {max_retries} попыток.")
\ No newline at end of file
+    return dict(results)
@@ -1,50 +1,182 @@
 from fastapi import FastAPI, BackgroundTasks, HTTPException
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import List, Optional
+import asyncio
+import numpy as np
 import pandas as pd
 
-from .loader import download_data
-from .storage import load_ticker_data, init_db
-from .physics import calculate_square_root_law
+from .loader import download_data, download_many, repair_gaps
+from .gaps import find_gaps, MIN_GAP_MINUTES
+from .storage import candle_cache, init_db, INTERVALS
+from .bus import make_bus, listen_candles
+from .physics import calculate_square_root_law, rolling_square_root_law, bootstrap_square_root_law
 from .physics import calculate_deviations
+from .scanner import scan_universe, start_pool, shutdown_pool, ScanBusy, SORT_KEYS, Z_THRESHOLD, HORIZON
 
-from .ml_handler import ai_service
+from .ml_handler import ai_service, ai_batcher, BatcherUnavailable
 
 app = FastAPI(title="QuantCore Brain", version="1.0")
 
+AI_WINDOW = 80
+INDICATORS_WINDOW = 500
+ALPHA_WINDOW = 1000
+ALPHA_STEP = 60
+# Потолок числа окон /alpha-history: каждое окно подгоняется заново (~0.3 мс на 1000 свечей)
+MAX_ALPHA_WINDOWS = 5000
+BOOTSTRAP_SAMPLES = 1000
+# Потолок n_boot: матрица индексов бутстрепа (n_boot, число корзин) строится целиком в памяти
+MAX_BOOTSTRAP_SAMPLES = 100_000
+
 @app.on_event("startup")
 def on_startup():
     init_db()
 
+@app.on_event("startup")
+async def start_bus():
+    """Закрытые минутки от muscle доливаются в кэш по шине, если она настроена."""
+    bus = make_bus()
+    if bus is not None:
+        app.state.bus_task = asyncio.create_task(listen_candles(bus, candle_cache.push, candle_cache.set_live))
+
+@app.on_event("startup")
+def start_scan_pool():
+    """Один пул процессов скана на весь сервис, а не новый на каждый /scan."""
+    start_pool()
+
+@app.on_event("shutdown")
+def stop_scan_pool():
+    shutdown_pool()
+
+@app.on_event("startup")
+async def start_batcher():
+    """Прогнозы одновременных запросов считаются микро-пачками."""
+    app.state.batcher_task = asyncio.create_task(ai_batcher.run())
+
 class AnalysisResponse(BaseModel):
     ticker: str
     alpha: float
     r2: float
     status: str
+    intercept: float
+    alpha_ci: Optional[List[float]] = None
+    intercept_ci: Optional[List[float]] = None
+    alpha_std: Optional[float] = None
 
 class TickerRequest(BaseModel):
     ticker: str
     days: int = 60
 
+class BatchCollectRequest(BaseModel):
+    tickers: List[str]
+    days: int = 60
+    concurrency: int = Field(8, ge=1)
+
+class PredictRequest(BaseModel):
+    tickers: List[str]
+
+class RepairRequest(BaseModel):
+    tickers: Optional[List[str]] = None
+    days: Optional[int] = None
+    concurrency: int = Field(8, ge=1)
+
 
 @app.get("/")
 def health_check():
     return {"status": "active", "service": "Python Brain"}
 
+collect_progress = {}
+
+def report_progress(ticker, rows_written, fetched_until, target_time):
+    collect_progress[ticker] = {
+        "rows_written": rows_written,
+        "fetched_until": fetched_until.isoformat(),
+        "target_time": target_time.isoformat(),
+        "done": fetched_until >= target_time
+    }
+
+async def run_batch(tickers, days, concurrency):
+    results = await download_many(tickers, days, concurrency, progress=report_progress)
+    for ticker, rows in results.items():
+        if rows is None:
+            collect_progress[ticker] = {
+                **collect_progress.get(ticker, {}), "done": False,
+                "error": "инструмент не найден или загрузка прервалась"
+            }
+
+@app.get("/cache/stats", summary="Статистика кэша свечей")
+def get_cache_stats():
+    return candle_cache.stats()
+
 @app.post("/collect", summary="Запустить сбор данных")
 def trigger_collection(req: TickerRequest, background_tasks: BackgroundTasks):
     """
     Асинхронно запускает скачивание данных, чтобы не блокировать сервер.
     """
-    background_tasks.add_task(download_data, req.ticker, req.days)
+    background_tasks.add_task(download_data, req.ticker, req.days, progress=report_progress)
     return {"message": f"Сбор данных для {req.ticker} запущен в фоне."}
 
+@app.post("/collect/batch", summary="Запустить сбор данных по списку тикеров")
+def trigger_batch_collection(req: BatchCollectRequest, background_tasks: BackgroundTasks):
+    """
+    Параллельно докачивает все тикеры через одно соединение с общим лимитом запросов.
+    """
+    background_tasks.add_task(run_batch, req.tickers, req.days, req.concurrency)
+    return {"message": f"Сбор данных для {len(req.tickers)} тикеров запущен в фоне."}
+
+@app.get("/collect/status", summary="Прогресс сбора данных")
+def get_collection_status():
+    """
+    Сколько свечей записано и до какого момента докачан каждый тикер.
+    Тикеры, которые не нашлись или упали при пакетной загрузке, помечены полем error.
+    """
+    return collect_progress
+
+repair_results = {}
+
+async def run_repair(tickers, days, concurrency):
+    repair_results.update(await repair_gaps(tickers, days_back=days, concurrency=concurrency))
+
+@app.get("/gaps/{ticker}", summary="Дыры в минутной истории")
+def get_gaps(ticker: str, days: Optional[int] = None, min_gap: int = MIN_GAP_MINUTES):
+    """
+    Покрытие сессий MOEX минутками и список пропусков не короче min_gap минут.
+    """
+    start = pd.Timestamp.now(tz='UTC') - pd.Timedelta(days=days) if days else None
+    report = find_gaps(ticker, start=start, min_gap=min_gap)
+    if not report['expected']:
+        raise HTTPException(status_code=404, detail="Нет данных")
+    return report
+
+@app.post("/collect/repair", summary="Докачать пропуски в истории")
+def trigger_repair(req: RepairRequest, background_tasks: BackgroundTasks):
+    """
+    Ищет дыры и докачивает только их, тикеры обрабатываются параллельно.
+    """
+    background_tasks.add_task(run_repair, req.tickers, req.days, req.concurrency)
+    return {"message": "Поиск и докачка пропусков запущены в фоне."}
+
+@app.get("/collect/repair", summary="Результаты докачки пропусков")
+def get_repair_results():
+    return repair_results
+
+def check_interval(interval: str):
+    if interval not in INTERVALS:
+        raise HTTPException(status_code=400, detail=f"Неизвестный интервал {interval}, доступны: {INTERVALS}")
+
 @app.get("/analyze/{ticker}", response_model=AnalysisResponse)
-def get_physics_analysis(ticker: str):
+def get_physics_analysis(ticker: str, interval: str = "1m", n_boot: int = BOOTSTRAP_SAMPLES,
+                         seed: Optional[int] = None, level: float = 0.95):
     """
-    Проверяет закон квадратного корня для тикера.
+    Проверяет закон квадратного корня для тикера на таймфрейме interval.
+    Доверительные интервалы alpha и intercept - бутстреп из n_boot выборок (n_boot=0 - без них,
+    не больше MAX_BOOTSTRAP_SAMPLES).
     """
-    df = load_ticker_data(ticker)
+    if not 0 <= n_boot <= MAX_BOOTSTRAP_SAMPLES or not 0 < level < 1:
+        raise HTTPException(
+            status_code=400, detail=f"n_boot должно быть в [0, {MAX_BOOTSTRAP_SAMPLES}], level - в (0, 1)"
+        )
+    check_interval(interval)
+    df = candle_cache.get(ticker, interval=interval)
     
     if df.empty:
         raise HTTPException(status_code=404, detail="Данные не найдены. Сначала вызовите /collect")
@@ -55,51 +187,139 @@ def get_physics_analysis(ticker: str):
         raise HTTPException(status_code=400, detail="Недостаточно данных для анализа")
 
     status = "CONFIRMED" if res['r2'] > 0.9 else "ANOMALY"
+    intervals = bootstrap_square_root_law(res, n_boot, seed, level) if n_boot else {}
     
     return {
         "ticker": ticker,
         "alpha": res['alpha'],
         "r2": res['r2'],
-        "status": status
+        "status": status,
+        "intercept": res['params'][1],
+        "alpha_ci": intervals.get('alpha_ci'),
+        "intercept_ci": intervals.get('intercept_ci'),
+        "alpha_std": intervals.get('alpha_std'),
+    }
+
+@app.get("/alpha-history/{ticker}")
+def get_alpha_history(ticker: str, window: int = ALPHA_WINDOW, step: int = ALPHA_STEP, interval: str = "1m"):
+    """
+    Как менялся показатель alpha: закон квадратного корня в скользящем окне
+    из window свечей с шагом step по всей истории тикера.
+    Окон не больше MAX_ALPHA_WINDOWS: на длинной истории маленький step отклоняется.
+    """
+    check_interval(interval)
+    if window < 100 or step < 1:
+        raise HTTPException(status_code=400, detail="window должно быть не меньше 100, step - не меньше 1")
+
+    df = candle_cache.get(ticker, interval=interval)
+    if df.empty:
+        raise HTTPException(status_code=404, detail="Данные не найдены. Сначала вызовите /collect")
+    if len(df) < window:
+        raise HTTPException(status_code=400, detail=f"Свечей меньше окна: {len(df)} < {window}")
+    min_step = -(-(len(df) - window + 1) // MAX_ALPHA_WINDOWS)
+    if step < min_step:
+        raise HTTPException(
+            status_code=400, detail=f"Слишком много окон: для {len(df)} свечей step должно быть не меньше {min_step}"
+        )
+
+    res = rolling_square_root_law(df['volume'].to_numpy(), df['volatility'].to_numpy(), window, step)
+    times = df['time'].to_numpy()[res['end']]
+
+    return {
+        "ticker": ticker,
+        "window": window,
+        "step": step,
+        "points": [
+            {
+                "time": pd.Timestamp(t),
+                "alpha": None if np.isnan(a) else float(a),
+                "r2": None if np.isnan(r) else float(r),
+                "bins": int(b),
+            }
+            for t, a, r, b in zip(times, res['alpha'], res['r2'], res['bins'])
+        ],
+    }
+
+@app.get("/scan")
+def scan_board(days: Optional[int] = None, z: float = Z_THRESHOLD, horizon: int = HORIZON,
+               sort: str = "mean_abs_return", limit: Optional[int] = None):
+    """
+    Закон квадратного корня, z-score и доходность через horizon свечей после сигналов z < z
+    по всем тикерам из БД (в пуле процессов). Таблица отсортирована по sort по убыванию.
+    """
+    if sort not in SORT_KEYS:
+        raise HTTPException(status_code=400, detail=f"Неизвестный ключ сортировки {sort}, доступны: {SORT_KEYS}")
+    if horizon < 1:
+        raise HTTPException(status_code=400, detail="horizon должен быть не меньше 1")
+    if limit is not None and limit < 0:
+        raise HTTPException(status_code=400, detail="limit не может быть отрицательным")
+
+    try:
+        report = scan_universe(days=days, z_threshold=z, horizon=horizon, sort_by=sort)
+    except ScanBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    if limit is not None:
+        report['results'] = report['results'][:limit]
+    return report
+
+async def predict_ticker(ticker: str, df: pd.DataFrame = None):
+    """Прогноз через микро-батчер; None, если нет данных, модели или истории мало."""
+    if df is None:
+        df = await asyncio.to_thread(candle_cache.get, ticker, last_n=AI_WINDOW)
+    if df.empty:
+        return None
+    prepared = await asyncio.to_thread(ai_service.prepare, ticker, df)
+    if prepared is None:
+        return None
+    try:
+        ai_vol = await ai_batcher.submit(*prepared)
+    except (asyncio.TimeoutError, BatcherUnavailable) as e:
+        raise HTTPException(status_code=503, detail=f"Прогноз недоступен: {str(e) or 'таймаут'}")
+    return {
+        "ticker": ticker,
+        "ai_volatility_prediction": ai_vol,
+        "recommendation": "WATCH" if ai_vol > 0.1 else "SLEEP"
     }
 
 @app.get("/predict/{ticker}")
-def get_ai_prediction(ticker: str):
+async def get_ai_prediction(ticker: str):
     """
     Возвращает прогноз волатильности от PINN (Нейросети).
     """
-    df = load_ticker_data(ticker)
-    
+    df = await asyncio.to_thread(candle_cache.get, ticker, last_n=AI_WINDOW)
+
     if df.empty:
         raise HTTPException(status_code=404, detail="Нет исторических данных")
 
-    ai_vol = ai_service.predict(ticker, df)
-    
-    if ai_vol is None:
+    prediction = await predict_ticker(ticker, df)
+
+    if prediction is None:
         raise HTTPException(status_code=400, detail="Модель не найдена или мало данных")
-    
-    phys_res = calculate_square_root_law(df)
-    current_z_score = 0.0
-    
-    if phys_res:
-        pass 
 
+    return prediction
+
+@app.post("/predict", summary="Прогноз волатильности по списку тикеров")
+async def get_ai_predictions(req: PredictRequest):
+    """
+    Прогнозы по многим тикерам сразу: запросы уходят в общий микро-батчер.
+    Тикеры без модели или с короткой историей попадают в skipped.
+    """
+    tickers = list(dict.fromkeys(req.tickers))
+    predictions = await asyncio.gather(*(predict_ticker(t) for t in tickers))
     return {
-        "ticker": ticker,
-        "ai_volatility_prediction": ai_vol,
-        "recommendation": "WATCH" if ai_vol > 0.1 else "SLEEP"
+        "predictions": [p for p in predictions if p is not None],
+        "skipped": [t for t, p in zip(tickers, predictions) if p is None],
     }
 
 @app.get("/indicators/{ticker}")
-def get_zscore_history(ticker: str):
+def get_zscore_history(ticker: str, interval: str = "1m"):
     """
     Возвращает историю Z-Score для графика.
     """
-    df = load_ticker_data(ticker)
-    if df.empty:
+    check_interval(interval)
+    df_slice = candle_cache.get(ticker, last_n=INDICATORS_WINDOW, interval=interval)
+    if df_slice.empty:
         raise HTTPException(status_code=404, detail="Нет данных")
-    
-    df_slice = df.tail(500).copy()
 
     model = calculate_square_root_law(df_slice)
     if not model:
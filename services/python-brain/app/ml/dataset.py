@@ -1,46 +1,73 @@
 import torch
-import pandas as pd
 import numpy as np
-from torch.utils.data import Dataset
-from sklearn.preprocessing import MinMaxScaler
+from torch.utils.data import Dataset, Sampler
+
+from .features import scaled_features, LOOKBACK, FORECAST
+
+
+def _window_means(values, start, width, count):
+    """Средние values[start + i : start + i + width] для i < count через накопленную сумму."""
+    cumulative = np.concatenate([[0.0], np.cumsum(values, dtype=float)])
+    return (cumulative[start + width:start + width + count] - cumulative[start:start + count]) / width
+
 
 class MarketDataset(Dataset):
-    def __init__(self, df, lookback=60, forecast=10):
+    def __init__(self, df, lookback=LOOKBACK, forecast=FORECAST):
         """
         lookback: сколько минут смотрим назад (история)
         forecast: на сколько минут вперед предсказываем
+
+        Признаки лежат одним непрерывным float32-тензором, окна - его view через unfold
+        (без копирования), цели посчитаны заранее. Индекс - число, срез или набор индексов:
+        срез отдает пачку окон как view, набор индексов - одной выборкой.
         """
         self.lookback = lookback
         self.forecast = forecast
 
-        df = df.copy() 
-        
-
-        df['log_ret'] = np.log(df['close'] / df['close'].shift(1)).fillna(0)
-        df['log_vol'] = np.log(df['volume'] + 1).fillna(0)
-        df['volatility'] = df['high'] - df['low']
-        
-        self.scaler_price = MinMaxScaler()
-        self.scaler_vol = MinMaxScaler()
-        
-        data_price = self.scaler_price.fit_transform(df[['log_ret', 'volatility']].values)
-        data_vol = self.scaler_vol.fit_transform(df[['log_vol']].values)
-        
-        self.data = np.hstack([data_price, data_vol])
-        
-        self.raw_volumes = df['volume'].values
+        data, self.scaler_price, self.scaler_vol = scaled_features(df)
+        self.data = torch.from_numpy(np.ascontiguousarray(data, dtype=np.float32))
+
+        length = max(len(data) - lookback - forecast, 0)
+        # (len, lookback, 3): окно idx - строки data[idx : idx + lookback]
+        if length:
+            self.windows = self.data.unfold(0, lookback, 1).transpose(1, 2)[:length]
+        else:
+            self.windows = self.data.new_empty((0, lookback, data.shape[1]))
+
+        # средняя будущая волатильность (в масштабе скейлера) и средний будущий объем
+        self.targets = torch.from_numpy(_window_means(data[:, 1], lookback, forecast, length).astype(np.float32))
+        self.vol_future = torch.from_numpy(
+            _window_means(df['volume'].to_numpy(dtype=float), lookback, forecast, length).astype(np.float32)
+        )
 
     def __len__(self):
-        return len(self.data) - self.lookback - self.forecast
+        return len(self.windows)
 
     def __getitem__(self, idx):
-        x = self.data[idx : idx + self.lookback]
-        
-
-        y_target = self.data[idx + self.lookback : idx + self.lookback + self.forecast, 1].mean()
-        
-        vol_future = self.raw_volumes[idx + self.lookback : idx + self.lookback + self.forecast].mean()
-        
-        return torch.tensor(x, dtype=torch.float32), \
-               torch.tensor(y_target, dtype=torch.float32), \
-               torch.tensor(vol_future, dtype=torch.float32)
\ No newline at end of file
+        return self.windows[idx], self.targets[idx], self.vol_future[idx]
+
+
+class WindowBatchSampler(Sampler):
+    """
+    Отдает пачки индексов MarketDataset целиком, для DataLoader(..., sampler=..., batch_size=None):
+    без перемешивания - срезы (пачка окон - view без копирования), с перемешиванием -
+    тензоры индексов (пачка собирается одной выборкой вместо поштучного collate).
+    """
+    def __init__(self, length, batch_size=32, shuffle=False, drop_last=False, generator=None):
+        self.length = length
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.drop_last = drop_last
+        self.generator = generator
+
+    def __len__(self):
+        if self.drop_last:
+            return self.length // self.batch_size
+        return -(-self.length // self.batch_size)
+
+    def __iter__(self):
+        order = torch.randperm(self.length, generator=self.generator) if self.shuffle else None
+        for batch in range(len(self)):
+            start = batch * self.batch_size
+            stop = min(start + self.batch_size, self.length)
+            yield order[start:stop] if order is not None else slice(start, stop)
@@ -0,0 +1,100 @@
+"""
+Экспорт обученных моделей (*_pinn_model.pth) в артефакты для app.ml.runtime:
+TorchScript (*.torchscript.pt) и ONNX (*.onnx), с --int8 - еще и динамически
+квантизованные варианты (*.int8.torchscript.pt, *.int8.onnx).
+
+    python -m app.ml.export [--dir models] [--format torchscript onnx] [--int8] [TICKER ...]
+
+Для ONNX нужен пакет onnx, для int8-ONNX - еще onnxruntime.
+"""
+import argparse
+import warnings
+from pathlib import Path
+
+import torch
+
+from ..config import logger, DATA_DIR
+from .features import LOOKBACK
+from .model import PhysicsLSTMPredictor, quantize_int8
+from .runtime import artifact_path
+
+FORMATS = ("torchscript", "onnx")
+
+
+def load_eager(path) -> PhysicsLSTMPredictor:
+    model = PhysicsLSTMPredictor()
+    model.load_state_dict(torch.load(path, map_location=torch.device('cpu')))
+    return model.eval()
+
+
+def export_torchscript(model, path):
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", FutureWarning)
+        torch.jit.save(torch.jit.script(model), str(path))
+
+
+class _FlatOutput(torch.nn.Module):
+    """squeeze() в forward дает скаляр для пачки из одного окна; в ONNX выход всегда (batch,)."""
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, x):
+        return self.model(x).reshape(-1)
+
+
+def export_onnx(model, path, lookback: int = LOOKBACK):
+    """ONNX с переменным размером пачки (вход x: (batch, lookback, 3), выход y: (batch,))."""
+    example = torch.zeros(2, lookback, 3)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        torch.onnx.export(_FlatOutput(model), (example,), str(path), input_names=["x"], output_names=["y"],
+                          dynamic_axes={"x": {0: "batch"}, "y": {0: "batch"}}, dynamo=False)
+
+
+def quantize_onnx(source, path):
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+    quantize_dynamic(str(source), str(path), weight_type=QuantType.QInt8)
+
+
+def export_model(models_dir, ticker: str, formats=FORMATS, int8: bool = False) -> list:
+    """Пишет артефакты модели тикера рядом с .pth, возвращает пути записанных файлов."""
+    model = load_eager(artifact_path(models_dir, ticker, "eager"))
+    written = []
+    if "torchscript" in formats:
+        written.append(artifact_path(models_dir, ticker, "torchscript"))
+        export_torchscript(model, written[-1])
+        if int8:
+            written.append(artifact_path(models_dir, ticker, "torchscript", int8=True))
+            export_torchscript(quantize_int8(model), written[-1])
+    if "onnx" in formats:
+        written.append(artifact_path(models_dir, ticker, "onnx"))
+        export_onnx(model, written[-1])
+        if int8:
+            written.append(artifact_path(models_dir, ticker, "onnx", int8=True))
+            quantize_onnx(written[-2], written[-1])
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Экспорт моделей в TorchScript/ONNX для инференса")
+    parser.add_argument("tickers", nargs="*", help="Тикеры (по умолчанию все *_pinn_model.pth в --dir)")
+    parser.add_argument("--dir", type=Path, default=DATA_DIR)
+    parser.add_argument("--format", nargs="+", choices=FORMATS, default=list(FORMATS))
+    parser.add_argument("--int8", action="store_true", help="Еще и int8-варианты (динамическая квантизация)")
+    args = parser.parse_args()
+
+    tickers = args.tickers or sorted(p.name[:-len("_pinn_model.pth")] for p in args.dir.glob("*_pinn_model.pth"))
+    if not tickers:
+        logger.warning(f"В {args.dir} нет моделей *_pinn_model.pth")
+    for ticker in tickers:
+        try:
+            written = export_model(args.dir, ticker, args.format, args.int8)
+        except Exception as e:
+            logger.error(f"{ticker}: экспорт не удался: {e}")
+            continue
+        logger.info(f"{ticker}: {', '.join(p.name for p in written)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,37 @@
+"""
+Признаки модели без torch: их используют и обучение (MarketDataset), и инференс,
+которому для ONNX-бэкенда torch не нужен.
+"""
+import numpy as np
+from sklearn.preprocessing import MinMaxScaler
+
+from ..kernels import market_features
+
+LOOKBACK = 60
+FORECAST = 10
+
+
+def scaled_features(df):
+    """
+    Признаки (log_ret, volatility, log_vol) после MinMax-масштабирования по всему df:
+    массив (n, 3) и скейлеры цены и объема.
+    """
+    log_ret, log_vol, volatility = market_features(
+        *(df[col].to_numpy(dtype=float) for col in ('close', 'volume', 'high', 'low'))
+    )
+
+    scaler_price = MinMaxScaler()
+    scaler_vol = MinMaxScaler()
+
+    data_price = scaler_price.fit_transform(np.column_stack([log_ret, volatility]))
+    data_vol = scaler_vol.fit_transform(log_vol[:, None])
+
+    return np.hstack([data_price, data_vol]), scaler_price, scaler_vol
+
+
+def model_input(df, lookback=LOOKBACK, forecast=FORECAST):
+    """Входное окно модели (lookback, 3) - первый образец MarketDataset(df); None, если свечей мало."""
+    data, _, _ = scaled_features(df)
+    if len(data) - lookback - forecast < 1:
+        return None
+    return data[:lookback].astype(np.float32)
@@ -16,4 +16,9 @@ class PhysicsLSTMPredictor(nn.Module):
         last_step = lstm_out[:, -1, :]
         
         prediction = self.fc(last_step)
-        return prediction.squeeze()
\ No newline at end of file
+        return prediction.squeeze()
+
+
+def quantize_int8(model):
+    """Динамическая int8-квантизация весов LSTM и Linear (активации остаются float) для инференса на CPU."""
+    return torch.ao.quantization.quantize_dynamic(model, {nn.LSTM, nn.Linear}, dtype=torch.qint8)
@@ -0,0 +1,121 @@
+"""
+Загрузка PhysicsLSTMPredictor для инференса через выбранный бэкенд:
+eager (веса *_pinn_model.pth), torchscript (*.torchscript.pt) или onnx (*.onnx через
+onnxruntime). Артефакты готовит python -m app.ml.export; int8 - их динамически
+квантизованные варианты.
+
+Модуль не импортирует torch: он нужен только eager и torchscript, с onnx сервис
+работает на onnxruntime и NumPy. Предиктор принимает окна (batch, lookback, 3) float32
+и возвращает массив прогнозов (batch,).
+"""
+import warnings
+from pathlib import Path
+
+import numpy as np
+
+from ..config import logger, MODEL_BACKEND, MODEL_INT8
+from .features import LOOKBACK
+
+BACKENDS = ("eager", "torchscript", "onnx")
+# На каких размерах пачки прогревать модель при загрузке (первые вызовы TorchScript и ORT медленные)
+WARMUP_BATCHES = (1, 8)
+WARMUP_ROUNDS = 2
+
+
+def artifact_path(models_dir, ticker: str, backend: str, int8: bool = False) -> Path:
+    """Файл модели тикера для бэкенда; у eager int8 нет своего файла (квантизуется при загрузке)."""
+    suffix = {"eager": ".pth", "torchscript": ".torchscript.pt", "onnx": ".onnx"}[backend]
+    if int8 and backend != "eager":
+        suffix = ".int8" + suffix
+    return Path(models_dir) / f"{ticker}_pinn_model{suffix}"
+
+
+class TorchPredictor:
+    """eager-модуль или загруженная TorchScript-модель."""
+    def __init__(self, model, backend: str):
+        import torch
+        self._torch = torch
+        self.model = model
+        self.backend = backend
+
+    def __call__(self, windows):
+        x = self._torch.from_numpy(np.ascontiguousarray(windows, dtype=np.float32))
+        with self._torch.no_grad():
+            return self.model(x).numpy().reshape(-1)
+
+
+class OnnxPredictor:
+    """Сессия onnxruntime на CPU."""
+    def __init__(self, session, backend: str = "onnx"):
+        self.session = session
+        self.backend = backend
+        self.input_name = session.get_inputs()[0].name
+
+    def __call__(self, windows):
+        x = np.ascontiguousarray(windows, dtype=np.float32)
+        return self.session.run(None, {self.input_name: x})[0].reshape(-1)
+
+
+def _load_eager(path, int8):
+    import torch
+    from .model import PhysicsLSTMPredictor, quantize_int8
+    model = PhysicsLSTMPredictor()
+    model.load_state_dict(torch.load(path, map_location=torch.device('cpu')))
+    model.eval()
+    if int8:
+        model = quantize_int8(model)
+    return TorchPredictor(model, "eager")
+
+
+def _load_torchscript(path):
+    import torch
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", FutureWarning)
+        model = torch.jit.load(str(path), map_location=torch.device('cpu'))
+    model.eval()
+    return TorchPredictor(model, "torchscript")
+
+
+def _load_onnx(path):
+    import onnxruntime
+    session = onnxruntime.InferenceSession(str(path), providers=["CPUExecutionProvider"])
+    return OnnxPredictor(session)
+
+
+def warmup(predictor, lookback: int = LOOKBACK):
+    for batch in WARMUP_BATCHES:
+        windows = np.zeros((batch, lookback, 3), dtype=np.float32)
+        for _ in range(WARMUP_ROUNDS):
+            predictor(windows)
+    return predictor
+
+
+def load_predictor(models_dir, ticker: str, backend: str = MODEL_BACKEND, int8: bool = MODEL_INT8):
+    """
+    Предиктор тикера с прогревом. Если для бэкенда нет артефакта или зависимостей,
+    откатывается на eager; None, если нет и весов .pth.
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Неизвестный бэкенд модели {backend}, доступны: {BACKENDS}")
+
+    predictor = None
+    path = artifact_path(models_dir, ticker, backend, int8)
+    if backend != "eager":
+        if not path.exists():
+            logger.warning(f"{ticker}: нет {path.name} для {backend}, модель загружается как eager")
+        else:
+            try:
+                predictor = _load_torchscript(path) if backend == "torchscript" else _load_onnx(path)
+            except ImportError as e:
+                logger.warning(f"{ticker}: бэкенд {backend} недоступен ({e}), модель загружается как eager")
+
+    if predictor is None:
+        path = artifact_path(models_dir, ticker, "eager")
+        if not path.exists():
+            logger.warning(f"Файл модели {path} не найден.")
+            return None
+        predictor = _load_eager(path, int8)
+
+    if int8:
+        predictor.backend += "-int8"
+    return warmup(predictor)
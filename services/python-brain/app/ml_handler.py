@@ -1,63 +1,165 @@
-import torch
+import time
+import asyncio
 import numpy as np
 from pathlib import Path
-from .ml.model import PhysicsLSTMPredictor
-from .ml.dataset import MarketDataset
-from .config import logger
+from .ml.features import model_input
+from .ml.runtime import load_predictor
+from .config import logger, PREDICT_MAX_BATCH, PREDICT_MAX_WAIT_MS, PREDICT_TIMEOUT_SECONDS, MODEL_BACKEND, MODEL_INT8
 
 class AIModelService:
-    def __init__(self):
+    def __init__(self, backend: str = MODEL_BACKEND, int8: bool = MODEL_INT8):
         self.models = {}
         self.base_path = Path("/app/models")
+        self.backend = backend
+        self.int8 = int8
 
     def load_model(self, ticker: str):
         """Загружает веса модели в память, если еще не загружены"""
         if ticker in self.models:
             return True
 
-        model_path = self.base_path / f"{ticker}_pinn_model.pth"
-        
-        if not model_path.exists():
-            logger.warning(f"Файл модели {model_path} не найден.")
-            return False
-
         try:
-            model = PhysicsLSTMPredictor()
-            model.load_state_dict(torch.load(model_path, map_location=torch.device('cpu')))
-            model.eval()
-            
-            self.models[ticker] = model
-            logger.info(f"Модель для {ticker} загружена в память.")
-            return True
+            model = load_predictor(self.base_path, ticker, self.backend, self.int8)
         except Exception as e:
             logger.error(f"Ошибка загрузки модели {ticker}: {e}")
             return False
 
-    def predict(self, ticker: str, df):
+        if model is None:
+            return False
+
+        self.models[ticker] = model
+        logger.info(f"Модель для {ticker} загружена в память ({model.backend}).")
+        return True
+
+    def prepare(self, ticker: str, df):
         """
-        Берет DataFrame, готовит данные и делает прогноз
+        Модель тикера и входное окно (lookback, 3) из DataFrame; None, если модели нет
+        или мало данных
         """
-        if ticker not in self.models:
-            loaded = self.load_model(ticker)
-            if not loaded:
-                return None
+        if not self.load_model(ticker):
+            return None
 
         if len(df) < 80:
             return None
-            
-        df_tail = df.tail(80).copy()
-        
-        ds = MarketDataset(df_tail)
-        
-        if len(ds) < 1:
+
+        window = model_input(df.tail(80))
+        if window is None:
+            return None
+
+        return self.models[ticker], window
+
+    def forward(self, model, windows: list) -> list:
+        """Один прогон модели по пачке окон"""
+        return model(np.stack(windows)).tolist()
+
+    def predict(self, ticker: str, df):
+        """
+        Берет DataFrame, готовит данные и делает прогноз
+        """
+        prepared = self.prepare(ticker, df)
+        if prepared is None:
             return None
-            
-        x_tensor, _, _ = ds[0]
-        
-        model = self.models[ticker]
-        with torch.no_grad():
-            prediction = model(x_tensor.unsqueeze(0)).item()
-            
-        return prediction
-
-ai_service = AIModelService()
\ No newline at end of file
+
+        model, window = prepared
+        return self.forward(model, [window])[0]
+
+
+class BatcherUnavailable(RuntimeError):
+    """Микро-батчер не запущен или уже остановлен."""
+
+
+class MicroBatcher:
+    """
+    Собирает одновременные запросы прогноза в пачки: ждет до max_wait_ms после первого
+    запроса или до max_batch запросов, затем запросы к одной и той же модели складываются
+    в один тензор и считаются одним прогоном (в отдельном потоке, чтобы не держать event loop).
+    Если run() завершился, ждущие запросы получают ошибку, а не висят вечно.
+    """
+    def __init__(self, service: AIModelService, max_batch: int = PREDICT_MAX_BATCH,
+                 max_wait_ms: float = PREDICT_MAX_WAIT_MS, timeout: float = PREDICT_TIMEOUT_SECONDS):
+        self.service = service
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.timeout = timeout
+        self.queue = None
+        self._arrived = None
+        self.stats = {"requests": 0, "batches": 0, "forwards": 0}
+
+    async def submit(self, model, window) -> float:
+        """Прогноз одного окна; asyncio.TimeoutError, если пачка не посчиталась за timeout секунд."""
+        if self.queue is None:
+            raise BatcherUnavailable("MicroBatcher не запущен")
+        future = asyncio.get_running_loop().create_future()
+        self.queue.put_nowait((model, window, future))
+        self._arrived.set()
+        return await asyncio.wait_for(future, self.timeout)
+
+    def _drain(self, batch: list):
+        while len(batch) < self.max_batch:
+            try:
+                batch.append(self.queue.get_nowait())
+            except asyncio.QueueEmpty:
+                return
+
+    async def _collect(self) -> list:
+        # очередь не читаем через wait_for(get()): запрос, вынутый в момент таймаута, пропал бы
+        # вместе со своим future. Ждем событие от submit, а забираем только get_nowait
+        batch = [await self.queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while True:
+            self._arrived.clear()
+            self._drain(batch)
+            timeout = deadline - time.monotonic()
+            if len(batch) >= self.max_batch or timeout <= 0:
+                return batch
+            try:
+                await asyncio.wait_for(self._arrived.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def _forward(self, groups: dict) -> dict:
+        results = {}
+        for key, (model, items) in groups.items():
+            try:
+                results[key] = self.service.forward(model, [x for x, _ in items])
+            except Exception as e:
+                results[key] = e
+        return results
+
+    async def run(self):
+        self.queue = asyncio.Queue()
+        self._arrived = asyncio.Event()
+        batch = []
+        try:
+            while True:
+                batch = await self._collect()
+                groups = {}
+                for model, window, future in batch:
+                    groups.setdefault(id(model), (model, []))[1].append((window, future))
+
+                results = await asyncio.to_thread(self._forward, groups)
+                for key, (_, items) in groups.items():
+                    for i, (_, future) in enumerate(items):
+                        if future.done():
+                            continue
+                        if isinstance(results[key], Exception):
+                            future.set_exception(results[key])
+                        else:
+                            future.set_result(results[key][i])
+
+                self.stats["requests"] += len(batch)
+                self.stats["batches"] += 1
+                self.stats["forwards"] += len(groups)
+                logger.debug(f"Пачка прогнозов: {len(batch)} запросов, {len(groups)} прогонов моделей")
+                batch = []
+        finally:
+            queue, self.queue = self.queue, None
+            while not queue.empty():
+                batch.append(queue.get_nowait())
+            pending = [future for _, _, future in batch if not future.done()]
+            for future in pending:
+                future.set_exception(BatcherUnavailable("MicroBatcher остановлен"))
+            logger.warning(f"Микро-батчер остановлен, отклонено {len(pending)} запросов")
+
+ai_service = AIModelService()
+ai_batcher = MicroBatcher(ai_service)
@@ -1,48 +1,408 @@
 # src/physics.py
+import math
+import warnings
+from bisect import bisect_left
+
 import numpy as np
 import pandas as pd
-from scipy import stats
+from numpy.lib.stride_tricks import sliding_window_view
 
-def calculate_square_root_law(df, bins=40):
+from .kernels import binned_means, smart_fit, least_squares, residuals, zscores
+
+def square_root_law_batch(volume, volatility, bins=40, min_obs=100):
     """
-    Проверяет закон I ~ sqrt(Q).
-    Возвращает словарь с результатами регрессии и данными для графика.
+    Закон I ~ sqrt(Q) сразу для пачки рядов (ядра из app.kernels: numba или NumPy).
+    volume, volatility - массивы (n,) или (batch, n). Точки с NaN или volatility <= 0
+    выбрасываются, поэтому ряды разной длины можно дополнить NaN до общей матрицы.
+
+    Корзины - квантили объема (как pd.qcut(..., duplicates='drop')), в корзине - средние
+    log Q и log I, регрессия по корзинам выше медианы в замкнутой форме.
+    Возвращает словарь: alpha, intercept, r2 (NaN, где данных мало), edges (batch, bins + 1),
+    log_q, log_i (batch, bins; NaN - пустая корзина), counts, smart (batch, bins).
+    Для одномерного входа все значения без оси batch.
     """
-    df_clean = df[df['volatility'] > 0].copy()
-    
-    if len(df_clean) < 100:
-        return None 
+    volume = np.asarray(volume, dtype=float)
+    volatility = np.asarray(volatility, dtype=float)
+    single = volume.ndim == 1
+    volume, volatility = np.atleast_2d(volume), np.atleast_2d(volatility)
 
+    count = ((volatility > 0) & ~np.isnan(volume)).sum(axis=1)
 
-    df_clean['log_Q'] = np.log(df_clean['volume'])
-    df_clean['log_I'] = np.log(df_clean['volatility'])
-    
-    try:
-        df_clean['bin'] = pd.qcut(df_clean['volume'], bins, duplicates='drop')
-    except ValueError:
-        df_clean['bin'] = pd.cut(df_clean['volume'], bins)
+    with np.errstate(divide='ignore', invalid='ignore'), warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        edges, counts, log_q, log_i = binned_means(volume, volatility, np.linspace(0, 1, bins + 1))
+        alpha, intercept, r2, smart, n = smart_fit(log_q, log_i)
 
-    binned_data = df_clean.groupby('bin', observed=True)[['log_Q', 'log_I']].mean()
-    
-    median_vol = binned_data['log_Q'].median()
-    smart_money_data = binned_data[binned_data['log_Q'] > median_vol].copy()
-    
-    if len(smart_money_data) < 3:
+    fitted = (count >= min_obs) & (n >= 3)
+    res = {
+        'alpha': np.where(fitted, alpha, np.nan),
+        'intercept': np.where(fitted, intercept, np.nan),
+        'r2': np.where(fitted, r2, np.nan),
+        'edges': edges,
+        'log_q': log_q,
+        'log_i': log_i,
+        'counts': counts,
+        'smart': smart,
+    }
+    if single:
+        res = {key: value[0] for key, value in res.items()}
+    return res
+
+def bootstrap_square_root_law(model_res, n_boot=1000, seed=None, level=0.95):
+    """
+    Бутстреп-интервалы для alpha и intercept из результата calculate_square_root_law.
+    Перевыбираются пары (log Q, log I) корзин smart money: все выборки - одна матрица
+    индексов (n_boot, k), регрессия по ним - один проход в замкнутой форме.
+    Возвращает alpha_ci, intercept_ci (границы на уровне level), alpha_std и n_boot.
+    """
+    smart = model_res['smart_money']
+    x = smart['log_Q'].to_numpy()
+    y = smart['log_I'].to_numpy()
+    k = len(x)
+
+    idx = np.random.default_rng(seed).integers(0, k, size=(n_boot, k))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # выборки из одной повторенной корзины регрессию не определяют (NaN) и в квантили не идут
+        slope, intercept, _ = least_squares(x[idx], y[idx])
+
+    tail = (1 - level) / 2 * 100
+    bounds = [tail, 100 - tail]
+    return {
+        'alpha_ci': tuple(float(v) for v in np.nanpercentile(slope, bounds)),
+        'intercept_ci': tuple(float(v) for v in np.nanpercentile(intercept, bounds)),
+        'alpha_std': float(np.nanstd(slope, ddof=1)),
+        'n_boot': n_boot,
+    }
+
+def calculate_square_root_law(df, bins=40):
+    """
+    Проверяет закон I ~ sqrt(Q).
+    Возвращает словарь с результатами регрессии и данными для графика.
+    Считает square_root_law_batch, здесь только обертка в DataFrame.
+    """
+    volume = df['volume'].to_numpy(dtype=float)
+    volatility = df['volatility'].to_numpy(dtype=float)
+    fit = square_root_law_batch(volume, volatility, bins)
+    if np.isnan(fit['alpha']):
         return None
 
-    slope, intercept, r_value, p_value, std_err = stats.linregress(
-        smart_money_data['log_Q'], smart_money_data['log_I']
+    mask = volatility > 0
+    with np.errstate(divide='ignore'):
+        # свечи без сделок дают log_Q = -inf, как в прежней реализации
+        df_clean = df[mask].assign(log_Q=np.log(volume[mask]), log_I=np.log(volatility[mask]))
+
+    filled = ~np.isnan(fit['log_q'])
+    edges = fit['edges']
+    binned_data = pd.DataFrame(
+        {'log_Q': fit['log_q'][filled], 'log_I': fit['log_i'][filled]},
+        index=pd.IntervalIndex.from_arrays(edges[:-1][filled], edges[1:][filled], closed='right', name='bin')
     )
-    
+    smart_money_data = binned_data[fit['smart'][filled]]
+
     return {
-        'alpha': slope,
-        'r2': r_value**2,
+        'alpha': float(fit['alpha']),
+        'r2': float(fit['r2']),
         'binned_data': binned_data,
         'smart_money': smart_money_data,
-        'params': (slope, intercept),
+        'params': (float(fit['alpha']), float(fit['intercept'])),
         'raw_data': df_clean
     }
 
+def rolling_square_root_law(volume, volatility, window, step=1, bins=40, min_obs=100, chunk_size=2_000_000):
+    """
+    alpha и r2 в скользящем окне из window свечей с шагом step.
+    Окна - strided view без копирования истории, считаются пачками через square_root_law_batch
+    (не больше chunk_size значений за раз). Последнее окно заканчивается на последней свече.
+    Возвращает словарь массивов: end (индекс последней свечи окна), alpha, r2, bins (непустые корзины).
+
+    Каждое окно подгоняется с нуля, время растет как (len - window) / step * window:
+    на 130 тыс. свечей при window=1000 это около 0.7 сек для step=60 и около 9 сек для step=1.
+    """
+    volume = np.asarray(volume, dtype=float)
+    volatility = np.asarray(volatility, dtype=float)
+    if len(volume) < window:
+        empty = np.empty(0)
+        return {'end': empty.astype(np.intp), 'alpha': empty, 'r2': empty, 'bins': empty.astype(np.intp)}
+
+    offset = (len(volume) - window) % step
+    windows_q = sliding_window_view(volume, window)[offset::step]
+    windows_i = sliding_window_view(volatility, window)[offset::step]
+    per_chunk = max(1, chunk_size // window)
+
+    alpha, r2, filled = [], [], []
+    for start in range(0, len(windows_q), per_chunk):
+        fit = square_root_law_batch(
+            windows_q[start:start + per_chunk], windows_i[start:start + per_chunk], bins, min_obs
+        )
+        alpha.append(fit['alpha'])
+        r2.append(fit['r2'])
+        filled.append((fit['counts'] > 0).sum(axis=1))
+
+    return {
+        'end': np.arange(len(windows_q)) * step + offset + window - 1,
+        'alpha': np.concatenate(alpha),
+        'r2': np.concatenate(r2),
+        'bins': np.concatenate(filled),
+    }
+
+def closed_candles(df, now=None, bar=pd.Timedelta(minutes=1)):
+    """
+    Свечи df (отсортированные по time), чей бар длиной bar уже закончился к now (по умолчанию - сейчас).
+    Последний бар, пока он формируется, несет неполный объем: в потоковую оценку ему рано.
+    """
+    if df.empty:
+        return df
+    now = pd.Timestamp.now(tz='UTC') if now is None else pd.Timestamp(now)
+    return df.iloc[:df['time'].searchsorted(now - bar, side='right')]
+
+class OnlineSquareRootLaw:
+    """
+    Потоковая оценка закона I ~ sqrt(Q): свеча за свечой, без пересчета истории.
+    Границы корзин объема фиксируются по квантилям истории (from_frame) или первых warmup
+    свечей; в каждой корзине копятся число точек и суммы log Q, log I. Отдельно по всем
+    точкам копятся средние и ковариации log Q, log I (Уэлфорд) - из них std остатков
+    для любых params за O(1). update() стоит один bisect и два логарифма, result() - O(bins).
+    Пока идет разогрев, result() честно считает закон по накопленному буферу.
+    Состояние переносится через to_dict()/from_dict() (JSON), поэтому переживает перезапуск.
+    """
+    def __init__(self, bins=40, warmup=1000, min_obs=100):
+        self.bins = bins
+        self.warmup = warmup
+        self.min_obs = min_obs
+        self.edges = None
+        self.lowest = 0
+        self.counts = [0] * bins
+        self.sum_q = [0.0] * bins
+        self.sum_i = [0.0] * bins
+        self.n = 0
+        self.buffer = []
+        self.last_time = None
+        # моменты всех учтенных точек: число, средние и центральные суммы произведений
+        self.points = 0
+        self.mean_q = self.mean_i = 0.0
+        self.m_qq = self.m_ii = self.m_qi = 0.0
+
+    @classmethod
+    def from_frame(cls, df, bins=40, warmup=1000, min_obs=100):
+        """
+        Оценка по истории свечей; если история не короче warmup, совпадает
+        с calculate_square_root_law на тех же данных без свечей с нулевым объемом
+        (их, как и в ZScoreScorer.score, оценка не учитывает).
+        """
+        est = cls(bins=bins, warmup=warmup, min_obs=min_obs)
+        volume = df['volume'].to_numpy(dtype=float)
+        volatility = df['volatility'].to_numpy(dtype=float)
+        valid = (volume > 0) & (volatility > 0)
+        if valid.sum() >= warmup:
+            fit = square_root_law_batch(volume[valid], volatility[valid], bins, min_obs)
+            est._set_edges(fit['edges'])
+            counts = fit['counts']
+            est.counts = counts.tolist()
+            est.sum_q = np.where(counts > 0, fit['log_q'] * counts, 0.0).tolist()
+            est.sum_i = np.where(counts > 0, fit['log_i'] * counts, 0.0).tolist()
+            est.n = int(valid.sum())
+        else:
+            est.buffer = list(zip(volume[valid].tolist(), volatility[valid].tolist()))
+        if valid.any():
+            log_q, log_i = np.log(volume[valid]), np.log(volatility[valid])
+            dq, di = log_q - log_q.mean(), log_i - log_i.mean()
+            est.points = int(valid.sum())
+            est.mean_q, est.mean_i = float(log_q.mean()), float(log_i.mean())
+            est.m_qq, est.m_ii, est.m_qi = float(dq @ dq), float(di @ di), float(dq @ di)
+        if 'time' in df and len(df):
+            est.last_time = pd.Timestamp(df['time'].max())
+        return est
+
+    def _set_edges(self, edges):
+        self.edges = [float(e) for e in edges]
+        self.lowest = min(sum(e == self.edges[0] for e in self.edges[1:]), self.bins - 1)
+
+    def _add(self, volume, volatility):
+        j = bisect_left(self.edges, volume) - 1
+        j = min(max(j, self.lowest), self.bins - 1)
+        self.counts[j] += 1
+        self.sum_q[j] += math.log(volume)
+        self.sum_i[j] += math.log(volatility)
+        self.n += 1
+
+    def _moments(self, log_q, log_i):
+        self.points += 1
+        dq = log_q - self.mean_q
+        di = log_i - self.mean_i
+        self.mean_q += dq / self.points
+        self.mean_i += di / self.points
+        self.m_qq += dq * (log_q - self.mean_q)
+        self.m_ii += di * (log_i - self.mean_i)
+        self.m_qi += dq * (log_i - self.mean_i)
+
+    def resid_std(self, slope):
+        """Выборочное std остатков log I - (slope * log Q + intercept) по всем учтенным точкам."""
+        if self.points < 2:
+            return float('nan')
+        var = (self.m_ii - 2 * slope * self.m_qi + slope * slope * self.m_qq) / (self.points - 1)
+        return math.sqrt(max(var, 0.0))
+
+    def update(self, candle) -> bool:
+        """
+        Учитывает одну закрытую свечу (dict или строка DataFrame с volume и volatility).
+        Свечи не новее уже учтенной пропускаются, так что повторная подача истории безопасна.
+        """
+        time = candle.get('time')
+        if time is not None:
+            time = pd.Timestamp(time)
+            if self.last_time is not None and time <= self.last_time:
+                return False
+            self.last_time = time
+
+        volume, volatility = float(candle['volume']), float(candle['volatility'])
+        if not volume > 0 or not volatility > 0:
+            return False
+        self._moments(math.log(volume), math.log(volatility))
+
+        if self.edges is not None:
+            self._add(volume, volatility)
+            return True
+
+        self.buffer.append((volume, volatility))
+        if len(self.buffer) >= self.warmup:
+            warm = np.array(self.buffer)
+            self._set_edges(square_root_law_batch(warm[:, 0], warm[:, 1], self.bins)['edges'])
+            for v, i in self.buffer:
+                self._add(v, i)
+            self.buffer = []
+        return True
+
+    def update_frame(self, df) -> int:
+        """Учитывает свечи df новее уже учтенной (поиск по отсортированному time). Возвращает, сколько подано."""
+        start = df['time'].searchsorted(self.last_time, side='right') if self.last_time is not None else 0
+        new = df.iloc[start:]
+        for candle in new.to_dict('records'):
+            self.update(candle)
+        return len(new)
+
+    def result(self):
+        """
+        alpha, r2, params = (slope, intercept), resid_std и число точек n; None, если данных мало.
+        """
+        if self.edges is None:
+            if len(self.buffer) < self.min_obs:
+                return None
+            warm = np.array(self.buffer)
+            fit = square_root_law_batch(warm[:, 0], warm[:, 1], self.bins, self.min_obs)
+            if np.isnan(fit['alpha']):
+                return None
+            alpha = float(fit['alpha'])
+            return {'alpha': alpha, 'r2': float(fit['r2']), 'params': (alpha, float(fit['intercept'])),
+                    'resid_std': self.resid_std(alpha), 'n': len(self.buffer)}
+
+        if self.n < self.min_obs:
+            return None
+        means = [(q / c, i / c) for c, q, i in zip(self.counts, self.sum_q, self.sum_i) if c]
+        ordered = sorted(q for q, _ in means)
+        mid = len(ordered) // 2
+        median = ordered[mid] if len(ordered) % 2 else (ordered[mid - 1] + ordered[mid]) / 2
+        smart = [(q, i) for q, i in means if q > median]
+        if len(smart) < 3:
+            return None
+
+        k = len(smart)
+        mean_q = sum(q for q, _ in smart) / k
+        mean_i = sum(i for _, i in smart) / k
+        sxx = sum((q - mean_q) ** 2 for q, _ in smart)
+        syy = sum((i - mean_i) ** 2 for _, i in smart)
+        sxy = sum((q - mean_q) * (i - mean_i) for q, i in smart)
+        if sxx == 0:
+            return None
+        alpha = sxy / sxx
+        r2 = min(sxy * sxy / (sxx * syy), 1.0) if syy else 0.0
+        return {'alpha': alpha, 'r2': r2, 'params': (alpha, mean_i - alpha * mean_q),
+                'resid_std': self.resid_std(alpha), 'n': self.n}
+
+    def is_finite(self) -> bool:
+        """Все накопленные суммы, моменты и границы конечны (NaN/inf навсегда испортили бы z-score)."""
+        values = [*self.sum_q, *self.sum_i, *(self.edges or []), *(v for point in self.buffer for v in point),
+                  self.mean_q, self.mean_i, self.m_qq, self.m_ii, self.m_qi]
+        return all(math.isfinite(v) for v in values)
+
+    def to_dict(self) -> dict:
+        if not self.is_finite():
+            raise ValueError("Состояние оценки закона содержит NaN/inf, сохранять нельзя")
+        return {
+            'bins': self.bins,
+            'warmup': self.warmup,
+            'min_obs': self.min_obs,
+            'edges': self.edges,
+            'counts': self.counts,
+            'sum_q': self.sum_q,
+            'sum_i': self.sum_i,
+            'n': self.n,
+            'buffer': [list(point) for point in self.buffer],
+            'last_time': self.last_time.isoformat() if self.last_time is not None else None,
+            'moments': [self.points, self.mean_q, self.mean_i, self.m_qq, self.m_ii, self.m_qi],
+        }
+
+    @classmethod
+    def from_dict(cls, state: dict):
+        est = cls(bins=state['bins'], warmup=state['warmup'], min_obs=state['min_obs'])
+        if state['edges'] is not None:
+            est._set_edges(state['edges'])
+        est.counts = list(state['counts'])
+        est.sum_q = list(state['sum_q'])
+        est.sum_i = list(state['sum_i'])
+        est.n = state['n']
+        est.buffer = [tuple(point) for point in state['buffer']]
+        if state['last_time']:
+            est.last_time = pd.Timestamp(state['last_time'])
+        est.points, est.mean_q, est.mean_i, est.m_qq, est.m_ii, est.m_qi = state['moments']
+        if not est.is_finite():
+            raise ValueError("Сохраненное состояние оценки закона содержит NaN/inf")
+        return est
+
+class ZScoreScorer:
+    """
+    Z-score свечи относительно уже подобранного закона. Хранит только params и std остатков,
+    поэтому оценка новой свечи (или небольшой пачки) стоит O(1) на свечу и не трогает историю.
+    Дает то же, что колонка z_score у calculate_deviations.
+    """
+    def __init__(self, slope, intercept, resid_std):
+        self.slope = slope
+        self.intercept = intercept
+        self.resid_std = resid_std
+
+    @classmethod
+    def from_model(cls, model_res):
+        """Из результата calculate_square_root_law: std остатков считается один раз по raw_data."""
+        if not model_res:
+            return None
+        slope, intercept = model_res['params']
+        raw = model_res['raw_data']
+        residual = raw['log_I'].to_numpy() - (slope * raw['log_Q'].to_numpy() + intercept)
+        # свечи без сделок (log_Q = -inf) в std не идут, как и в calculate_deviations
+        return cls(slope, intercept, float(np.std(residual[np.isfinite(residual)], ddof=1)))
+
+    @classmethod
+    def from_estimator(cls, estimator):
+        """Из OnlineSquareRootLaw; None, пока оценке не хватает данных."""
+        res = estimator.result()
+        if not res:
+            return None
+        return cls(*res['params'], res['resid_std'])
+
+    def score(self, candle):
+        """Z-score одной свечи (dict или строка DataFrame); None для свечи без объема или волатильности."""
+        volume, volatility = float(candle['volume']), float(candle['volatility'])
+        if not volume > 0 or not volatility > 0:
+            return None
+        residual = math.log(volatility) - (self.slope * math.log(volume) + self.intercept)
+        return residual / self.resid_std
+
+    def score_many(self, volume, volatility):
+        """Z-score пачки свечей; NaN там, где объем или волатильность не положительны."""
+        volume = np.asarray(volume, dtype=float)
+        volatility = np.asarray(volatility, dtype=float)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return zscores(volume, volatility, self.slope, self.intercept, self.resid_std)
+
 def calculate_deviations(df, model_res):
     """
     Считает отклонение каждой свечи от идеального закона.
@@ -55,11 +415,8 @@ def calculate_deviations(df, model_res):
     
     df_dev = model_res['raw_data'].copy()
     
-    df_dev['log_I_pred'] = slope * df_dev['log_Q'] + intercept
-    
-    df_dev['residual'] = df_dev['log_I'] - df_dev['log_I_pred']
-    
-    std_dev = df_dev['residual'].std()
-    df_dev['z_score'] = df_dev['residual'] / std_dev
+    residual = residuals(df_dev['volume'].to_numpy(dtype=float), df_dev['volatility'].to_numpy(dtype=float),
+                         slope, intercept)
+    df_dev['z_score'] = residual / np.nanstd(residual, ddof=1)
     
     return df_dev[['time', 'close', 'volume', 'volatility', 'z_score']].sort_values('time')
\ No newline at end of file
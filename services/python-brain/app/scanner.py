@@ -0,0 +1,186 @@
+"""
+Скан всей доски: закон квадратного корня, отклонения (z-score) и доходность через
+horizon свечей после сигналов z < z_threshold для каждого тикера из БД.
+
+Тикеры режутся на пачки, пачки считаются в пуле процессов: каждый процесс читает
+свою пачку из БД одним запросом и прогоняет через NumPy-ядро из physics.
+Пул один на процесс сервиса: создается при старте (start_pool) в контексте spawn -
+fork из многопоточного uvicorn копирует чужие блокировки и соединения с БД.
+Одновременно идет только один скан, второй получает ScanBusy.
+
+    python -m app.scanner [--days 90] [--workers 8] [--top 20]
+"""
+import os
+import time
+import argparse
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+import pandas as pd
+
+from .config import logger
+from .storage import list_tickers, load_tickers_window
+from .archive import has_archive, load_archived_history
+from .physics import square_root_law_batch
+from .kernels import residuals
+
+SCAN_COLUMNS = ['close', 'volume', 'volatility']
+Z_THRESHOLD = -2.5
+HORIZON = 10
+# Движение больше этого (в процентах) за horizon свечей считается значимым
+SIGNIFICANT_MOVE = 0.1
+# Сколько пачек приходится на процесс: меньше - крупнее запросы, больше - ровнее загрузка
+CHUNKS_PER_WORKER = 4
+
+SORT_KEYS = ['mean_abs_return', 'mean_return', 'hit_rate', 'signals', 'alpha', 'r2', 'last_z']
+
+_pool = None
+_pool_workers = 0
+_pool_lock = threading.Lock()
+_scan_lock = threading.Lock()
+
+
+class ScanBusy(RuntimeError):
+    """Скан уже идет."""
+
+
+def scan_ticker(ticker: str, df: pd.DataFrame, z_threshold: float = Z_THRESHOLD, horizon: int = HORIZON):
+    """Статистика сигналов по одному тикеру; None, если закон не подобрать (мало данных)."""
+    volume = df['volume'].to_numpy(dtype=float)
+    volatility = df['volatility'].to_numpy(dtype=float)
+    close = df['close'].to_numpy(dtype=float)
+
+    fit = square_root_law_batch(volume, volatility)
+    if np.isnan(fit['alpha']):
+        return None
+
+    residual = residuals(volume, volatility, float(fit['alpha']), float(fit['intercept']))
+    z = residual / np.nanstd(residual, ddof=1)
+
+    forward = np.full(len(close), np.nan)
+    forward[:-horizon] = (close[horizon:] - close[:-horizon]) / close[:-horizon] * 100
+    signals = z < z_threshold
+    returns = forward[signals & ~np.isnan(forward)]
+    scored = np.flatnonzero(~np.isnan(z))
+
+    return {
+        'ticker': ticker,
+        'candles': len(df),
+        'alpha': float(fit['alpha']),
+        'r2': float(fit['r2']),
+        'last_z': float(z[scored[-1]]) if len(scored) else None,
+        'signals': int(signals.sum()),
+        'significant': int((np.abs(returns) > SIGNIFICANT_MOVE).sum()),
+        'mean_return': float(returns.mean()) if len(returns) else None,
+        'mean_abs_return': float(np.abs(returns).mean()) if len(returns) else None,
+        'hit_rate': float((returns > 0).mean()) if len(returns) else None,
+    }
+
+
+def start_pool(workers: int = None) -> ProcessPoolExecutor:
+    """Общий пул скана из workers процессов (по умолчанию по числу ядер); повторный вызов отдает уже созданный."""
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is None:
+            _pool_workers = max(1, workers or os.cpu_count() or 1)
+            _pool = ProcessPoolExecutor(max_workers=_pool_workers, mp_context=multiprocessing.get_context('spawn'))
+            logger.info(f"Пул скана: {_pool_workers} процессов (spawn)")
+        return _pool
+
+
+def shutdown_pool():
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(cancel_futures=True)
+
+
+def _scan_chunk(tickers: list, start, z_threshold: float, horizon: int) -> list:
+    archived = [t for t in tickers if has_archive(t)]
+    frames = load_tickers_window([t for t in tickers if t not in archived], start=start, columns=SCAN_COLUMNS)
+    for ticker in archived:
+        frames[ticker] = load_archived_history(ticker, start=start, columns=SCAN_COLUMNS)
+
+    results = []
+    for ticker, df in frames.items():
+        try:
+            res = scan_ticker(ticker, df, z_threshold, horizon)
+        except Exception as e:
+            logger.error(f"{ticker}: скан не удался: {e}")
+            continue
+        if res:
+            results.append(res)
+    return results
+
+
+def scan_universe(tickers: list = None, days: int = None, z_threshold: float = Z_THRESHOLD, horizon: int = HORIZON,
+                  sort_by: str = 'mean_abs_return', workers: int = None) -> dict:
+    """
+    Сканирует тикеры (по умолчанию все из БД) в общем пуле процессов (см. start_pool;
+    workers действует, только если пул еще не создан).
+    Возвращает {'scanned', 'fitted', 'elapsed', 'results'}; results отсортированы по sort_by
+    по убыванию, тикеры без значения - в конце. Если скан уже идет, бросает ScanBusy.
+    """
+    if sort_by not in SORT_KEYS:
+        raise ValueError(f"Неизвестный ключ сортировки {sort_by}, доступны: {SORT_KEYS}")
+    if not _scan_lock.acquire(blocking=False):
+        raise ScanBusy("Скан уже идет")
+    try:
+        return _scan(tickers, days, z_threshold, horizon, sort_by, workers)
+    finally:
+        _scan_lock.release()
+
+
+def _scan(tickers, days, z_threshold, horizon, sort_by, workers):
+    global _pool
+    started = time.monotonic()
+    tickers = list(tickers or list_tickers())
+    start = pd.Timestamp.now(tz='UTC') - pd.Timedelta(days=days) if days else None
+    pool = start_pool(workers)
+    workers = max(1, min(_pool_workers, len(tickers)))
+
+    chunk_count = min(len(tickers), workers * CHUNKS_PER_WORKER)
+    chunks = [tickers[i::chunk_count] for i in range(chunk_count)]
+    results = []
+    try:
+        futures = [pool.submit(_scan_chunk, chunk, start, z_threshold, horizon) for chunk in chunks]
+        for future in futures:
+            results.extend(future.result())
+    except BrokenProcessPool:
+        # упавший процесс ломает пул целиком: следующий скан поднимет новый
+        with _pool_lock:
+            if _pool is pool:
+                _pool = None
+        raise
+
+    results.sort(key=lambda r: (r[sort_by] is None, -(r[sort_by] or 0.0)))
+    elapsed = time.monotonic() - started
+    logger.info(f"Скан: {len(results)} из {len(tickers)} тикеров за {elapsed:.1f} сек ({workers} процессов)")
+    return {'scanned': len(tickers), 'fitted': len(results), 'elapsed': round(elapsed, 3), 'results': results}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Скан закона квадратного корня и сигналов по всей доске")
+    parser.add_argument("--days", type=int, default=None, help="Глубина истории в днях (по умолчанию вся)")
+    parser.add_argument("--z", type=float, default=Z_THRESHOLD)
+    parser.add_argument("--horizon", type=int, default=HORIZON)
+    parser.add_argument("--sort", default='mean_abs_return', choices=SORT_KEYS)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--top", type=int, default=20)
+    args = parser.parse_args()
+
+    start_pool(args.workers)
+    try:
+        report = scan_universe(days=args.days, z_threshold=args.z, horizon=args.horizon, sort_by=args.sort)
+    finally:
+        shutdown_pool()
+    table = pd.DataFrame(report['results'][:args.top])
+    print(table.to_string(index=False) if not table.empty else "Нет тикеров с достаточной историей")
+
+
+if __name__ == "__main__":
+    main()
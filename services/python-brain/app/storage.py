@@ -1,7 +1,13 @@
-from sqlalchemy import create_engine, Column, String, Float, DateTime, BigInteger
+import io
+import csv
+import time
+import threading
+from collections import OrderedDict
+from sqlalchemy import create_engine, select, func, Table, Column, String, Float, DateTime, BigInteger, Integer
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.orm import declarative_base, sessionmaker
 import pandas as pd
-from .config import DATABASE_URL, logger
+from .config import DATABASE_URL, BULK_CHUNK_SIZE, COPY_THRESHOLD, CANDLE_CACHE_BYTES, CACHE_RESYNC_SECONDS, logger
 
 
 
@@ -24,6 +30,67 @@ class Candle(Base):
     volatility = Column(Float) 
 
 
+CANDLE_COLUMNS = ['ticker', 'time', 'open', 'high', 'low', 'close', 'volume', 'volatility']
+
+# Производные таймфреймы: интервал -> правило ресемплинга pandas
+AGGREGATE_INTERVALS = {'5m': '5min', '15m': '15min', '1h': '1h', '1d': '1D'}
+INTERVALS = ['1m', *AGGREGATE_INTERVALS]
+
+
+class BackfillCheckpoint(Base):
+    """Прогресс незавершенной докачки: до какого момента данные уже записаны."""
+    __tablename__ = "backfill_checkpoints"
+
+    ticker = Column(String, primary_key=True)
+    last_time = Column(DateTime)
+    target_time = Column(DateTime)
+    rows_written = Column(BigInteger, default=0)
+    updated_at = Column(DateTime)
+
+
+class Instrument(Base):
+    """Справочник инструментов брокера: тикер + режим торгов -> UID и торговые параметры."""
+    __tablename__ = "instruments"
+
+    ticker = Column(String, primary_key=True)
+    class_code = Column(String, primary_key=True)
+    uid = Column(String, index=True)
+    figi = Column(String)
+    name = Column(String)
+    lot = Column(Integer)
+    min_price_increment = Column(Float)
+    updated_at = Column(DateTime)
+
+
+INSTRUMENT_COLUMNS = ['ticker', 'class_code', 'uid', 'figi', 'name', 'lot', 'min_price_increment', 'updated_at']
+
+
+def _aggregate_table(interval: str) -> Table:
+    return Table(
+        f"candles_{interval}", Base.metadata,
+        Column('ticker', String, primary_key=True, index=True),
+        Column('time', DateTime, primary_key=True, index=True),
+        Column('open', Float),
+        Column('high', Float),
+        Column('low', Float),
+        Column('close', Float),
+        Column('volume', BigInteger),
+        Column('volatility', Float)
+    )
+
+
+AGGREGATE_TABLES = {interval: _aggregate_table(interval) for interval in AGGREGATE_INTERVALS}
+
+
+def candle_table(interval: str = '1m') -> Table:
+    """Таблица свечей нужного таймфрейма."""
+    if interval == '1m':
+        return Candle.__table__
+    if interval not in AGGREGATE_TABLES:
+        raise ValueError(f"Неизвестный интервал {interval}, доступны: {INTERVALS}")
+    return AGGREGATE_TABLES[interval]
+
+
 def init_db():
     try:
         Base.metadata.create_all(bind=engine)
@@ -43,46 +110,458 @@ def get_last_candle_time(ticker: str):
         session.close()
 
 
-def save_candles_to_db(candles_data: list):
+def get_first_candle_time(ticker: str):
+    table = Candle.__table__
+    with engine.connect() as conn:
+        return conn.execute(select(func.min(table.c.time)).where(table.c.ticker == ticker)).scalar()
+
+
+def list_tickers() -> list:
+    """Все тикеры, по которым в БД есть минутные свечи."""
+    table = Candle.__table__
+    with engine.connect() as conn:
+        return [row[0] for row in conn.execute(select(table.c.ticker).distinct())]
+
+
+def get_checkpoint(ticker: str):
+    session = SessionLocal()
+    try:
+        return session.get(BackfillCheckpoint, ticker)
+    finally:
+        session.close()
+
+
+def save_checkpoint(ticker: str, last_time, target_time, rows_written: int):
     session = SessionLocal()
     try:
-        objects = []
-        for c in candles_data:
-            candle = Candle(
-                ticker=c['ticker'],
-                time=c['time'],
-                open=c['open'],
-                high=c['high'],
-                low=c['low'],
-                close=c['close'],
-                volume=c['volume'],
-                volatility=c['high'] - c['low']
-            )
-            objects.append(candle)
-        
-        for obj in objects:
-            session.merge(obj)
-            
+        session.merge(BackfillCheckpoint(
+            ticker=ticker,
+            last_time=_to_db_time(last_time),
+            target_time=_to_db_time(target_time),
+            rows_written=rows_written,
+            updated_at=_to_db_time(pd.Timestamp.now(tz='UTC'))
+        ))
+        session.commit()
+    finally:
+        session.close()
+
+
+def clear_checkpoint(ticker: str):
+    session = SessionLocal()
+    try:
+        session.query(BackfillCheckpoint).filter(BackfillCheckpoint.ticker == ticker).delete()
+        session.commit()
+    finally:
+        session.close()
+
+
+def load_instruments(class_code: str = None) -> list:
+    """Все записи справочника инструментов (опционально одного режима торгов) списком словарей."""
+    table = Instrument.__table__
+    query = select(table)
+    if class_code:
+        query = query.where(table.c.class_code == class_code)
+    with engine.connect() as conn:
+        return [dict(row._mapping) for row in conn.execute(query)]
+
+
+def save_instruments(instruments: list):
+    """Upsert записей справочника по (ticker, class_code)."""
+    if not instruments:
+        return
+    session = SessionLocal()
+    try:
+        for item in instruments:
+            session.merge(Instrument(**{col: item.get(col) for col in INSTRUMENT_COLUMNS}))
         session.commit()
-        logger.info(f"Сохранено {len(objects)} свечей в БД")
-    except Exception as e:
-        logger.error(f"Ошибка записи в БД: {e}")
-        session.rollback()
     finally:
         session.close()
 
-def load_ticker_data(ticker: str) -> pd.DataFrame:
+
+def _prepare_rows(candles_data: list) -> list:
+    """Приводит свечи к строкам таблицы. Дубли по (ticker, time) схлопываются, побеждает последняя."""
+    rows = {}
+    for c in candles_data:
+        rows[(c['ticker'], c['time'])] = {
+            'ticker': c['ticker'],
+            'time': c['time'],
+            'open': c['open'],
+            'high': c['high'],
+            'low': c['low'],
+            'close': c['close'],
+            'volume': c['volume'],
+            'volatility': c['high'] - c['low']
+        }
+    return list(rows.values())
+
+
+def _upsert_statement(dialect_name: str, table: Table):
+    """INSERT ... ON CONFLICT (ticker, time) DO UPDATE для Postgres и SQLite."""
+    if dialect_name == 'postgresql':
+        stmt = postgresql.insert(table)
+    elif dialect_name == 'sqlite':
+        stmt = sqlite.insert(table)
+    else:
+        return None
+
+    return stmt.on_conflict_do_update(
+        index_elements=['ticker', 'time'],
+        set_={col: stmt.excluded[col] for col in CANDLE_COLUMNS if col not in ('ticker', 'time')}
+    )
+
+
+def _write_chunk_upsert(stmt, rows: list):
+    # executemany: SQLAlchemy сам склеивает строки в многострочный VALUES (insertmanyvalues)
+    with engine.begin() as conn:
+        conn.execute(stmt, rows)
+
+
+def _write_chunk_copy(rows: list, table: Table):
+    """COPY во временную таблицу и один INSERT ... SELECT с разрешением конфликтов (только psycopg2)."""
+    cols = ", ".join(CANDLE_COLUMNS)
+    updates = ", ".join(f"{col} = EXCLUDED.{col}" for col in CANDLE_COLUMNS if col not in ('ticker', 'time'))
+
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    for r in rows:
+        writer.writerow([r[col] for col in CANDLE_COLUMNS])
+    buf.seek(0)
+
+    raw = engine.raw_connection()
+    try:
+        cur = raw.cursor()
+        cur.execute(f"CREATE TEMP TABLE candles_stage (LIKE {table.name} INCLUDING DEFAULTS) ON COMMIT DROP")
+        cur.copy_expert(f"COPY candles_stage ({cols}) FROM STDIN WITH (FORMAT csv)", buf)
+        cur.execute(
+            f"INSERT INTO {table.name} ({cols}) SELECT {cols} FROM candles_stage "
+            f"ON CONFLICT (ticker, time) DO UPDATE SET {updates}"
+        )
+        raw.commit()
+    except Exception:
+        raw.rollback()
+        raise
+    finally:
+        raw.close()
+
+
+def _write_chunk_merge(rows: list, table: Table):
+    """Построчный путь (DELETE + INSERT) для диалектов без ON CONFLICT."""
+    with engine.begin() as conn:
+        for r in rows:
+            conn.execute(table.delete().where(table.c.ticker == r['ticker'], table.c.time == r['time']))
+        conn.execute(table.insert(), rows)
+
+
+def save_candles_to_db(candles_data: list, chunk_size: int = BULK_CHUNK_SIZE, interval: str = '1m',
+                       raise_errors: bool = False) -> int:
     """
-    Загружает историю по тикеру из БД прямо в DataFrame.
+    Массовая запись свечей (upsert по ticker + time) в таблицу таймфрейма interval.
+    Пишет пачками по chunk_size с коммитом после каждой пачки.
+    Большие объемы в Postgres идут через COPY во временную таблицу.
+    Возвращает число записанных строк; при raise_errors=True ошибка записи пробрасывается наверх.
     """
-    query = f"SELECT * FROM candles WHERE ticker = '{ticker}' ORDER BY time ASC"
-    
-    with engine.connect() as conn:
-        df = pd.read_sql(query, conn)
-        
-    if not df.empty:
+    rows = _prepare_rows(candles_data)
+    if not rows:
+        return 0
+
+    table = candle_table(interval)
+    dialect_name = engine.dialect.name
+    use_copy = (
+        dialect_name == 'postgresql'
+        and engine.dialect.driver == 'psycopg2'
+        and len(rows) >= COPY_THRESHOLD
+    )
+    stmt = _upsert_statement(dialect_name, table)
+
+    saved = 0
+    try:
+        for i in range(0, len(rows), chunk_size):
+            chunk = rows[i:i + chunk_size]
+            if use_copy:
+                _write_chunk_copy(chunk, table)
+            elif stmt is not None:
+                _write_chunk_upsert(stmt, chunk)
+            else:
+                _write_chunk_merge(chunk, table)
+            saved += len(chunk)
+        logger.info(f"Сохранено {saved} свечей ({interval}) в БД")
+    except Exception as e:
+        logger.error(f"Ошибка записи в БД: {e}. Записано {saved} из {len(rows)}")
+        if raise_errors:
+            raise
+
+    return saved
+
+def _normalize_time(df: pd.DataFrame) -> pd.DataFrame:
+    if not df.empty and 'time' in df.columns:
         df['time'] = pd.to_datetime(df['time'])
         if df['time'].dt.tz is None:
             df['time'] = df['time'].dt.tz_localize('UTC')
-        
-    return df
\ No newline at end of file
+    return df
+
+
+def _to_db_time(ts):
+    """В БД время хранится без таймзоны (UTC)."""
+    ts = pd.Timestamp(ts)
+    if ts.tzinfo is not None:
+        ts = ts.tz_convert('UTC').tz_localize(None)
+    return ts.to_pydatetime()
+
+
+def load_ticker_window(ticker: str, start=None, end=None, last_n: int = None, columns: list = None,
+                       interval: str = '1m') -> pd.DataFrame:
+    """
+    Загружает окно истории по тикеру: диапазон времени [start, end] и/или последние last_n свечей.
+    Запрос параметризован и читает только нужные колонки, last_n идет через индекс (ticker, time).
+    interval выбирает таблицу таймфрейма (1m, 5m, 15m, 1h, 1d).
+    """
+    table = candle_table(interval)
+    columns = list(columns or CANDLE_COLUMNS)
+    if 'time' not in columns:
+        columns.insert(0, 'time')
+    selected = [table.c[col] for col in columns]
+
+    query = select(*selected).where(table.c.ticker == ticker)
+    if start is not None:
+        query = query.where(table.c.time >= _to_db_time(start))
+    if end is not None:
+        query = query.where(table.c.time <= _to_db_time(end))
+
+    if last_n is not None:
+        query = query.order_by(table.c.time.desc()).limit(last_n)
+    else:
+        query = query.order_by(table.c.time.asc())
+
+    with engine.connect() as conn:
+        df = pd.read_sql(query, conn)
+
+    if last_n is not None:
+        df = df.iloc[::-1].reset_index(drop=True)
+
+    return _normalize_time(df)
+
+
+def load_tickers_window(tickers: list, start=None, columns: list = None) -> dict:
+    """
+    Минутки сразу для нескольких тикеров одним запросом (ticker IN (...)): {ticker: DataFrame}.
+    Свечи идут по времени, но колонка time читается, только если попросить (разбор дат не бесплатный).
+    Тикеры без свечей в ответ не попадают.
+    """
+    table = Candle.__table__
+    columns = [col for col in (columns or CANDLE_COLUMNS) if col != 'ticker']
+    query = select(table.c.ticker, *[table.c[col] for col in columns]).where(table.c.ticker.in_(tickers))
+    if start is not None:
+        query = query.where(table.c.time >= _to_db_time(start))
+    query = query.order_by(table.c.ticker, table.c.time)
+
+    with engine.connect() as conn:
+        df = pd.read_sql(query, conn)
+
+    return {
+        ticker: _normalize_time(group.drop(columns='ticker').reset_index(drop=True))
+        for ticker, group in df.groupby('ticker', sort=False)
+    }
+
+
+def load_ticker_data(ticker: str, interval: str = '1m') -> pd.DataFrame:
+    """
+    Загружает историю по тикеру из БД прямо в DataFrame.
+    Если по минутному тикеру есть архив закрытых дней, берет их оттуда, а из БД только свежие.
+    """
+    if interval != '1m':
+        return load_ticker_window(ticker, interval=interval)
+
+    # Импорт внутри функции: archive сам зависит от storage
+    from .archive import has_archive, load_archived_history
+
+    if has_archive(ticker):
+        return load_archived_history(ticker)
+    return load_ticker_window(ticker)
+
+
+class CandleCache:
+    """
+    Кэш истории свечей в памяти: один DataFrame на пару (тикер, таймфрейм).
+    На каждом чтении из БД докачиваются только свечи начиная с последней закэшированной
+    (ее перечитываем: muscle может обновлять незакрытый бар).
+    Вытеснение по LRU в пределах бюджета памяти max_bytes.
+    Возвращаемые DataFrame общие для всех читателей: их нельзя менять на месте.
+
+    Пока подключена шина (live), закрытые минутки приходят через push(), и минутные
+    записи не ходят в БД на каждом чтении - только раз в resync_seconds для сверки.
+    push() вызывается из event loop на каждое сообщение шины, поэтому он только складывает
+    свечи в буфер; в DataFrame они вливаются одной пачкой на ближайшем чтении (в потоке читателя).
+    """
+    def __init__(self, max_bytes: int = CANDLE_CACHE_BYTES, resync_seconds: int = CACHE_RESYNC_SECONDS,
+                 max_pending: int = 1000):
+        self.max_bytes = max_bytes
+        self.resync_seconds = resync_seconds
+        self.max_pending = max_pending
+        self.live = False
+        self._entries = OrderedDict()  # (ticker, interval) -> (df, full, size)
+        self._synced = {}  # (ticker, interval) -> time.monotonic() последней сверки с БД
+        self._pending = {}  # (ticker, '1m') -> свечи из шины, еще не влитые в DataFrame
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.appends = 0
+        self.evictions = 0
+        self.pushes = 0
+
+    def get(self, ticker: str, last_n: int = None, interval: str = '1m') -> pd.DataFrame:
+        """
+        История тикера (или последние last_n свечей) на таймфрейме interval.
+        Если в кэше лежит только хвост истории, а нужна вся, тикер перечитывается целиком.
+        """
+        key = (ticker, interval)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+
+        if entry is not None and (entry[1] or (last_n is not None and len(entry[0]) >= last_n)):
+            df, full, size = entry
+            with self._lock:
+                pending = self._pending.pop(key, None)
+                self.hits += 1
+            if not self._is_live(key):
+                # сверка с БД покрывает и то, что пришло по шине
+                df = self._refresh(ticker, interval, df)
+                self._put(key, df, full)
+            elif pending:
+                df, size = self._merge(df, pending, size)
+                self._put(key, df, full, synced=False, size=size)
+        else:
+            if last_n is None:
+                df, full = load_ticker_data(ticker, interval), True
+            else:
+                df, full = load_ticker_window(ticker, last_n=last_n, interval=interval), False
+                if len(df) < last_n:
+                    # в БД меньше свечей, чем нужно: остальное может лежать в архиве
+                    df, full = load_ticker_data(ticker, interval), True
+            with self._lock:
+                self.misses += 1
+            if not df.empty:
+                self._put(key, df, full)
+
+        return df.tail(last_n) if last_n is not None else df
+
+    def _is_live(self, key: tuple) -> bool:
+        return (
+            self.live and key[1] == '1m'
+            and time.monotonic() - self._synced.get(key, float('-inf')) < self.resync_seconds
+        )
+
+    def _refresh(self, ticker: str, interval: str, df: pd.DataFrame) -> pd.DataFrame:
+        last_time = df['time'].iloc[-1]
+        fresh = load_ticker_window(ticker, start=last_time, interval=interval)
+        if fresh.empty:
+            return df
+
+        added = int((fresh['time'] > last_time).sum())
+        with self._lock:
+            self.appends += added
+
+        return pd.concat([df[df['time'] < last_time], fresh], ignore_index=True)
+
+    def _put(self, key: tuple, df: pd.DataFrame, full: bool, synced: bool = True, size: int = None):
+        if size is None:
+            size = int(df.memory_usage(deep=True).sum())
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[2]
+
+            if size > self.max_bytes:
+                return
+
+            self._entries[key] = (df, full, size)
+            if synced:
+                self._synced[key] = time.monotonic()
+            self._bytes += size
+
+            while self._bytes > self.max_bytes:
+                evicted_key, (_, _, evicted_size) = self._entries.popitem(last=False)
+                self._synced.pop(evicted_key, None)
+                self._pending.pop(evicted_key, None)
+                self._bytes -= evicted_size
+                self.evictions += 1
+
+    def push(self, candles: list):
+        """
+        Складывает закрытые минутки из шины в буфер уже закэшированных минутных историй.
+        Тикеры, которых нет в кэше, пропускаются: их загрузит первое чтение.
+        Если тикер долго не читают и буфер перерос max_pending, буфер сбрасывается,
+        а следующее чтение сверится с БД (muscle пишет свечи туда до публикации).
+        """
+        with self._lock:
+            for c in candles:
+                key = (c['ticker'], '1m')
+                if key not in self._entries:
+                    continue
+                pending = self._pending.setdefault(key, [])
+                pending.append(c)
+                if len(pending) > self.max_pending:
+                    del self._pending[key]
+                    self._synced.pop(key, None)
+                self.pushes += 1
+
+    def _merge(self, df: pd.DataFrame, rows: list, size: int):
+        """Вливает пачку свечей из шины в историю: один concat на пачку. -> (df, size)."""
+        new = pd.DataFrame(rows)
+        new['time'] = pd.to_datetime(new['time'], utc=True)
+        new['volatility'] = new['high'] - new['low']
+        new = new[[col for col in df.columns if col in new.columns]]
+        new = new.drop_duplicates(subset='time', keep='last').sort_values('time', ignore_index=True)
+
+        merged = pd.concat([df, new], ignore_index=True)
+        if new['time'].iloc[0] <= df['time'].iloc[-1]:
+            # пришла свеча, которая в кэше уже есть (например, незакрытый бар из БД): заменяем
+            merged = merged.drop_duplicates(subset='time', keep='last').sort_values('time', ignore_index=True)
+            return merged, None
+        return merged, size + int(new.memory_usage(deep=True, index=False).sum())
+
+    def set_live(self, live: bool):
+        """Шина подключилась или отвалилась. При подключении все минутки один раз сверяются с БД."""
+        with self._lock:
+            self.live = live
+            self._synced.clear()
+
+    def resync(self, ticker: str):
+        """Следующее чтение минуток тикера сверится с БД даже при живой шине (например, после докачки)."""
+        with self._lock:
+            self._synced.pop((ticker, '1m'), None)
+
+    def invalidate(self, ticker: str = None):
+        """Сбрасывает кэш тикера по всем таймфреймам (или весь), например после дозаливки старых данных."""
+        with self._lock:
+            if ticker is None:
+                self._entries.clear()
+                self._synced.clear()
+                self._pending.clear()
+                self._bytes = 0
+                return
+            for key in [k for k in self._entries if k[0] == ticker]:
+                self._bytes -= self._entries.pop(key)[2]
+                self._synced.pop(key, None)
+                self._pending.pop(key, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'appends': self.appends,
+                'evictions': self.evictions,
+                'pushes': self.pushes,
+                'pending': sum(len(rows) for rows in self._pending.values()),
+                'live': self.live,
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes
+            }
+
+
+candle_cache = CandleCache()
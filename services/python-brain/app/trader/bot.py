@@ -1,19 +1,21 @@
 import time
 import csv
-import torch
+import json
 from datetime import datetime
 from decimal import Decimal
 
-from t_tech.invest import Client, OrderDirection, OrderType
+from t_tech.invest import OrderDirection, OrderType
 from t_tech.invest.sandbox.client import SandboxClient 
 from t_tech.invest.utils import quotation_to_decimal, decimal_to_quotation
 
 from ..config import TOKEN, BASE_DIR, DATA_DIR
-from ..storage import load_ticker_data
+from ..storage import candle_cache
 from ..loader import download_data
-from ..ml.model import PhysicsLSTMPredictor
-from ..ml.dataset import MarketDataset
-from ..physics import calculate_square_root_law, calculate_deviations
+from ..instruments import registry
+from ..bus import CandleListener
+from ..ml.features import model_input
+from ..ml.runtime import load_predictor
+from ..physics import OnlineSquareRootLaw, ZScoreScorer, closed_candles
 
 LOG_DIR = BASE_DIR / "logs"
 LOG_DIR.mkdir(exist_ok=True)
@@ -28,49 +30,96 @@ class SandboxBot:
     def __init__(self, ticker="SELG"):
         self.ticker = ticker
         
-        self.model_path = DATA_DIR / f"{ticker}_pinn_model.pth"
-        self.model = PhysicsLSTMPredictor()
+        # бэкенд (eager, torchscript, onnx) и int8 - по MODEL_BACKEND и MODEL_INT8
         try:
-            self.model.load_state_dict(torch.load(self.model_path))
-            self.model.eval()
-            print(f"AI Модель загружена: {ticker}")
-        except:
-            print(f"ОШИБКА: Нет модели для {ticker}. Сначала обучите сеть!")
+            self.model = load_predictor(DATA_DIR, ticker)
+        except Exception:
             self.model = None
+        if self.model:
+            print(f"AI Модель загружена: {ticker} ({self.model.backend})")
+        else:
+            print(f"ОШИБКА: Нет модели для {ticker}. Сначала обучите сеть!")
+
+        # закон I ~ sqrt(Q) ведется потоково: на каждой свече только новые точки, без перерасчета истории
+        self.law_path = DATA_DIR / f"{ticker}_law_state.json"
+        self.law = None
+        if self.law_path.exists():
+            try:
+                self.law = OnlineSquareRootLaw.from_dict(json.loads(self.law_path.read_text()))
+            except (ValueError, KeyError) as e:
+                print(f"Состояние закона {self.law_path.name} испорчено ({e}), оценка пересчитается по истории")
+
+        # с шиной свечи приходят от muscle сразу после закрытия, без докачки и минутного сна.
+        # Настроенный BUS_URL еще не значит, что шина жива: смотрим на состояние подписки
+        # и на то, пришла ли свеча за время ожидания
+        self.listener = CandleListener(on_candles=candle_cache.push, on_state=candle_cache.set_live)
+        self.listener.start()
+        self.fresh = False
+
+    @property
+    def live(self):
+        return self.listener.connected
 
     def log_trade(self, action, price, qty, reason, balance):
         with open(TRADES_LOG_FILE, 'a', newline='') as f:
             writer = csv.writer(f)
             writer.writerow([datetime.now(), self.ticker, action, price, qty, reason, balance])
 
+    def update_law(self, df):
+        """
+        Доливает в потоковую оценку закрытые свечи новее уже учтенных и сохраняет состояние.
+        Формирующийся бар не подается: его объем еще вырастет, а учтенную свечу оценка уже не поправит.
+        """
+        closed = closed_candles(df)
+        if self.law is None:
+            self.law = OnlineSquareRootLaw.from_frame(closed)
+        elif not self.law.update_frame(closed):
+            return
+        if not self.law.is_finite():
+            # испорченную оценку не сохраняем: на следующей свече она пересчитается по истории
+            print("Оценка закона содержит NaN/inf, сбрасываем")
+            self.law = None
+            return
+        self.law_path.write_text(json.dumps(self.law.to_dict(), allow_nan=False))
+
     def get_signal(self):
         if not self.model: return None
         
-        # 1. Качаем данные
-        download_data(self.ticker, days_back=3)
-        df = load_ticker_data(self.ticker)
+        # 1. Качаем данные (если свеча пришла по шине, ее уже записал muscle)
+        if not (self.live and self.fresh):
+            download_data(self.ticker, days_back=3)
+            candle_cache.resync(self.ticker)
+        df = candle_cache.get(self.ticker)
         if len(df) < 100: return None
         
-        phys_model = calculate_square_root_law(df)
-        if not phys_model: return None
-        df_phys = calculate_deviations(df, phys_model)
-        last_candle = df_phys.iloc[-1]
-        
-        df_for_ai = df.tail(80).copy() 
-        ds = MarketDataset(df_for_ai)
-        if len(ds) < 1: return None
+        self.update_law(df)
+        scorer = ZScoreScorer.from_estimator(self.law)
+        if not scorer: return None
+        last_candle = df.iloc[-1]
+        z_score = scorer.score(last_candle)
+        if z_score is None: return None
         
-        x, _, _ = ds[0]
-        with torch.no_grad():
-            ai_vol = self.model(x.unsqueeze(0)).item()
+        x = model_input(df.tail(80))
+        if x is None: return None
+        ai_vol = float(self.model(x[None])[0])
             
         return {
-            'z_score': last_candle['z_score'],
+            'z_score': z_score,
             'ai_vol': ai_vol,
             'price': last_candle['close'],
             'time': last_candle['time']
         }
 
+    def wait_next_candle(self, timeout=60):
+        """Ждет свечу из шины; если за timeout она не пришла (или шины нет), следующий сигнал докачает данные сам."""
+        if self.live:
+            self.fresh = self.listener.wait(self.ticker, timeout)
+            if not self.fresh:
+                print(f"\nЗа {timeout} сек свеча {self.ticker} по шине не пришла, докачиваем из API")
+        else:
+            self.fresh = False
+            time.sleep(timeout)
+
     def run(self):
         print(f"\nЗапуск Песочницы для {self.ticker}...")
         
@@ -92,10 +141,8 @@ class SandboxBot:
                     amount=decimal_to_quotation(Decimal(100000))
                 )
             
-            try:
-                instruments = client.instruments.find_instrument(query=self.ticker).instruments
-                uid = next(i.uid for i in instruments if i.class_code == 'TQBR')
-            except StopIteration:
+            uid = registry.get_uid(client, self.ticker)
+            if not uid:
                 print("Тикер не найден")
                 return
 
@@ -154,7 +201,7 @@ class SandboxBot:
                     else:
                         print(f"{status_msg} ...", end="\r")
                     
-                    time.sleep(60)
+                    self.wait_next_candle()
 
             except KeyboardInterrupt:
                 print("\nСтоп.")
\ No newline at end of file
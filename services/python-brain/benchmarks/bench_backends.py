@@ -0,0 +1,99 @@
+"""
+Бенчмарк бэкендов инференса app.ml.runtime: eager, TorchScript и onnxruntime, каждый
+в float32 и int8. Модели из --dir экспортируются во временный каталог (без --dir берется
+модель со случайными весами), входы - окна MarketDataset по синтетическим свечам.
+Печатает задержку на пачку из одного окна и из --batch окон и расхождение прогнозов
+с eager float32. Отдельно проверяет, что сервис с onnx не импортирует torch.
+
+Запуск из services/python-brain:
+    python -m benchmarks.bench_backends [--dir models] [--ticker SELG] [--batch 32]
+"""
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+from pathlib import Path
+
+import numpy as np
+import torch
+
+from app.ml.dataset import MarketDataset
+from app.ml.model import PhysicsLSTMPredictor
+from app.ml.export import export_model
+from app.ml.runtime import BACKENDS, artifact_path, load_predictor
+from benchmarks.bench_dataset import make_candles
+
+TORCH_FREE_CHECK = """
+import sys
+from app.ml_handler import AIModelService
+service = AIModelService(backend='onnx')
+service.base_path = __import__('pathlib').Path(sys.argv[1])
+assert service.load_model(sys.argv[2]) and service.models[sys.argv[2]].backend == 'onnx'
+print('torch' in sys.modules)
+"""
+
+
+def latency(predictor, windows, calls):
+    timings = []
+    for _ in range(calls):
+        t0 = time.perf_counter()
+        predictor(windows)
+        timings.append(time.perf_counter() - t0)
+    return np.median(timings) * 1e6
+
+
+def prepare_models(models_dir, ticker, target):
+    if models_dir:
+        shutil.copy(artifact_path(models_dir, ticker, "eager"), artifact_path(target, ticker, "eager"))
+    else:
+        torch.save(PhysicsLSTMPredictor().state_dict(), artifact_path(target, ticker, "eager"))
+    formats = ["torchscript"]
+    try:
+        import onnx, onnxruntime  # noqa: F401
+        formats.append("onnx")
+    except ImportError:
+        print("onnx/onnxruntime не установлены: ONNX пропускается")
+    export_model(target, ticker, formats, int8=True)
+    return formats
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dir", type=Path, default=None, help="Каталог с обученными *_pinn_model.pth")
+    parser.add_argument("--ticker", default="BENCH")
+    parser.add_argument("--batch", type=int, default=32)
+    parser.add_argument("--calls", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    torch.manual_seed(args.seed)
+    windows = MarketDataset(make_candles(np.random.default_rng(args.seed), 5000)).windows.numpy()
+
+    with tempfile.TemporaryDirectory() as target:
+        formats = prepare_models(args.dir, args.ticker, target)
+        reference = load_predictor(target, args.ticker, "eager", int8=False)
+        expected = reference(windows)
+
+        print(f"{'бэкенд':<18} {'1 окно, мкс':>12} {f'{args.batch} окон, мкс':>14} {'макс. расх.':>12} {'сред. расх.':>12}")
+        for backend in BACKENDS:
+            if backend != "eager" and backend not in formats:
+                continue
+            for int8 in (False, True):
+                predictor = load_predictor(target, args.ticker, backend, int8)
+                drift = np.abs(predictor(windows) - expected)
+                single = latency(predictor, windows[:1], args.calls)
+                batch = latency(predictor, windows[:args.batch], max(args.calls // 4, 1))
+                print(f"{predictor.backend:<18} {single:12.0f} {batch:14.0f} {drift.max():12.2e} {drift.mean():12.2e}")
+
+        if "onnx" in formats:
+            env = {**os.environ, "PYTHONPATH": os.pathsep.join(filter(None, [os.getcwd(), os.environ.get("PYTHONPATH")]))}
+            out = subprocess.run([sys.executable, "-c", TORCH_FREE_CHECK, target, args.ticker],
+                                 capture_output=True, text=True, env=env, check=True).stdout.strip().splitlines()
+            print(f"Сервис с MODEL_BACKEND=onnx импортирует torch: {out[-1]}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,89 @@
+"""
+Бенчмарк записи свечей: старый путь (session.merge на каждую строку)
+против массового upsert из app.storage.save_candles_to_db.
+
+Запуск из services/python-brain:
+    python -m benchmarks.bench_bulk_upsert --rows 30000
+    DATABASE_URL=postgresql://... python -m benchmarks.bench_bulk_upsert
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+from datetime import datetime, timedelta, timezone
+
+if "DATABASE_URL" not in os.environ:
+    os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp()}/bench.db"
+
+from sqlalchemy import delete
+
+from app.storage import SessionLocal, Candle, engine, init_db, save_candles_to_db
+
+
+def make_candles(ticker, n):
+    start = datetime(2024, 1, 1, 7, 0, tzinfo=timezone.utc)
+    candles = []
+    for i in range(n):
+        price = 100.0 + (i % 50) * 0.1
+        candles.append({
+            'ticker': ticker,
+            'time': start + timedelta(minutes=i),
+            'open': price,
+            'high': price + 0.5,
+            'low': price - 0.5,
+            'close': price + 0.1,
+            'volume': 1000 + i % 300
+        })
+    return candles
+
+
+def legacy_save(candles_data):
+    """Копия прежней реализации save_candles_to_db: merge по одной строке, один коммит."""
+    session = SessionLocal()
+    try:
+        for c in candles_data:
+            session.merge(Candle(
+                ticker=c['ticker'], time=c['time'],
+                open=c['open'], high=c['high'], low=c['low'], close=c['close'],
+                volume=c['volume'], volatility=c['high'] - c['low']
+            ))
+        session.commit()
+    finally:
+        session.close()
+
+
+def clear(ticker):
+    with engine.begin() as conn:
+        conn.execute(delete(Candle.__table__).where(Candle.__table__.c.ticker == ticker))
+
+
+def run(label, fn, candles):
+    t0 = time.perf_counter()
+    fn(candles)
+    elapsed = time.perf_counter() - t0
+    print(f"{label:<28} {len(candles):>8} строк  {elapsed:8.3f} c  {len(candles) / elapsed:12.0f} строк/с")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=30000)
+    args = parser.parse_args()
+
+    init_db()
+    print(f"Диалект: {engine.dialect.name}")
+    candles = make_candles("BENCH", args.rows)
+
+    clear("BENCH")
+    run("legacy merge (insert)", legacy_save, candles)
+    run("legacy merge (update)", legacy_save, candles)
+
+    clear("BENCH")
+    run("bulk upsert (insert)", save_candles_to_db, candles)
+    run("bulk upsert (update)", save_candles_to_db, candles)
+
+    clear("BENCH")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
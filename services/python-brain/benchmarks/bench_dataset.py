@@ -0,0 +1,125 @@
+"""
+Бенчмарк MarketDataset: прежний Dataset (срезы NumPy и три torch.tensor на образец,
+DataLoader с поштучным collate) против окон-view и WindowBatchSampler.
+Перед замером сверяет образцы и пачки с прежней реализацией.
+
+Запуск из services/python-brain:
+    python -m benchmarks.bench_dataset --rows 100000 --batch 32
+"""
+import sys
+import time
+import argparse
+
+import numpy as np
+import pandas as pd
+import torch
+from torch.utils.data import DataLoader, Dataset
+from sklearn.preprocessing import MinMaxScaler
+
+from app.ml.dataset import MarketDataset, WindowBatchSampler
+from app.ml.model import PhysicsLSTMPredictor
+
+
+class LegacyMarketDataset(Dataset):
+    """Копия прежней реализации MarketDataset."""
+    def __init__(self, df, lookback=60, forecast=10):
+        self.lookback = lookback
+        self.forecast = forecast
+        df = df.copy()
+        df['log_ret'] = np.log(df['close'] / df['close'].shift(1)).fillna(0)
+        df['log_vol'] = np.log(df['volume'] + 1).fillna(0)
+        df['volatility'] = df['high'] - df['low']
+        data_price = MinMaxScaler().fit_transform(df[['log_ret', 'volatility']].values)
+        data_vol = MinMaxScaler().fit_transform(df[['log_vol']].values)
+        self.data = np.hstack([data_price, data_vol])
+        self.raw_volumes = df['volume'].values
+
+    def __len__(self):
+        return len(self.data) - self.lookback - self.forecast
+
+    def __getitem__(self, idx):
+        x = self.data[idx: idx + self.lookback]
+        y_target = self.data[idx + self.lookback: idx + self.lookback + self.forecast, 1].mean()
+        vol_future = self.raw_volumes[idx + self.lookback: idx + self.lookback + self.forecast].mean()
+        return torch.tensor(x, dtype=torch.float32), \
+               torch.tensor(y_target, dtype=torch.float32), \
+               torch.tensor(vol_future, dtype=torch.float32)
+
+
+def make_candles(rng, n):
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.001, n)))
+    spread = np.abs(rng.normal(0, 0.05, n))
+    return pd.DataFrame({
+        'close': close,
+        'high': close + spread,
+        'low': close - spread,
+        'volume': rng.integers(0, 5000, n).astype(float),
+    })
+
+
+def check_parity(rng):
+    for rows in [71, 80, 500, 5000]:
+        df = make_candles(rng, rows)
+        old, new = LegacyMarketDataset(df), MarketDataset(df)
+        assert len(old) == len(new), (rows, len(old), len(new))
+        for idx in range(len(old)):
+            for a, b in zip(old[idx], new[idx]):
+                torch.testing.assert_close(a, b, rtol=1e-5, atol=1e-6)
+        for batch in WindowBatchSampler(len(new), batch_size=64, shuffle=True):
+            x, y, vol = new[batch]
+            expected = [old[int(i)] for i in batch]
+            torch.testing.assert_close(x, torch.stack([e[0] for e in expected]), rtol=1e-5, atol=1e-6)
+            torch.testing.assert_close(y, torch.stack([e[1] for e in expected]), rtol=1e-5, atol=1e-6)
+            torch.testing.assert_close(vol, torch.stack([e[2] for e in expected]), rtol=1e-5, atol=1e-6)
+    assert len(MarketDataset(make_candles(rng, 60))) == 0
+    print("Паритет: образцы и пачки совпадают с прежним MarketDataset")
+
+
+def run(label, loader, samples, model=None):
+    optimizer = torch.optim.Adam(model.parameters(), lr=0.001) if model else None
+    t0 = time.perf_counter()
+    for batch_x, batch_y, batch_vol in loader:
+        if model:
+            optimizer.zero_grad()
+            loss = torch.nn.functional.mse_loss(model(batch_x), batch_y)
+            loss.backward()
+            optimizer.step()
+    elapsed = time.perf_counter() - t0
+    print(f"{label:<36} {elapsed:8.2f} сек  {samples / elapsed:12.0f} образцов/сек")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--batch", type=int, default=32)
+    parser.add_argument("--train-rows", type=int, default=10_000, help="Свечей для замера с шагом обучения")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    torch.manual_seed(args.seed)
+    check_parity(rng)
+
+    df = make_candles(rng, args.rows)
+    t0 = time.perf_counter()
+    old = LegacyMarketDataset(df)
+    t1 = time.perf_counter()
+    new = MarketDataset(df)
+    t2 = time.perf_counter()
+    print(f"Построение: прежний {(t1 - t0) * 1000:.1f} мс, новый {(t2 - t1) * 1000:.1f} мс")
+
+    run("прежний DataLoader (только данные)", DataLoader(old, batch_size=args.batch, shuffle=True), len(old))
+    sampler = WindowBatchSampler(len(new), batch_size=args.batch, shuffle=True)
+    run("WindowBatchSampler (только данные)", DataLoader(new, sampler=sampler, batch_size=None), len(new))
+
+    train_df = df.iloc[:args.train_rows]
+    old, new = LegacyMarketDataset(train_df), MarketDataset(train_df)
+    run("прежний DataLoader + шаг обучения", DataLoader(old, batch_size=args.batch, shuffle=True), len(old),
+        PhysicsLSTMPredictor())
+    sampler = WindowBatchSampler(len(new), batch_size=args.batch, shuffle=True)
+    run("WindowBatchSampler + шаг обучения", DataLoader(new, sampler=sampler, batch_size=None), len(new),
+        PhysicsLSTMPredictor())
+
+
+if __name__ == "__main__":
+    sys.exit(main())
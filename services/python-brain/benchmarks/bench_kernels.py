@@ -0,0 +1,101 @@
+"""
+Сверка и замер вычислительных ядер app.kernels: numpy_backend против numba_backend
+(если numba установлена). Все ядра гоняются на одних и тех же данных с NaN,
+нулевыми объемом и волатильностью и повторяющимися объемами.
+
+Запуск из services/python-brain:
+    python -m benchmarks.bench_kernels --batch 200 --rows 5000
+Полный бенчмарк закона на конкретном бэкенде:
+    KERNELS_BACKEND=numpy python -m benchmarks.bench_square_root_law
+"""
+import sys
+import time
+import argparse
+
+import numpy as np
+
+from app.kernels import load_backend, BACKEND
+
+
+def make_inputs(rng, batch, rows):
+    volume = np.ceil(rng.lognormal(5, 1.5, (batch, rows)))
+    volatility = 0.01 * volume ** 0.5 * rng.lognormal(0, 0.4, (batch, rows))
+    volatility[rng.random((batch, rows)) < 0.05] = 0.0
+    volume[rng.random((batch, rows)) < 0.01] = np.nan
+    volume[rng.random((batch, rows)) < 0.01] = 0.0
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.001, rows)))
+    close[rng.random(rows) < 0.01] = np.nan
+    return {
+        'volume': volume,
+        'volatility': volatility,
+        'close': close,
+        'high': close + 0.5,
+        'low': close - 0.5,
+        'flat_volume': np.nan_to_num(volume[0]),
+    }
+
+
+def calls(kernels, data):
+    """Имя -> вызов ядра на общих данных."""
+    q = np.linspace(0, 1, 41)
+    with np.errstate(all='ignore'):
+        edges, counts, log_q, log_i = kernels.binned_means(data['volume'], data['volatility'], q)
+    return {
+        'binned_means': lambda: kernels.binned_means(data['volume'], data['volatility'], q),
+        'smart_fit': lambda: kernels.smart_fit(log_q, log_i),
+        'least_squares': lambda: kernels.least_squares(log_q, log_i),
+        'residuals': lambda: kernels.residuals(data['flat_volume'], data['volatility'][0], 0.5, -4.6),
+        'zscores': lambda: kernels.zscores(data['flat_volume'], data['volatility'][0], 0.5, -4.6, 0.4),
+        'market_features': lambda: kernels.market_features(data['close'], data['flat_volume'], data['high'], data['low']),
+    }
+
+
+def check_parity(reference, candidate, data):
+    expected, actual = calls(reference, data), calls(candidate, data)
+    for name in expected:
+        with np.errstate(all='ignore'):
+            left, right = expected[name](), actual[name]()
+        for i, (a, b) in enumerate(zip(left, right)):
+            np.testing.assert_allclose(np.asarray(a, dtype=float), np.asarray(b, dtype=float),
+                                       rtol=1e-9, atol=1e-12, equal_nan=True, err_msg=f"{name}[{i}]")
+    print(f"Паритет {reference.NAME} / {candidate.NAME}: {len(expected)} ядер совпадают")
+
+
+def timings(kernels, data, repeat=3):
+    with np.errstate(all='ignore'):
+        for name, call in calls(kernels, data).items():
+            call()  # прогрев (для numba - загрузка из кэша или компиляция)
+            t0 = time.perf_counter()
+            for _ in range(repeat):
+                call()
+            elapsed = (time.perf_counter() - t0) / repeat
+            print(f"{kernels.NAME:<6} {name:<16} {elapsed * 1000:9.2f} мс")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--batch", type=int, default=200)
+    parser.add_argument("--rows", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    backends = [load_backend("numpy")]
+    try:
+        backends.append(load_backend("numba"))
+    except ImportError:
+        print("numba не установлена: сверяется и замеряется только numpy")
+    print(f"Бэкенд по умолчанию: {BACKEND}")
+
+    rng = np.random.default_rng(args.seed)
+    for batch, rows in [(1, 50), (3, 150), (20, 2000)]:
+        small = make_inputs(rng, batch, rows)
+        for candidate in backends[1:]:
+            check_parity(backends[0], candidate, small)
+
+    data = make_inputs(rng, args.batch, args.rows)
+    for kernels in backends:
+        timings(kernels, data)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,69 @@
+"""
+Бенчмарк микро-батчера прогнозов: requests одновременных запросов к models моделям.
+Прежний путь - по прогону модели на запрос (в пуле потоков, как синхронный эндпоинт),
+новый - MicroBatcher с разными max_batch. Перед замером сверяет прогнозы из пачки
+с поштучными.
+
+Запуск из services/python-brain:
+    python -m benchmarks.bench_predict --models 4 --requests 512
+"""
+import sys
+import time
+import asyncio
+import argparse
+
+import torch
+
+from app.ml.model import PhysicsLSTMPredictor
+from app.ml_handler import AIModelService, MicroBatcher
+from app.ml.runtime import TorchPredictor
+
+
+def make_requests(models, count, lookback=60):
+    generator = torch.Generator().manual_seed(0)
+    return [(models[i % len(models)], torch.rand(lookback, 3, generator=generator).numpy()) for i in range(count)]
+
+
+async def per_request(service, requests):
+    return await asyncio.gather(*(asyncio.to_thread(service.forward, m, [x]) for m, x in requests))
+
+
+async def batched(batcher, requests):
+    task = asyncio.create_task(batcher.run())
+    await asyncio.sleep(0)
+    try:
+        return await asyncio.gather(*(batcher.submit(m, x) for m, x in requests))
+    finally:
+        task.cancel()
+
+
+def run(label, coro, count):
+    t0 = time.perf_counter()
+    result = asyncio.run(coro)
+    elapsed = time.perf_counter() - t0
+    print(f"{label:<28} {elapsed * 1000:9.1f} мс  {count / elapsed:9.0f} запросов/сек")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--models", type=int, default=4)
+    parser.add_argument("--requests", type=int, default=512)
+    parser.add_argument("--wait-ms", type=float, default=5)
+    args = parser.parse_args()
+
+    torch.manual_seed(0)
+    service = AIModelService()
+    models = [TorchPredictor(PhysicsLSTMPredictor().eval(), "eager") for _ in range(args.models)]
+    requests = make_requests(models, args.requests)
+
+    single = [r[0] for r in run("по запросу", per_request(service, requests), len(requests))]
+    for max_batch in (1, 8, 32, 128):
+        batcher = MicroBatcher(service, max_batch=max_batch, max_wait_ms=args.wait_ms)
+        result = run(f"MicroBatcher max_batch={max_batch}", batched(batcher, requests), len(requests))
+        torch.testing.assert_close(torch.tensor(result), torch.tensor(single), rtol=1e-5, atol=1e-6)
+        print(f"{'':<28} пачек {batcher.stats['batches']}, прогонов {batcher.stats['forwards']}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,118 @@
+"""
+Бенчмарк закона квадратного корня: прежняя реализация на pandas (qcut + groupby + linregress)
+против NumPy-ядра app.physics.square_root_law_batch, обертки calculate_square_root_law
+и скользящего rolling_square_root_law.
+Перед замером сверяет результаты на случайных рядах, в том числе с повторяющимися объемами.
+
+Запуск из services/python-brain:
+    python -m benchmarks.bench_square_root_law --rows 5000 --windows 200
+"""
+import sys
+import time
+import argparse
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+from app.physics import calculate_square_root_law, square_root_law_batch, rolling_square_root_law
+
+
+def legacy_square_root_law(df, bins=40):
+    """Копия прежней реализации calculate_square_root_law."""
+    df_clean = df[df['volatility'] > 0].copy()
+    if len(df_clean) < 100:
+        return None
+    df_clean['log_Q'] = np.log(df_clean['volume'])
+    df_clean['log_I'] = np.log(df_clean['volatility'])
+    try:
+        df_clean['bin'] = pd.qcut(df_clean['volume'], bins, duplicates='drop')
+    except ValueError:
+        df_clean['bin'] = pd.cut(df_clean['volume'], bins)
+    binned_data = df_clean.groupby('bin', observed=True)[['log_Q', 'log_I']].mean()
+    median_vol = binned_data['log_Q'].median()
+    smart_money_data = binned_data[binned_data['log_Q'] > median_vol].copy()
+    if len(smart_money_data) < 3:
+        return None
+    slope, intercept, r_value, p_value, std_err = stats.linregress(
+        smart_money_data['log_Q'], smart_money_data['log_I']
+    )
+    return {'alpha': slope, 'r2': r_value**2, 'binned_data': binned_data, 'params': (slope, intercept)}
+
+
+def make_candles(rng, n, discrete=False, zero_volume=0.0):
+    volume = rng.lognormal(6, 1.5, n)
+    if discrete:
+        volume = np.ceil(volume / 50)
+    volatility = 0.01 * volume ** 0.5 * rng.lognormal(0, 0.4, n)
+    volatility[rng.random(n) < 0.05] = 0.0
+    # свечи без сделок, но с ненулевым диапазоном цены
+    volume[rng.random(n) < zero_volume] = 0.0
+    return pd.DataFrame({'volume': volume, 'volatility': volatility})
+
+
+def check_parity(rng, cases=50):
+    for case in range(cases):
+        df = make_candles(rng, int(rng.integers(50, 3000)), discrete=case % 2 == 1,
+                          zero_volume=0.01 if case % 3 == 2 else 0.0)
+        with np.errstate(divide='ignore'):
+            old = legacy_square_root_law(df)
+        new = calculate_square_root_law(df)
+        if old is None or new is None:
+            assert old is None and new is None, f"случай {case}: {old is None=} {new is None=}"
+            continue
+        assert np.isclose(old['alpha'], new['alpha'], rtol=1e-9), (case, old['alpha'], new['alpha'])
+        assert np.isclose(old['r2'], new['r2'], rtol=1e-9), (case, old['r2'], new['r2'])
+        assert np.allclose(old['params'], new['params'], rtol=1e-9), case
+        assert np.allclose(old['binned_data'].to_numpy(), new['binned_data'].to_numpy(), rtol=1e-9), case
+
+    # пачка из рядов разной длины, дополненных NaN, совпадает с поштучным расчетом
+    frames = [make_candles(rng, int(rng.integers(80, 2000)), zero_volume=0.01 * (i % 2)) for i in range(20)]
+    width = max(len(f) for f in frames)
+    volume = np.full((len(frames), width), np.nan)
+    volatility = np.full((len(frames), width), np.nan)
+    for i, f in enumerate(frames):
+        volume[i, :len(f)], volatility[i, :len(f)] = f['volume'], f['volatility']
+    batch = square_root_law_batch(volume, volatility)
+    for i, f in enumerate(frames):
+        with np.errstate(divide='ignore'):
+            old = legacy_square_root_law(f)
+        expected = np.nan if old is None else old['alpha']
+        assert np.isclose(batch['alpha'][i], expected, rtol=1e-9, equal_nan=True), (i, batch['alpha'][i], expected)
+    print(f"Паритет: {cases} рядов и пачка из {len(frames)} совпадают")
+
+
+def run(label, fn, calls):
+    t0 = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - t0
+    print(f"{label:<32} {elapsed * 1000:9.1f} мс  {elapsed / calls * 1e6:9.1f} мкс/ряд")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=5000)
+    parser.add_argument("--windows", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    check_parity(rng)
+
+    frames = [make_candles(rng, args.rows) for _ in range(args.windows)]
+    volume = np.stack([f['volume'].to_numpy() for f in frames])
+    volatility = np.stack([f['volatility'].to_numpy() for f in frames])
+
+    run("legacy pandas", lambda: [legacy_square_root_law(f) for f in frames], args.windows)
+    run("calculate_square_root_law", lambda: [calculate_square_root_law(f) for f in frames], args.windows)
+    run("square_root_law_batch (по одному)", lambda: [square_root_law_batch(v, i) for v, i in zip(volume, volatility)], args.windows)
+    run("square_root_law_batch (пачка)", lambda: square_root_law_batch(volume, volatility), args.windows)
+
+    # год минуток (~135 тыс. свечей), окно 1000 с шагом 60
+    year = make_candles(rng, 135_000)
+    steps = (len(year) - 1000) // 60 + 1
+    run("rolling_square_root_law (год)", lambda: rolling_square_root_law(year['volume'], year['volatility'], 1000, 60), steps)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
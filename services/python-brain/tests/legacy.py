@@ -0,0 +1,37 @@
+"""Копия прежней реализации закона квадратного корня на pandas (qcut + groupby + linregress) - эталон для тестов."""
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+
+def legacy_square_root_law(df, bins=40):
+    df_clean = df[df['volatility'] > 0].copy()
+    if len(df_clean) < 100:
+        return None
+    with np.errstate(divide='ignore'):
+        df_clean['log_Q'] = np.log(df_clean['volume'])
+    df_clean['log_I'] = np.log(df_clean['volatility'])
+    try:
+        df_clean['bin'] = pd.qcut(df_clean['volume'], bins, duplicates='drop')
+    except ValueError:
+        df_clean['bin'] = pd.cut(df_clean['volume'], bins)
+    binned_data = df_clean.groupby('bin', observed=True)[['log_Q', 'log_I']].mean()
+    median_vol = binned_data['log_Q'].median()
+    smart_money_data = binned_data[binned_data['log_Q'] > median_vol].copy()
+    if len(smart_money_data) < 3:
+        return None
+    slope, intercept, r_value, p_value, std_err = stats.linregress(
+        smart_money_data['log_Q'], smart_money_data['log_I']
+    )
+    return {'alpha': slope, 'r2': r_value**2, 'binned_data': binned_data, 'params': (slope, intercept)}
+
+
+def make_candles(rng, n, discrete=False, zero_volume=0.0):
+    """Синтетические свечи: объем логнормальный, I ~ sqrt(Q) с шумом, часть свечей без диапазона или без сделок."""
+    volume = rng.lognormal(6, 1.5, n)
+    if discrete:
+        volume = np.ceil(volume / 50)
+    volatility = 0.01 * volume ** 0.5 * rng.lognormal(0, 0.4, n)
+    volatility[rng.random(n) < 0.05] = 0.0
+    volume[rng.random(n) < zero_volume] = 0.0
+    return pd.DataFrame({'volume': volume, 'volatility': volatility})
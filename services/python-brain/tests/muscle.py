@@ -0,0 +1,8 @@
+"""Доступ к модулям python-muscle из тестов brain: сервис лежит рядом и не является пакетом."""
+import sys
+from pathlib import Path
+
+MUSCLE_DIR = Path(__file__).resolve().parents[2] / "python-muscle"
+
+if str(MUSCLE_DIR) not in sys.path:
+    sys.path.insert(0, str(MUSCLE_DIR))
@@ -0,0 +1,112 @@
+import pandas as pd
+import pytest
+
+from app import storage
+from app.storage import CandleCache
+
+T0 = pd.Timestamp('2026-01-05 07:00', tz='UTC')
+
+
+def frame(n, start=0, ticker='SBER'):
+    time = pd.date_range(T0 + pd.Timedelta(minutes=start), periods=n, freq='min')
+    return pd.DataFrame({
+        'ticker': ticker, 'time': time, 'open': 100.0, 'close': 100.0,
+        'high': 101.0, 'low': 99.0, 'volume': 10.0, 'volatility': 2.0,
+    })
+
+
+class FakeDB:
+    """Подменяет load_ticker_data/load_ticker_window: история в памяти и счетчик чтений."""
+    def __init__(self, monkeypatch):
+        self.history = {}
+        self.reads = 0
+        monkeypatch.setattr(storage, 'load_ticker_data', self.load_data)
+        monkeypatch.setattr(storage, 'load_ticker_window', self.load_window)
+
+    def load_data(self, ticker, interval='1m'):
+        self.reads += 1
+        return self.history.get(ticker, frame(0)).copy()
+
+    def load_window(self, ticker, start=None, end=None, last_n=None, columns=None, interval='1m'):
+        self.reads += 1
+        df = self.history.get(ticker, frame(0))
+        if start is not None:
+            df = df[df['time'] >= start]
+        if last_n is not None:
+            df = df.tail(last_n)
+        return df.reset_index(drop=True)
+
+
+@pytest.fixture
+def db(monkeypatch):
+    return FakeDB(monkeypatch)
+
+
+def size_of(n):
+    return int(frame(n).memory_usage(deep=True).sum())
+
+
+def test_lru_evicts_least_recently_read(db):
+    for ticker in ('A', 'B', 'C'):
+        db.history[ticker] = frame(100, ticker=ticker)
+    cache = CandleCache(max_bytes=2 * size_of(100) + 100)
+
+    cache.get('A')
+    cache.get('B')
+    cache.get('A')
+    cache.get('C')
+    assert cache.stats()['evictions'] == 1
+
+    misses = cache.stats()['misses']
+    cache.get('A')
+    assert cache.stats()['misses'] == misses
+    cache.get('B')
+    assert cache.stats()['misses'] == misses + 1
+
+
+def test_frame_over_budget_is_not_cached(db):
+    db.history['A'] = frame(100)
+    cache = CandleCache(max_bytes=size_of(10))
+    assert len(cache.get('A')) == 100
+    assert cache.stats()['entries'] == 0
+
+
+def test_refresh_appends_only_new_candles(db):
+    db.history['A'] = frame(100)
+    cache = CandleCache()
+    cache.get('A')
+    db.history['A'] = frame(103)
+    df = cache.get('A')
+    assert len(df) == 103 and df['time'].is_unique
+    assert cache.stats()['appends'] == 3
+
+
+def test_live_reads_merge_pushes_without_db(db):
+    db.history['A'] = frame(100)
+    cache = CandleCache(resync_seconds=3600)
+    cache.set_live(True)
+    cache.get('A')
+    reads = db.reads
+
+    cache.push(frame(2, start=100, ticker='A').to_dict('records'))
+    df = cache.get('A')
+    assert db.reads == reads
+    assert len(df) == 102 and df['time'].is_monotonic_increasing
+
+    # resync: следующее чтение сверяется с БД, даже пока шина жива
+    db.history['A'] = frame(105)
+    cache.resync('A')
+    assert len(cache.get('A')) == 105
+    assert db.reads == reads + 1
+
+
+def test_pending_overflow_falls_back_to_db(db):
+    db.history['A'] = frame(100)
+    cache = CandleCache(resync_seconds=3600, max_pending=3)
+    cache.set_live(True)
+    cache.get('A')
+
+    db.history['A'] = frame(110)
+    cache.push(frame(10, start=100, ticker='A').to_dict('records'))
+    assert cache.stats()['pending'] <= cache.max_pending
+    assert len(cache.get('A')) == 110
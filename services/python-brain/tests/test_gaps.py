@@ -0,0 +1,56 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from app import gaps
+from app.gaps import find_gaps, trading_days
+
+SESSION = 520  # минут в основной сессии 07:00-15:40 UTC
+
+
+def session(day):
+    return pd.date_range(pd.Timestamp(f'{day} 07:00', tz='UTC'), periods=SESSION, freq='min')
+
+
+@pytest.fixture
+def history(monkeypatch):
+    frames = {}
+    monkeypatch.setattr(gaps, 'load_archived_history', lambda ticker, **kw: frames.get(ticker, pd.DataFrame({'time': []})))
+    return frames
+
+
+def test_trading_days_skip_weekends_and_holidays():
+    lower, upper = np.datetime64('2026-01-09T00:00'), np.datetime64('2026-01-14T00:00')
+    assert trading_days(lower, upper, holidays=[]).astype(str).tolist() == ['2026-01-09', '2026-01-12', '2026-01-13']
+    assert trading_days(lower, upper, holidays=['2026-01-12']).astype(str).tolist() == ['2026-01-09', '2026-01-13']
+
+
+def test_gaps_follow_session_calendar(history):
+    monday = session('2026-01-12')
+    hole = (monday >= '2026-01-12 08:00+00:00') & (monday < '2026-01-12 08:10+00:00')
+    blip = (monday >= '2026-01-12 12:00+00:00') & (monday < '2026-01-12 12:02+00:00')
+    # пятница целиком, в понедельник дыра 10 минут и пропуск 2 минуты, вторника нет совсем
+    history['SBER'] = pd.DataFrame({'time': session('2026-01-09').append(monday[~hole & ~blip])})
+
+    report = find_gaps('SBER', start='2026-01-09', end='2026-01-13 23:59')
+    assert report['expected'] == 3 * SESSION
+    assert report['present'] == 2 * SESSION - 12
+    assert [(g['start'], g['minutes']) for g in report['gaps']] == [
+        (pd.Timestamp('2026-01-12 08:00', tz='UTC'), 10),
+        (pd.Timestamp('2026-01-13 07:00', tz='UTC'), SESSION),
+    ]
+    assert report['gaps'][1]['end'] == pd.Timestamp('2026-01-13 15:39', tz='UTC')
+
+
+def test_min_gap_filters_short_holes(history):
+    monday = session('2026-01-12')
+    history['SBER'] = pd.DataFrame({'time': monday.delete([100, 101])})
+    report = find_gaps('SBER', start='2026-01-12', end='2026-01-12 23:59', min_gap=2)
+    assert [g['minutes'] for g in report['gaps']] == [2]
+    assert find_gaps('SBER', start='2026-01-12', end='2026-01-12 23:59')['gaps'] == []
+
+
+def test_empty_history(history):
+    assert find_gaps('NONE')['expected'] == 0
+    report = find_gaps('NONE', start='2026-01-12', end='2026-01-12 23:59')
+    assert report['coverage'] == 0 and report['gaps'][0]['minutes'] == SESSION
@@ -0,0 +1,145 @@
+import warnings
+
+import numpy as np
+import pandas as pd
+import pytest
+from scipy import stats
+
+from app.kernels import load_backend
+from tests.legacy import legacy_square_root_law, make_candles
+
+Q = np.linspace(0, 1, 41)
+
+
+def _backend(name):
+    try:
+        return load_backend(name)
+    except ImportError:
+        pytest.skip(f"{name} не установлена")
+
+
+@pytest.fixture(params=["numpy", "numba"])
+def kernels(request):
+    return _backend(request.param)
+
+
+def fit(kernels, volume, volatility):
+    with np.errstate(all='ignore'), warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        edges, counts, log_q, log_i = kernels.binned_means(np.atleast_2d(volume), np.atleast_2d(volatility), Q)
+        alpha, intercept, r2, smart, n = kernels.smart_fit(log_q, log_i)
+    return edges, counts, log_q, log_i, alpha, intercept, r2, smart, n
+
+
+def assert_matches_legacy(kernels, df):
+    edges, counts, log_q, log_i, alpha, intercept, r2, smart, n = fit(kernels, df['volume'], df['volatility'])
+    old = legacy_square_root_law(df)
+    filled = counts[0] > 0
+    np.testing.assert_allclose(np.column_stack([log_q[0][filled], log_i[0][filled]]),
+                               old['binned_data'].to_numpy(), rtol=1e-9)
+    assert n[0] >= 3
+    assert alpha[0] == pytest.approx(old['alpha'], rel=1e-9)
+    assert intercept[0] == pytest.approx(old['params'][1], rel=1e-9)
+    assert r2[0] == pytest.approx(old['r2'], rel=1e-9)
+
+
+def test_random(kernels):
+    assert_matches_legacy(kernels, make_candles(np.random.default_rng(0), 3000))
+
+
+def test_zero_volume(kernels):
+    df = make_candles(np.random.default_rng(1), 2000, discrete=True)
+    df.loc[df.index[:20], 'volume'] = 0.0
+    assert_matches_legacy(kernels, df)
+    _, counts, log_q, _, *_ = fit(kernels, df['volume'], df['volatility'])
+    # -inf остается в своей корзине и не портит соседние
+    assert np.isneginf(log_q[0][counts[0] > 0]).sum() == 1
+
+
+def test_duplicate_edges(kernels):
+    df = make_candles(np.random.default_rng(2), 3000, discrete=True)
+    edges, counts, *_ = fit(kernels, df['volume'], df['volatility'])
+    assert (np.diff(edges[0]) == 0).any()
+    assert (counts[0] == 0).any()
+    assert counts.sum() == (df['volatility'] > 0).sum()
+    assert_matches_legacy(kernels, df)
+
+
+def test_nan_padding(kernels):
+    rng = np.random.default_rng(3)
+    frames = [make_candles(rng, int(rng.integers(150, 1500)), zero_volume=0.01 * (i % 2)) for i in range(6)]
+    width = max(len(f) for f in frames)
+    volume = np.full((len(frames), width), np.nan)
+    volatility = np.full((len(frames), width), np.nan)
+    for i, f in enumerate(frames):
+        volume[i, :len(f)], volatility[i, :len(f)] = f['volume'], f['volatility']
+
+    batch = fit(kernels, volume, volatility)
+    for i, f in enumerate(frames):
+        single = fit(kernels, f['volume'], f['volatility'])
+        for b, s in zip(batch, single):
+            np.testing.assert_allclose(np.asarray(b[i], dtype=float), np.asarray(s[0], dtype=float),
+                                       rtol=1e-12, equal_nan=True)
+
+
+def test_fewer_than_three_smart_bins(kernels):
+    rng = np.random.default_rng(4)
+    df = make_candles(rng, 500)
+    df['volume'] = rng.choice([10.0, 20.0, 30.0], len(df))
+    *_, n = fit(kernels, df['volume'], df['volatility'])
+    assert n[0] < 3
+    assert legacy_square_root_law(df) is None
+
+
+def test_empty_row(kernels):
+    edges, counts, log_q, log_i, alpha, *_ = fit(kernels, np.full(50, np.nan), np.zeros(50))
+    assert counts.sum() == 0
+    assert np.isnan(edges).all() and np.isnan(log_q).all() and np.isnan(alpha).all()
+
+
+def test_least_squares_skips_nan(kernels):
+    rng = np.random.default_rng(5)
+    x, y = rng.normal(size=(3, 20)), rng.normal(size=(3, 20))
+    x[:, ::4] = np.nan
+    slope, intercept, r2 = kernels.least_squares(x, y)
+    for r in range(3):
+        ok = ~np.isnan(x[r])
+        ref = stats.linregress(x[r][ok], y[r][ok])
+        assert slope[r] == pytest.approx(ref.slope, rel=1e-9)
+        assert intercept[r] == pytest.approx(ref.intercept, rel=1e-9)
+        assert r2[r] == pytest.approx(ref.rvalue ** 2, rel=1e-9)
+
+
+def test_residuals_and_zscores(kernels):
+    volume = np.array([100.0, 0.0, np.nan, 50.0, 10.0])
+    volatility = np.array([0.1, 0.2, 0.3, 0.0, 0.05])
+    with np.errstate(divide='ignore'):
+        expected = np.log(volatility) - (0.5 * np.log(volume) - 4.6)
+    expected[[1, 2, 3]] = np.nan
+    np.testing.assert_allclose(kernels.residuals(volume, volatility, 0.5, -4.6), expected, equal_nan=True)
+    np.testing.assert_allclose(kernels.zscores(volume, volatility, 0.5, -4.6, 0.4), expected / 0.4, equal_nan=True)
+
+
+def test_market_features(kernels):
+    rng = np.random.default_rng(6)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 1e-3, 300)))
+    close[[5, 50]] = np.nan
+    df = pd.DataFrame({'close': close, 'volume': rng.integers(0, 1000, 300).astype(float),
+                       'high': close + 1, 'low': close - 1})
+    df.loc[7, 'volume'] = np.nan
+    log_ret, log_vol, volatility = kernels.market_features(*(df[c].to_numpy(float) for c in ('close', 'volume', 'high', 'low')))
+    np.testing.assert_allclose(log_ret, np.log(df['close'] / df['close'].shift(1)).fillna(0))
+    np.testing.assert_allclose(log_vol, np.log(df['volume'] + 1).fillna(0))
+    np.testing.assert_allclose(volatility, df['high'] - df['low'], equal_nan=True)
+
+
+def test_backends_agree():
+    numpy_kernels, numba_kernels = load_backend("numpy"), _backend("numba")
+    rng = np.random.default_rng(7)
+    volume = np.ceil(rng.lognormal(5, 1.5, (20, 2000)))
+    volatility = 0.01 * volume ** 0.5 * rng.lognormal(0, 0.4, (20, 2000))
+    volatility[rng.random((20, 2000)) < 0.05] = 0.0
+    volume[rng.random((20, 2000)) < 0.01] = np.nan
+    volume[rng.random((20, 2000)) < 0.01] = 0.0
+    for a, b in zip(fit(numpy_kernels, volume, volatility), fit(numba_kernels, volume, volatility)):
+        np.testing.assert_allclose(np.asarray(a, dtype=float), np.asarray(b, dtype=float), rtol=1e-9, equal_nan=True)
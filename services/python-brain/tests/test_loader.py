@@ -0,0 +1,40 @@
+import asyncio
+import time
+
+import pytest
+
+pytest.importorskip("t_tech")
+
+from app.loader import TokenBucket
+
+
+async def timed_acquires(limiter, n):
+    started = time.monotonic()
+    await asyncio.gather(*(limiter.acquire() for _ in range(n)))
+    return time.monotonic() - started
+
+
+def test_burst_is_served_immediately():
+    limiter = TokenBucket(rate_per_min=60, capacity=5)
+    assert asyncio.run(timed_acquires(limiter, 5)) < 0.05
+
+
+def test_rate_limits_after_burst():
+    # 100 запросов в секунду, всплеск 5: еще 10 запросов ждут около 0.1 сек
+    limiter = TokenBucket(rate_per_min=6000, capacity=5)
+    elapsed = asyncio.run(timed_acquires(limiter, 15))
+    assert 0.09 <= elapsed < 0.5
+
+
+def test_tokens_refill_up_to_capacity():
+    async def scenario():
+        limiter = TokenBucket(rate_per_min=6000, capacity=3)
+        await timed_acquires(limiter, 3)
+        await asyncio.sleep(0.2)
+        # за паузу набежало бы 20 токенов, но копится не больше capacity
+        refilled = await timed_acquires(limiter, 3)
+        return limiter, refilled
+
+    limiter, refilled = asyncio.run(scenario())
+    assert refilled < 0.02
+    assert limiter.tokens < 1
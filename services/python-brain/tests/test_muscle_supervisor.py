@@ -0,0 +1,35 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("prometheus_client")
+pytest.importorskip("t_tech")
+
+from tests import muscle  # noqa: F401
+from supervisor import Supervisor
+
+KNOWN = {f"T{i:02d}": f"uid-{i}" for i in range(10)}
+
+
+async def resolve(tickers):
+    return {t: KNOWN[t] for t in tickers if t in KNOWN}
+
+
+async def connected(supervisor):
+    for shard in supervisor.shards:
+        shard.subscriptions.attach(resolve)
+
+
+def test_unknown_tickers_are_reported_and_not_placed():
+    supervisor = Supervisor(None, [], shards=2, max_per_shard=3)
+
+    async def scenario():
+        await connected(supervisor)
+        return await supervisor.add(["T00", "NOPE", "T01", "BAD", "T02"])
+
+    added, unknown = asyncio.run(scenario())
+    assert sorted(added) == ["T00", "T01", "T02"]
+    assert sorted(unknown) == ["BAD", "NOPE"]
+    assert sorted(supervisor.tickers()) == ["T00", "T01", "T02"]
+    assert all(supervisor.owner(t).id == shard for t, shard in added.items())
+    assert max(map(len, supervisor.shards)) - min(map(len, supervisor.shards)) <= 1
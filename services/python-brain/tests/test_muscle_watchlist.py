@@ -0,0 +1,79 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("prometheus_client")
+pytest.importorskip("t_tech")
+
+from tests import muscle  # noqa: F401
+from subscriptions import SubscriptionManager
+from main import handle_control, parse_tickers
+from supervisor import Supervisor
+
+KNOWN = {"SBER": "uid-sber", "GAZP": "uid-gazp", "LKOH": "uid-lkoh"}
+
+
+async def resolve(tickers):
+    return {t: KNOWN[t] for t in tickers if t in KNOWN}
+
+
+def drain(queue):
+    requests = []
+    while not queue.empty():
+        requests.append(queue.get_nowait())
+    return requests
+
+
+def test_tickers_added_offline_subscribe_on_attach():
+    manager = SubscriptionManager(["SBER"])
+
+    async def scenario():
+        assert await manager.add(["GAZP", "SBER"]) == ({}, [])
+        manager.attach(resolve)
+        return await manager.add(manager.tickers)
+
+    found, unknown = asyncio.run(scenario())
+    assert found == {"SBER": "uid-sber", "GAZP": "uid-gazp"} and unknown == []
+    assert manager.subscribed() == ["GAZP", "SBER"]
+    # одно сообщение Subscribe на всю пачку
+    assert len(drain(manager.requests)) == 1
+
+
+def test_add_and_remove_on_live_stream():
+    manager = SubscriptionManager([])
+    added = []
+
+    async def scenario():
+        manager.attach(resolve, added.append)
+        await manager.add(["SBER"])
+        await manager.add(["SBER", "LKOH", "NOPE"])
+        return await manager.remove(["SBER"])
+
+    removed = asyncio.run(scenario())
+    assert removed == ["SBER"]
+    assert manager.tickers == ["LKOH"] and manager.subscribed() == ["LKOH"]
+    assert added == [{"SBER": "uid-sber"}, {"LKOH": "uid-lkoh"}]
+    assert len(drain(manager.requests)) == 3
+
+
+def test_watchlist_control():
+    supervisor = Supervisor(None, ["SBER"], shards=1)
+
+    async def scenario():
+        for shard in supervisor.shards:
+            shard.subscriptions.attach(resolve)
+        post = await handle_control(supervisor, "POST", "/watchlist", {"tickers": ["gazp", "NOPE"]})
+        get = await handle_control(supervisor, "GET", "/watchlist", None)
+        delete = await handle_control(supervisor, "DELETE", "/watchlist/GAZP", None)
+        return post, get, delete
+
+    post, get, delete = asyncio.run(scenario())
+    assert post == (200, {"added": {"GAZP": 0}, "unknown": ["NOPE"]})
+    assert get[1]["tickers"] == ["SBER", "GAZP"]
+    assert delete == (200, {"removed": ["GAZP"]})
+
+
+@pytest.mark.parametrize("body", [None, {"tickers": "SBER"}, {"tickers": ["SB ER"]}, {"tickers": [1]}])
+def test_parse_tickers_rejects_bad_body(body):
+    with pytest.raises(ValueError):
+        parse_tickers(body)
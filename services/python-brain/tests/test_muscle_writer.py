@@ -0,0 +1,145 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+pytest.importorskip("prometheus_client")
+
+from tests import muscle  # noqa: F401
+from writer import CandleWriter
+
+T0 = datetime(2026, 1, 5, 7, 0, tzinfo=timezone.utc)
+
+
+def bar(minute, ticker="SBER", close=100.0):
+    return {"ticker": ticker, "time": T0 + timedelta(minutes=minute), "close": close}
+
+
+class FlakySave:
+    """save(rows), который падает первые failures вызовов."""
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.calls = 0
+        self.rows = []
+        self.batches = []
+
+    def __call__(self, rows):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise ConnectionError("db down")
+        self.rows.extend(rows)
+        self.batches.append(len(rows))
+
+
+async def write_all(writer, rows, pause=0.0):
+    task = asyncio.create_task(writer.run())
+    for row in rows:
+        await writer.write(row)
+        if pause:
+            await asyncio.sleep(pause)
+    await writer.close()
+    await task
+
+
+def make_writer(save, **kw):
+    kw.setdefault("flush_seconds", 0.01)
+    kw.setdefault("retry_seconds", 0.001)
+    kw.setdefault("open_bar_seconds", 1000)
+    return CandleWriter(save, **kw)
+
+
+def test_failed_save_is_retried():
+    save = FlakySave(failures=1)
+    writer = make_writer(save)
+    rows = [bar(i) for i in range(10)]
+    asyncio.run(write_all(writer, rows))
+    assert save.rows == rows
+    assert writer.stats["retries"] == 1
+    assert writer.stats["failed"] == 0
+
+
+def test_batch_deferred_after_retries_is_written_later():
+    save = FlakySave(failures=3)
+    writer = make_writer(save, retries=1, batch_size=5)
+    rows = [bar(i) for i in range(20)]
+    asyncio.run(write_all(writer, rows, pause=0.002))
+    assert sorted(r["time"] for r in save.rows) == [r["time"] for r in rows]
+    assert writer.stats["failed"] == 0
+
+
+def test_deferred_rows_are_bounded():
+    save = FlakySave(failures=10 ** 6)
+    writer = make_writer(save, retries=0, max_queue=8)
+    asyncio.run(write_all(writer, [bar(i) for i in range(30)], pause=0.002))
+    assert save.rows == []
+    # все строки учтены как потерянные, отложенных не больше max_queue
+    assert writer.stats["failed"] == 30
+
+
+def test_batches_respect_size_and_deadline():
+    save = FlakySave()
+    writer = make_writer(save, batch_size=10, flush_seconds=0.02)
+
+    async def scenario():
+        task = asyncio.create_task(writer.run())
+        for i in range(25):
+            await writer.write(bar(i))
+        await asyncio.sleep(0.1)
+        # одиночная строка уходит по дедлайну flush_seconds, не дожидаясь полной пачки
+        await writer.write(bar(25))
+        await asyncio.sleep(0.1)
+        written = len(save.rows)
+        await writer.close()
+        await task
+        return written
+
+    assert asyncio.run(scenario()) == 26
+    assert max(save.batches) <= 10
+    assert save.rows == [bar(i) for i in range(26)]
+
+
+def run_updates(writer, updates, pause=0.0):
+    async def scenario():
+        task = asyncio.create_task(writer.run())
+        for row in updates:
+            await writer.put(row)
+        if pause:
+            await asyncio.sleep(pause)
+        await writer.close()
+        await task
+    asyncio.run(scenario())
+
+
+def test_open_bar_updates_coalesce():
+    save, published = FlakySave(), []
+
+    async def publish(rows):
+        published.extend(rows)
+
+    writer = make_writer(save, publish=publish)
+    run_updates(writer, [bar(0, close=c) for c in (1.0, 2.0, 3.0)] + [bar(1, close=4.0), bar(1, close=5.0)])
+
+    # по строке на бар: последний снимок закрытого бара и незакрытый бар при остановке
+    assert save.rows == [bar(0, close=3.0), bar(1, close=5.0)]
+    assert published == [bar(0, close=3.0)]
+    assert writer.stats["received"] == 5 and writer.stats["queued"] == 2
+
+
+def test_late_update_of_closed_bar_is_written():
+    save = FlakySave()
+    writer = make_writer(save)
+    run_updates(writer, [bar(0), bar(1), bar(0, close=99.0)])
+    assert save.rows == [bar(0), bar(0, close=99.0), bar(1)]
+
+
+def test_open_bar_snapshot_by_timer():
+    save, published = FlakySave(), []
+
+    async def publish(rows):
+        published.extend(rows)
+
+    writer = make_writer(save, publish=publish, open_bar_seconds=0.02)
+    run_updates(writer, [bar(0, close=1.0), bar(0, close=2.0), bar(0, ticker="GAZP")], pause=0.1)
+    # снимок по таймеру пишется один раз, пока бар не меняется, и в шину не объявляется
+    assert sorted(save.rows, key=lambda r: r["ticker"]) == [bar(0, ticker="GAZP"), bar(0, close=2.0)]
+    assert published == []
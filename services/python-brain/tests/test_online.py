@@ -0,0 +1,94 @@
+import json
+import math
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.physics import (
+    OnlineSquareRootLaw, ZScoreScorer, calculate_square_root_law, calculate_deviations, closed_candles
+)
+from tests.legacy import make_candles
+
+
+def candles(seed, n, zero_volume=0.0):
+    df = make_candles(np.random.default_rng(seed), n, zero_volume=zero_volume)
+    df['time'] = pd.date_range('2024-01-01', periods=n, freq='min', tz='UTC')
+    df['close'] = 100.0
+    return df
+
+
+def test_from_frame_matches_batch_fit():
+    df = candles(0, 3000)
+    est = OnlineSquareRootLaw.from_frame(df)
+    assert est.result()['alpha'] == pytest.approx(calculate_square_root_law(df)['alpha'], rel=1e-9)
+
+
+def test_zero_volume_in_history():
+    df = candles(1, 3000, zero_volume=0.01)
+    res = OnlineSquareRootLaw.from_frame(df).result()
+    assert math.isfinite(res['resid_std'])
+    assert res['alpha'] == pytest.approx(calculate_square_root_law(df[df['volume'] > 0])['alpha'], rel=1e-9)
+
+
+def test_update_skips_zero_volume():
+    df = candles(2, 3000)
+    est = OnlineSquareRootLaw.from_frame(df.iloc[:2000])
+    for candle in df.iloc[2000:].to_dict('records'):
+        est.update(candle)
+    before = est.result()
+    assert not est.update({'time': df['time'].iloc[-1] + pd.Timedelta(minutes=1), 'volume': 0.0, 'volatility': 0.3})
+    assert est.result() == before
+    assert est.is_finite()
+
+
+def test_update_during_warmup_skips_zero_volume():
+    est = OnlineSquareRootLaw(warmup=500)
+    for candle in candles(3, 800, zero_volume=0.02).to_dict('records'):
+        est.update(candle)
+    assert est.is_finite() and est.edges is not None
+
+
+def test_state_round_trip():
+    est = OnlineSquareRootLaw.from_frame(candles(4, 2500))
+    restored = OnlineSquareRootLaw.from_dict(json.loads(json.dumps(est.to_dict(), allow_nan=False)))
+    assert restored.result() == est.result()
+
+
+def test_non_finite_state_is_refused():
+    est = OnlineSquareRootLaw.from_frame(candles(5, 2500))
+    state = est.to_dict()
+    state['moments'][4] = float('nan')
+    with pytest.raises(ValueError):
+        OnlineSquareRootLaw.from_dict(state)
+    est.m_ii = float('nan')
+    with pytest.raises(ValueError):
+        est.to_dict()
+
+
+def test_scorer_from_model_ignores_zero_volume():
+    df = candles(6, 3000, zero_volume=0.01)
+    model = calculate_square_root_law(df)
+    scorer = ZScoreScorer.from_model(model)
+    assert math.isfinite(scorer.resid_std)
+    dev = calculate_deviations(df, model)
+    np.testing.assert_allclose(scorer.score_many(dev['volume'], dev['volatility']), dev['z_score'], rtol=1e-9, equal_nan=True)
+
+
+def test_closed_candles_skips_forming_bar():
+    df = candles(7, 10)
+    now = df['time'].iloc[-1] + pd.Timedelta(seconds=30)
+    assert len(closed_candles(df, now=now)) == 9
+    assert len(closed_candles(df, now=now + pd.Timedelta(seconds=30))) == 10
+    assert closed_candles(df.iloc[:0]).empty
+
+
+def test_update_frame_feeds_only_new_candles():
+    df = candles(8, 3000)
+    est = OnlineSquareRootLaw.from_frame(df.iloc[:2000])
+    assert est.update_frame(df.iloc[:2500]) == 500
+    assert est.update_frame(df.iloc[:2500]) == 0
+    incremental = OnlineSquareRootLaw.from_frame(df.iloc[:2000])
+    for candle in df.iloc[2000:2500].to_dict('records'):
+        incremental.update(candle)
+    assert est.result() == incremental.result()
@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+
+from app.physics import calculate_square_root_law, square_root_law_batch, rolling_square_root_law
+from tests.legacy import legacy_square_root_law, make_candles
+
+
+def assert_same_fit(old, new):
+    if old is None or new is None:
+        assert old is None and new is None
+        return
+    assert new['alpha'] == pytest.approx(old['alpha'], rel=1e-9)
+    assert new['r2'] == pytest.approx(old['r2'], rel=1e-9)
+    np.testing.assert_allclose(new['params'], old['params'], rtol=1e-9)
+    np.testing.assert_allclose(new['binned_data'].to_numpy(), old['binned_data'].to_numpy(), rtol=1e-9)
+
+
+@pytest.mark.parametrize("seed", range(10))
+@pytest.mark.parametrize("discrete", [False, True])
+@pytest.mark.parametrize("zero_volume", [0.0, 0.01])
+def test_matches_legacy(seed, discrete, zero_volume):
+    rng = np.random.default_rng(seed)
+    df = make_candles(rng, int(rng.integers(50, 3000)), discrete=discrete, zero_volume=zero_volume)
+    assert_same_fit(legacy_square_root_law(df), calculate_square_root_law(df))
+
+
+def test_zero_volume_candles_keep_fit():
+    df = make_candles(np.random.default_rng(0), 2000, discrete=True)
+    df.loc[df.index[:20], 'volume'] = 0.0
+    old, new = legacy_square_root_law(df), calculate_square_root_law(df)
+    assert new is not None
+    assert_same_fit(old, new)
+
+
+def test_too_few_points():
+    df = make_candles(np.random.default_rng(1), 80)
+    assert legacy_square_root_law(df) is None
+    assert calculate_square_root_law(df) is None
+
+
+def test_too_few_smart_bins():
+    rng = np.random.default_rng(2)
+    df = make_candles(rng, 500)
+    df['volume'] = rng.choice([10.0, 20.0, 30.0], len(df))
+    assert legacy_square_root_law(df) is None
+    assert calculate_square_root_law(df) is None
+
+
+def test_nan_padded_batch_matches_rows():
+    rng = np.random.default_rng(3)
+    frames = [make_candles(rng, int(rng.integers(80, 2000)), zero_volume=0.01 * (i % 2)) for i in range(20)]
+    width = max(len(f) for f in frames)
+    volume = np.full((len(frames), width), np.nan)
+    volatility = np.full((len(frames), width), np.nan)
+    for i, f in enumerate(frames):
+        volume[i, :len(f)], volatility[i, :len(f)] = f['volume'], f['volatility']
+
+    batch = square_root_law_batch(volume, volatility)
+    for i, f in enumerate(frames):
+        old = legacy_square_root_law(f)
+        expected = np.nan if old is None else old['alpha']
+        assert batch['alpha'][i] == pytest.approx(expected, rel=1e-9, nan_ok=True)
+
+
+def test_rolling_matches_windows():
+    df = make_candles(np.random.default_rng(4), 3000, zero_volume=0.01)
+    rolling = rolling_square_root_law(df['volume'], df['volatility'], window=1000, step=250)
+    assert rolling['end'][-1] == len(df) - 1
+    for end, alpha in zip(rolling['end'], rolling['alpha']):
+        old = legacy_square_root_law(df.iloc[end - 999:end + 1])
+        assert alpha == pytest.approx(np.nan if old is None else old['alpha'], rel=1e-9, nan_ok=True)
@@ -0,0 +1,70 @@
+import os
+import json
+import asyncio
+import logging
+
+logger = logging.getLogger("Muscle")
+
+# redis://... или loopback:// (в пределах процесса); пусто - свечи никуда не публикуются
+BUS_URL = os.getenv("BUS_URL", os.getenv("REDIS_URL", ""))
+# Канал закрытых минутных свечей (его же слушает Brain)
+CANDLES_CHANNEL = "candles.closed"
+
+
+def encode_candle(row):
+    return json.dumps({**row, "time": row["time"].isoformat()})
+
+
+class LoopbackBus:
+    """Шина в пределах одного процесса: каждый подписчик получает свою asyncio-очередь."""
+    def __init__(self):
+        self._queues = {}
+
+    async def publish(self, channel, messages):
+        for queue in self._queues.get(channel, []):
+            for message in messages:
+                queue.put_nowait(message)
+
+    async def subscribe(self, channel):
+        queue = asyncio.Queue()
+        self._queues.setdefault(channel, []).append(queue)
+        return self._messages(channel, queue)
+
+    async def _messages(self, channel, queue):
+        try:
+            while True:
+                yield await queue.get()
+        finally:
+            self._queues[channel].remove(queue)
+
+
+class RedisBus:
+    def __init__(self, url):
+        import redis.asyncio as redis
+        self.client = redis.from_url(url)
+
+    async def publish(self, channel, messages):
+        async with self.client.pipeline(transaction=False) as pipe:
+            for message in messages:
+                pipe.publish(channel, message)
+            await pipe.execute()
+
+
+loopback = LoopbackBus()
+
+
+def make_bus(url=BUS_URL):
+    if not url:
+        return None
+    if url.startswith("loopback://"):
+        return loopback
+    if url.startswith(("redis://", "rediss://")):
+        return RedisBus(url)
+    raise ValueError(f"Неизвестная шина {url}")
+
+
+def candle_publisher(bus, channel=CANDLES_CHANNEL):
+    """publish(rows) для CandleWriter: одна пачка - один pipeline в Redis."""
+    async def publish(rows):
+        await bus.publish(channel, [encode_candle(r) for r in rows])
+    return publish
@@ -0,0 +1,101 @@
+import hmac
+import json
+import asyncio
+import logging
+
+logger = logging.getLogger("Muscle")
+
+STATUS_TEXT = {
+    200: "OK", 400: "Bad Request", 401: "Unauthorized", 404: "Not Found", 405: "Method Not Allowed",
+    413: "Payload Too Large", 500: "Internal Server Error",
+}
+# Больше тела запроса управлению не нужно: список тикеров - это килобайты
+MAX_BODY = 64 * 1024
+
+
+class PayloadTooLarge(Exception):
+    pass
+
+
+async def _read_request(reader):
+    request_line = (await reader.readline()).decode("latin-1").strip()
+    if not request_line:
+        return None
+    method, target, _ = request_line.split(" ", 2)
+
+    headers = {}
+    while True:
+        line = (await reader.readline()).decode("latin-1").strip()
+        if not line:
+            break
+        name, _, value = line.partition(":")
+        headers[name.strip().lower()] = value.strip()
+
+    body = b""
+    length = int(headers.get("content-length", 0))
+    if length > MAX_BODY:
+        raise PayloadTooLarge(length)
+    if length:
+        body = await reader.readexactly(length)
+    return method.upper(), target.split("?", 1)[0], headers, body
+
+
+def _authorized(headers, token):
+    if not token:
+        return True
+    scheme, _, value = headers.get("authorization", "").partition(" ")
+    return scheme.lower() == "bearer" and hmac.compare_digest(value.strip().encode(), token.encode())
+
+
+def _encode(status, payload, content_type=None):
+    if isinstance(payload, str):
+        content, content_type = payload.encode(), content_type or "text/plain; charset=utf-8"
+    else:
+        content, content_type = json.dumps(payload, ensure_ascii=False, default=str).encode(), "application/json"
+    head = (
+        f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}\r\n"
+        f"Content-Type: {content_type}\r\nContent-Length: {len(content)}\r\nConnection: close\r\n\r\n"
+    )
+    return head.encode() + content
+
+
+async def serve_control(handler, host="0.0.0.0", port=8010, token=None):
+    """
+    Минимальный HTTP-сервер управления без внешних зависимостей.
+    handler(method, path, body) -> (status, dict | str[, content_type]): словарь уходит как JSON,
+    строка - как text/plain или с переданным content_type.
+    Если задан token, каждый запрос должен нести заголовок Authorization: Bearer <token>, иначе 401.
+    """
+    async def on_connection(reader, writer):
+        try:
+            try:
+                request = await _read_request(reader)
+            except PayloadTooLarge as e:
+                writer.write(_encode(413, {"error": f"тело запроса больше {MAX_BODY} байт ({e})"}))
+                await writer.drain()
+                return
+            if request is None:
+                return
+            method, path, headers, body = request
+            if not _authorized(headers, token):
+                writer.write(_encode(401, {"error": "unauthorized"}))
+                await writer.drain()
+                return
+            try:
+                data = json.loads(body) if body else {}
+                status, payload, *content_type = await handler(method, path, data)
+            except (ValueError, KeyError) as e:
+                status, payload, content_type = 400, {"error": str(e)}, []
+            except Exception as e:
+                logger.error(f"Ошибка обработки {method} {path}: {e}")
+                status, payload, content_type = 500, {"error": str(e)}, []
+            writer.write(_encode(status, payload, *content_type))
+            await writer.drain()
+        except Exception as e:
+            logger.debug(f"Сбой соединения управления: {e}")
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(on_connection, host, port)
+    logger.info(f"Управление слушает {host}:{port}" + ("" if token else " без токена (CONTROL_TOKEN не задан)"))
+    return server
@@ -0,0 +1,182 @@
+import os
+import asyncio
+import logging
+import weakref
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import create_engine, table, column, text, select, func
+from sqlalchemy.dialects.postgresql import insert
+
+logger = logging.getLogger("Muscle")
+
+DATABASE_URL = os.getenv("DATABASE_URL")
+
+CANDLES = table(
+    "candles",
+    column("ticker"), column("time"),
+    column("open"), column("high"), column("low"), column("close"),
+    column("volume"), column("volatility"),
+)
+
+# Справочник инструментов (таблицу создает Brain)
+INSTRUMENTS = table(
+    "instruments",
+    column("ticker"), column("class_code"), column("uid"), column("figi"), column("name"),
+    column("lot"), column("min_price_increment"), column("updated_at"),
+)
+INSTRUMENTS_TTL = timedelta(seconds=int(os.getenv("INSTRUMENTS_TTL", str(24 * 3600))))
+# Акции основного режима и фьючерсы
+CLASS_CODES = ("TQBR", "SPBFUT")
+
+# Переживает переподключения: ticker -> uid
+uid_cache = {}
+uid_cache_updated = None
+# Шарды стартуют одновременно: справочник запрашивает только первый (замок на каждый event loop)
+_resolve_locks = weakref.WeakKeyDictionary()
+
+INSERT_QUERY = insert(CANDLES)
+INSERT_QUERY = INSERT_QUERY.on_conflict_do_update(
+    index_elements=["ticker", "time"],
+    set_={c: INSERT_QUERY.excluded[c] for c in ("open", "high", "low", "close", "volume", "volatility")}
+)
+
+# Производные таймфреймы (таблицы создает Brain): имя -> шаг date_bin
+AGGREGATE_INTERVALS = {"5m": "5 minutes", "15m": "15 minutes", "1h": "1 hour", "1d": "1 day"}
+
+# Один запрос на таймфрейм для всей пачки: диапазоны тикеров передаются массивами
+AGGREGATE_QUERIES = {
+    name: text(f"""
+        INSERT INTO candles_{name} (ticker, time, open, high, low, close, volume, volatility)
+        SELECT ticker, bucket,
+               (array_agg(open ORDER BY time))[1],
+               max(high), min(low),
+               (array_agg(close ORDER BY time DESC))[1],
+               sum(volume), max(high) - min(low)
+        FROM (
+            SELECT c.*, date_bin(INTERVAL '{step}', c.time, TIMESTAMP '2000-01-01') AS bucket
+            FROM candles c
+            JOIN unnest(CAST(:tickers AS text[]), CAST(:starts AS timestamp[]), CAST(:ends AS timestamp[]))
+                AS spans(ticker, span_start, span_end) ON c.ticker = spans.ticker
+            WHERE c.time >= date_bin(INTERVAL '{step}', spans.span_start, TIMESTAMP '2000-01-01')
+              AND c.time < date_bin(INTERVAL '{step}', spans.span_end, TIMESTAMP '2000-01-01') + INTERVAL '{step}'
+        ) AS minutes
+        GROUP BY ticker, bucket
+        ON CONFLICT (ticker, time) DO UPDATE SET
+            open = EXCLUDED.open, high = EXCLUDED.high, low = EXCLUDED.low, close = EXCLUDED.close,
+            volume = EXCLUDED.volume, volatility = EXCLUDED.volatility
+    """)
+    for name, step in AGGREGATE_INTERVALS.items()
+}
+
+def refresh_aggregates(conn, rows):
+    """Пересчитывает бары 5m/15m/1h/1d, задетые записанными минутками."""
+    spans = {}
+    for r in rows:
+        t = r["time"].astimezone(timezone.utc).replace(tzinfo=None)
+        lo, hi = spans.get(r["ticker"], (t, t))
+        spans[r["ticker"]] = (min(lo, t), max(hi, t))
+
+    params = {
+        "tickers": list(spans),
+        "starts": [lo for lo, _ in spans.values()],
+        "ends": [hi for _, hi in spans.values()],
+    }
+    for query in AGGREGATE_QUERIES.values():
+        conn.execute(query, params)
+
+def save_candles(engine, rows):
+    """
+    Пишет пачку свечей одним многострочным INSERT (последнее состояние бара побеждает)
+    и обновляет таймфреймы в той же транзакции.
+    """
+    # DO UPDATE не может задеть одну строку дважды за запрос: оставляем последний снимок бара
+    rows = list({(r["ticker"], r["time"]): r for r in rows}.values())
+    if not rows:
+        return
+    with engine.begin() as conn:
+        conn.execute(INSERT_QUERY, rows)
+        refresh_aggregates(conn, rows)
+
+def load_instruments(engine, tickers):
+    """Свежие записи справочника для тикеров: {ticker: uid}."""
+    fresh_after = datetime.now(timezone.utc).replace(tzinfo=None) - INSTRUMENTS_TTL
+    query = select(INSTRUMENTS.c.ticker, INSTRUMENTS.c.uid).where(
+        INSTRUMENTS.c.class_code.in_(CLASS_CODES),
+        INSTRUMENTS.c.ticker.in_(tickers),
+        INSTRUMENTS.c.updated_at >= fresh_after,
+    )
+    with engine.connect() as conn:
+        return {ticker: uid for ticker, uid in conn.execute(query)}
+
+def save_instruments(engine, instruments):
+    updated_at = datetime.now(timezone.utc).replace(tzinfo=None)
+    rows = [{
+        "ticker": s.ticker, "class_code": s.class_code, "uid": s.uid, "figi": s.figi, "name": s.name,
+        "lot": s.lot, "min_price_increment": s.min_price_increment.units + s.min_price_increment.nano / 1e9,
+        "updated_at": updated_at,
+    } for s in instruments]
+    if not rows:
+        return
+    stmt = insert(INSTRUMENTS)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["ticker", "class_code"],
+        set_={c: stmt.excluded[c] for c in ("uid", "figi", "name", "lot", "min_price_increment", "updated_at")}
+    )
+    with engine.begin() as conn:
+        conn.execute(stmt, rows)
+
+async def resolve_watchlist(engine, client, tickers):
+    """
+    {ticker: uid} для всего списка. Кэш процесса живет между переподключениями,
+    затем таблица instruments и только в крайнем случае запросы shares()/futures() на весь список.
+    """
+    lock = _resolve_locks.setdefault(asyncio.get_running_loop(), asyncio.Lock())
+    async with lock:
+        return await _resolve(engine, client, tickers)
+
+async def _resolve(engine, client, tickers):
+    global uid_cache_updated
+    current = datetime.now(timezone.utc)
+    if uid_cache_updated and current - uid_cache_updated < INSTRUMENTS_TTL and all(t in uid_cache for t in tickers):
+        return {t: uid_cache[t] for t in tickers}
+
+    try:
+        found = await asyncio.to_thread(load_instruments, engine, tickers)
+    except Exception as e:
+        logger.error(f"Справочник инструментов недоступен: {e}")
+        found = {}
+
+    # акции, а если чего-то не хватило - фьючерсы; по одному запросу на весь список
+    for method in ("shares", "futures"):
+        if len(found) >= len(tickers):
+            break
+        try:
+            resp = await getattr(client.instruments, method)()
+            instruments = [i for i in resp.instruments if i.class_code in CLASS_CODES]
+            # в кэш идет весь ответ: остальные шарды разрешатся без запросов
+            uid_cache.update({i.ticker: i.uid for i in instruments})
+            found.update({i.ticker: i.uid for i in instruments if i.ticker in tickers})
+            await asyncio.to_thread(save_instruments, engine, instruments)
+        except Exception as e:
+            logger.error(f"Ошибка запроса справочника ({method}): {e}")
+            found = {**{t: uid_cache[t] for t in tickers if t in uid_cache}, **found}
+
+    for ticker in tickers:
+        if ticker not in found:
+            logger.error(f"Не найден {ticker}")
+    uid_cache.update(found)
+    uid_cache_updated = current
+    return found
+
+def load_last_times(engine, tickers):
+    query = select(CANDLES.c.ticker, func.max(CANDLES.c.time)).where(
+        CANDLES.c.ticker.in_(tickers)
+    ).group_by(CANDLES.c.ticker)
+    with engine.connect() as conn:
+        return {ticker: last for ticker, last in conn.execute(query)}
+
+def get_db_engine():
+    if not DATABASE_URL:
+        logger.error("DATABASE_URL не задан!")
+        exit(1)
+    return create_engine(DATABASE_URL)
+
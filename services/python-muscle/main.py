@@ -1,134 +1,144 @@
 import os
+import re
 import asyncio
 import logging
+import multiprocessing
 import time
-import traceback
-from sqlalchemy import create_engine, text
-from t_tech.invest import AsyncClient, CandleInterval, MarketDataRequest, SubscribeCandlesRequest, SubscriptionAction
+from db import get_db_engine
+from control import serve_control
+import metrics
+from supervisor import Supervisor, backoff_delay, STABLE_SECONDS
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s [MUSCLE] %(message)s")
 logger = logging.getLogger("Muscle")
 
 TOKEN = os.getenv("T_BANK_TOKEN")
-DATABASE_URL = os.getenv("DATABASE_URL")
-WATCHLIST = ["SELG", "SBER", "FLOT", "KMAZ", "VTBR"]
-
-INSERT_QUERY = text("""
-    INSERT INTO candles (ticker, time, open, high, low, close, volume, volatility)
-    VALUES (:ticker, :time, :open, :high, :low, :close, :volume, :volatility)
-    ON CONFLICT (ticker, time) DO NOTHING
-""")
-
-def get_db_engine():
-    if not DATABASE_URL:
-        logger.error("DATABASE_URL не задан!")
-        exit(1)
-    return create_engine(DATABASE_URL)
-
-async def main():
+WATCHLIST = [t.strip() for t in os.getenv("WATCHLIST", "SELG,SBER,FLOT,KMAZ,VTBR").split(",") if t.strip()]
+# Порт управления; в режиме процессов i-й процесс слушает CONTROL_PORT + i
+CONTROL_PORT = int(os.getenv("CONTROL_PORT", "8010"))
+# Если задан, запросы к управлению требуют заголовок Authorization: Bearer <CONTROL_TOKEN>
+CONTROL_TOKEN = os.getenv("CONTROL_TOKEN") or None
+# Сколько тикеров можно добавить одним POST /watchlist
+MAX_WATCHLIST_CHANGE = int(os.getenv("MAX_WATCHLIST_CHANGE", "500"))
+# Больше 1 - шарды разносятся по отдельным процессам, список делится между ними поровну
+STREAM_PROCESSES = int(os.getenv("STREAM_PROCESSES", "1"))
+
+TICKER_RE = re.compile(r"^[A-Z0-9._@-]{1,32}$")
+
+
+def parse_ticker(value):
+    ticker = value.strip().upper() if isinstance(value, str) else ""
+    if not TICKER_RE.match(ticker):
+        raise ValueError(f"некорректный тикер: {value!r}")
+    return ticker
+
+
+def parse_tickers(body):
+    """Поле tickers тела POST /watchlist: список строк не длиннее MAX_WATCHLIST_CHANGE."""
+    tickers = body.get("tickers") if isinstance(body, dict) else None
+    if not isinstance(tickers, list):
+        raise ValueError("tickers: ожидается список строк")
+    if len(tickers) > MAX_WATCHLIST_CHANGE:
+        raise ValueError(f"tickers: не больше {MAX_WATCHLIST_CHANGE} за запрос, получено {len(tickers)}")
+    return [parse_ticker(t) for t in tickers]
+
+async def handle_control(supervisor, method, path, body):
+    """GET/POST /watchlist, DELETE /watchlist/<TICKER>, GET /health, GET /metrics (Prometheus)."""
+    if path == "/watchlist":
+        if method == "GET":
+            return 200, {
+                "tickers": supervisor.tickers(),
+                "shards": {s.id: s.subscriptions.tickers for s in supervisor.shards},
+            }
+        if method == "POST":
+            added, unknown = await supervisor.add(parse_tickers(body))
+            return 200, {"added": added, "unknown": unknown}
+        return 405, {"error": "method not allowed"}
+
+    if path.startswith("/watchlist/"):
+        if method == "DELETE":
+            removed = await supervisor.remove([parse_ticker(path.rsplit("/", 1)[1])])
+            return 200, {"removed": removed}
+        return 405, {"error": "method not allowed"}
+
+    if path == "/health" and method == "GET":
+        return 200, supervisor.health()
+
+    if path == "/metrics" and method == "GET":
+        return 200, metrics.render(), metrics.CONTENT_TYPE
+
+    return 404, {"error": "not found"}
+
+async def main(tickers=WATCHLIST, control_port=CONTROL_PORT):
     if not TOKEN:
         logger.error("T_BANK_TOKEN не задан!")
         return
 
     engine = get_db_engine()
-    
-    grpc_options = [
-        ('grpc.keepalive_time_ms', 15000),
-        ('grpc.keepalive_timeout_ms', 5000),
-        ('grpc.keepalive_permit_without_calls', 1),
-        ('grpc.http2.max_pings_without_data', 0),
-    ]
-
-    async with AsyncClient(TOKEN, options=grpc_options) as client:
-        logger.info("🔌 Подключение к T-Bank API...")
-
-        uid_map = {} 
-        uids_to_subscribe = []
-
-        for ticker in WATCHLIST:
-            try:
-                resp = await client.instruments.find_instrument(query=ticker)
-                for item in resp.instruments:
-                    if item.class_code == 'TQBR':
-                        uid_map[item.uid] = ticker
-                        uids_to_subscribe.append(item.uid)
-                        logger.info(f"Найден {ticker}: {item.uid}")
-                        break
-            except Exception as e:
-                logger.error(f"Не найден {ticker}: {e}")
-
-        if not uids_to_subscribe:
-            logger.error("Не на что подписываться. Выход.")
-            return
-
-        async def request_iterator():
-            yield MarketDataRequest(
-                subscribe_candles_request=SubscribeCandlesRequest(
-                    subscription_action=SubscriptionAction.SUBSCRIPTION_ACTION_SUBSCRIBE,
-                    instruments=[
-                        {"instrument_id": uid, "interval": CandleInterval.CANDLE_INTERVAL_1_MIN}
-                        for uid in uids_to_subscribe
-                    ],
-                    waiting_close=False
-                )
-            )
-            while True:
-                await asyncio.sleep(60)
-
-        logger.info("Подписываемся на поток свечей...")
-
-        market_data_stream = client.market_data_stream.market_data_stream(request_iterator())
-
-        logger.info("Muscle запущен! Слушаем рынок...")
-
-        try:
-            async for marketdata in market_data_stream:
-                if marketdata.candle:
-                    c = marketdata.candle
-                    uid = c.instrument_uid
-                    
-                    if uid not in uid_map:
-                        continue
-
-                    ticker = uid_map[uid]
-                    
-                    def cast(q): return q.units + q.nano / 1e9
-                    
-                    open_p = cast(c.open)
-                    high_p = cast(c.high)
-                    low_p = cast(c.low)
-                    close_p = cast(c.close)
-                    volatility = high_p - low_p
-                    
-                    try:
-                        with engine.begin() as conn:
-                            conn.execute(INSERT_QUERY, {
-                                "ticker": ticker,
-                                "time": c.time,
-                                "open": open_p,
-                                "high": high_p,
-                                "low": low_p,
-                                "close": close_p,
-                                "volume": c.volume,
-                                "volatility": volatility
-                            })
-                        logger.info(f"{ticker} | {c.time.strftime('%H:%M')} | P: {close_p} | Vol: {c.volume}")
-                    except Exception as e:
-                        logger.error(f"Ошибка БД: {e}")
-
-                if marketdata.ping:
-                    logger.debug("Ping received")
-
-        except Exception as e:
-             logger.warning(f"Разрыв соединения: {e}")
-
-if __name__ == "__main__":
+    supervisor = Supervisor(engine, tickers)
+    logger.info(f"🔌 {len(supervisor.tickers())} тикеров на {len(supervisor.shards)} соединениях")
+
+    try:
+        control = await serve_control(
+            lambda m, p, b: handle_control(supervisor, m, p, b), port=control_port, token=CONTROL_TOKEN
+        )
+    except OSError as e:
+        logger.error(f"Управление недоступно: {e}")
+        control = None
+
+    try:
+        await supervisor.run()
+    finally:
+        if control:
+            control.close()
+
+def run_forever(tickers=WATCHLIST, control_port=CONTROL_PORT):
     while True:
         try:
-            asyncio.run(main())
+            asyncio.run(main(tickers, control_port))
         except KeyboardInterrupt:
             logger.info("Остановка сервиса...")
             break
         except Exception as e:
             logger.error(f"Критическая ошибка: {e}. Рестарт через 5 сек...")
-            time.sleep(5)
\ No newline at end of file
+            time.sleep(5)
+
+def run_processes(count):
+    """Делит список между count процессами и перезапускает упавшие с нарастающей задержкой."""
+    slices = [WATCHLIST[i::count] for i in range(count)]
+    procs, started = {}, {}
+    attempts, next_start = [0] * count, [0.0] * count
+
+    try:
+        while True:
+            for i in range(count):
+                proc = procs.get(i)
+                if proc is not None and proc.is_alive():
+                    continue
+                if proc is not None and not next_start[i]:
+                    if time.monotonic() - started[i] > STABLE_SECONDS:
+                        attempts[i] = 0
+                    delay = backoff_delay(attempts[i])
+                    attempts[i] += 1
+                    next_start[i] = time.monotonic() + delay
+                    logger.warning(f"Процесс {i} завершился (код {proc.exitcode}). Рестарт через {delay:.1f} сек")
+                if time.monotonic() < next_start[i]:
+                    continue
+
+                procs[i] = multiprocessing.Process(
+                    target=run_forever, args=(slices[i], CONTROL_PORT + i), name=f"muscle-{i}", daemon=True
+                )
+                procs[i].start()
+                started[i], next_start[i] = time.monotonic(), 0.0
+                logger.info(f"Процесс {i}: {len(slices[i])} тикеров, управление на порту {CONTROL_PORT + i}")
+            time.sleep(1)
+    except KeyboardInterrupt:
+        logger.info("Остановка сервиса...")
+        for proc in procs.values():
+            proc.terminate()
+
+if __name__ == "__main__":
+    if STREAM_PROCESSES > 1:
+        run_processes(STREAM_PROCESSES)
+    else:
+        run_forever()
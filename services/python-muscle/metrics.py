@@ -0,0 +1,55 @@
+import time
+
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+
+CONTENT_TYPE = CONTENT_TYPE_LATEST
+
+# Задержки от долей миллисекунды (запись) до минут (отставание зависшего потока)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+STREAM_MESSAGES = Counter("muscle_stream_messages_total", "Сообщения стрима (включая ping)", ["shard"])
+CANDLE_UPDATES = Counter("muscle_candle_updates_total", "Обновления свечей из стрима", ["ticker"])
+RECONNECTS = Counter("muscle_reconnects_total", "Переподключения шарда", ["shard"])
+LAST_MESSAGE = Gauge("muscle_last_message_timestamp_seconds", "Unix-время последнего обновления свечи", ["ticker"])
+SINCE_LAST_MESSAGE = Gauge("muscle_seconds_since_last_message", "Секунд с последнего обновления свечи", ["ticker"])
+
+EXCHANGE_LAG = Histogram(
+    "muscle_exchange_lag_seconds", "От последней сделки в свече до получения обновления", buckets=LATENCY_BUCKETS
+)
+COMMIT_LATENCY = Histogram(
+    "muscle_commit_latency_seconds",
+    "От закрытия минутного бара (для снимков и запоздавших обновлений - от их получения) до коммита в БД",
+    buckets=LATENCY_BUCKETS,
+)
+QUEUE_LATENCY = Histogram(
+    "muscle_queue_commit_latency_seconds", "От постановки бара в очередь записи до коммита в БД", buckets=LATENCY_BUCKETS
+)
+BATCH_SIZE = Histogram(
+    "muscle_write_batch_rows", "Строк в пачке записи", buckets=(1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+)
+BATCH_DURATION = Histogram("muscle_write_batch_seconds", "Длительность записи пачки", buckets=LATENCY_BUCKETS)
+WRITE_FAILED = Counter("muscle_write_failed_rows_total", "Строки, которые не удалось записать")
+PUBLISHED = Counter("muscle_published_candles_total", "Закрытые свечи, объявленные в шину")
+QUEUE_DEPTH = Gauge("muscle_write_queue_depth", "Глубина очереди записи")
+BACKPRESSURE = Counter("muscle_backpressure_waits_total", "Ожидания свободного места в очереди записи")
+
+_last_seen = {}
+
+
+def observe_candle(ticker, candle, received):
+    """Учитывает обновление свечи: счетчик тикера, время последнего сообщения и отставание от биржи."""
+    CANDLE_UPDATES.labels(ticker).inc()
+    LAST_MESSAGE.labels(ticker).set(received)
+    _last_seen[ticker] = received
+
+    last_trade = getattr(candle, "last_trade_ts", None)
+    if last_trade:
+        EXCHANGE_LAG.observe(max(0.0, received - last_trade.timestamp()))
+
+
+def render():
+    """Текст для GET /metrics; возраст последнего сообщения пересчитывается на момент запроса."""
+    current = time.time()
+    for ticker, seen in _last_seen.items():
+        SINCE_LAST_MESSAGE.labels(ticker).set(current - seen)
+    return generate_latest().decode()
@@ -0,0 +1,102 @@
+import asyncio
+import logging
+
+from t_tech.invest import CandleInterval, MarketDataRequest, SubscribeCandlesRequest, SubscriptionAction
+
+logger = logging.getLogger("Muscle")
+
+
+def _candles_request(action, uids):
+    return MarketDataRequest(
+        subscribe_candles_request=SubscribeCandlesRequest(
+            subscription_action=action,
+            instruments=[
+                {"instrument_id": uid, "interval": CandleInterval.CANDLE_INTERVAL_1_MIN}
+                for uid in uids
+            ],
+            waiting_close=False
+        )
+    )
+
+
+class SubscriptionManager:
+    """
+    Список наблюдения и живой канал подписок поверх одного стрима.
+    add()/remove() кладут Subscribe/Unsubscribe в очередь, которую вычитывает
+    request_iterator(), поэтому стрим не пересоздается. Список тикеров переживает
+    переподключения, карта uid -> тикер и очередь заводятся заново в attach().
+    """
+    def __init__(self, tickers):
+        self.tickers = list(dict.fromkeys(tickers))
+        self.uid_map = {}
+        self.requests = None
+        self.resolve = None
+        self.on_added = None
+
+    def attach(self, resolve, on_added=None):
+        """
+        Новое соединение. resolve(tickers) -> {ticker: uid} (корутина),
+        on_added({ticker: uid}) вызывается для только что подписанных тикеров.
+        """
+        self.uid_map = {}
+        self.requests = asyncio.Queue()
+        self.resolve = resolve
+        self.on_added = on_added
+
+    def detach(self):
+        """Соединение потеряно: подписки кончились, список тикеров остается."""
+        self.uid_map = {}
+        self.requests = None
+
+    def subscribed(self) -> list:
+        return sorted(self.uid_map.values())
+
+    async def add(self, tickers) -> tuple:
+        """
+        Подписывает новые тикеры. Возвращает ({ticker: uid}, [неизвестные тикеры]).
+        Неизвестные тикеры убираются из списка наблюдения, чтобы не занимать место в шарде.
+        """
+        if self.requests is None:
+            # нет соединения: тикеры подпишутся (или отсеются) при следующем attach
+            self.tickers.extend(t for t in dict.fromkeys(tickers) if t not in self.tickers)
+            return {}, []
+
+        known = set(self.uid_map.values())
+        new = [t for t in dict.fromkeys(tickers) if t not in known]
+        if not new:
+            return {}, []
+
+        found = await self.resolve(new)
+        for ticker, uid in found.items():
+            self.uid_map[uid] = ticker
+            if ticker not in self.tickers:
+                self.tickers.append(ticker)
+
+        unknown = [t for t in new if t not in found]
+        if unknown:
+            self.tickers = [t for t in self.tickers if t not in unknown]
+            logger.warning(f"Не найдены инструменты: {unknown}")
+
+        if found:
+            await self.requests.put(_candles_request(SubscriptionAction.SUBSCRIPTION_ACTION_SUBSCRIBE, found.values()))
+            logger.info(f"Подписка: {sorted(found)}")
+            if self.on_added:
+                self.on_added(found)
+        return found, unknown
+
+    async def remove(self, tickers) -> list:
+        removed = [t for t in self.tickers if t in tickers]
+        self.tickers = [t for t in self.tickers if t not in tickers]
+        uids = [uid for uid, ticker in self.uid_map.items() if ticker in tickers]
+        for uid in uids:
+            del self.uid_map[uid]
+
+        if uids and self.requests is not None:
+            await self.requests.put(_candles_request(SubscriptionAction.SUBSCRIPTION_ACTION_UNSUBSCRIBE, uids))
+            logger.info(f"Отписка: {sorted(removed)}")
+        return removed
+
+    async def request_iterator(self):
+        requests = self.requests
+        while True:
+            yield await requests.get()
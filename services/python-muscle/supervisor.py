@@ -0,0 +1,310 @@
+import os
+import time
+import random
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from t_tech.invest import AsyncClient, CandleInterval
+
+from db import save_candles, resolve_watchlist, load_last_times
+from writer import CandleWriter
+from bus import make_bus, candle_publisher
+from subscriptions import SubscriptionManager
+import metrics
+
+logger = logging.getLogger("Muscle")
+
+TOKEN = os.getenv("T_BANK_TOKEN")
+# Сколько соединений market_data_stream держать и сколько тикеров на одном (лимит подписок брокера - 300)
+STREAM_SHARDS = int(os.getenv("STREAM_SHARDS", "1"))
+MAX_PER_SHARD = int(os.getenv("MAX_PER_SHARD", "300"))
+# Глубина короткой докачки для новых тикеров и после переподключения
+BACKFILL_DAYS = int(os.getenv("BACKFILL_DAYS", "3"))
+# Шард, проработавший дольше этого, после разрыва переподключается без накопленной задержки
+STABLE_SECONDS = 300
+HEALTH_INTERVAL = 60
+
+GRPC_OPTIONS = [
+    ('grpc.keepalive_time_ms', 15000),
+    ('grpc.keepalive_timeout_ms', 5000),
+    ('grpc.keepalive_permit_without_calls', 1),
+    ('grpc.http2.max_pings_without_data', 0),
+]
+
+
+def cast(q): return q.units + q.nano / 1e9
+
+def candle_to_row(ticker, c):
+    high_p, low_p = cast(c.high), cast(c.low)
+    return {
+        "ticker": ticker,
+        "time": c.time,
+        "open": cast(c.open),
+        "high": high_p,
+        "low": low_p,
+        "close": cast(c.close),
+        "volume": c.volume,
+        "volatility": high_p - low_p
+    }
+
+def backoff_delay(attempt, base_delay=1.0, max_delay=60.0):
+    """Экспоненциальная задержка с full jitter, чтобы шарды не переподключались хором."""
+    return random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+
+async def backfill(client, engine, writer, ticker_uids):
+    """
+    Короткая докачка минуток с последней свечи в БД (но не глубже BACKFILL_DAYS)
+    до начала текущей минуты. Закрывает дыру после переподключения и дает историю новым тикерам.
+    """
+    end = datetime.now(timezone.utc).replace(second=0, microsecond=0)
+    last_times = await asyncio.to_thread(load_last_times, engine, list(ticker_uids))
+
+    for ticker, uid in ticker_uids.items():
+        start = end - timedelta(days=BACKFILL_DAYS)
+        if last_times.get(ticker):
+            start = max(start, last_times[ticker].replace(tzinfo=timezone.utc) + timedelta(minutes=1))
+
+        count = 0
+        while start < end:
+            window_end = min(start + timedelta(days=1), end)
+            try:
+                resp = await client.market_data.get_candles(
+                    instrument_id=uid, from_=start, to=window_end,
+                    interval=CandleInterval.CANDLE_INTERVAL_1_MIN,
+                )
+            except Exception as e:
+                logger.error(f"{ticker}: докачка прервана: {e}")
+                break
+            for c in resp.candles:
+                await writer.write(candle_to_row(ticker, c))
+            count += len(resp.candles)
+            start = window_end
+
+        if count:
+            logger.info(f"{ticker}: докачано {count} свечей")
+
+
+class Shard:
+    """
+    Одно соединение market_data_stream со своей частью списка наблюдения.
+    Падает и переподключается независимо от остальных, с собственным backoff.
+    """
+    def __init__(self, shard_id, engine, writer, tickers=()):
+        self.id = shard_id
+        self.engine = engine
+        self.writer = writer
+        self.subscriptions = SubscriptionManager(tickers)
+        self.status = "idle"
+        self.restarts = 0
+        self.messages = 0
+        self.candles = 0
+        self.last_message = None
+        self.last_error = None
+        self._wake = asyncio.Event()
+
+    def __len__(self):
+        return len(self.subscriptions.tickers)
+
+    async def add(self, tickers) -> list:
+        """Возвращает тикеры, которые не удалось найти: в шард они не попадают."""
+        _, unknown = await self.subscriptions.add(tickers)
+        self._wake.set()
+        return unknown
+
+    async def remove(self, tickers):
+        return await self.subscriptions.remove(tickers)
+
+    def health(self) -> dict:
+        return {
+            "shard": self.id,
+            "status": self.status,
+            "tickers": len(self),
+            "subscribed": len(self.subscriptions.uid_map),
+            "restarts": self.restarts,
+            "messages": self.messages,
+            "candles": self.candles,
+            "last_message_age": round(time.time() - self.last_message, 1) if self.last_message else None,
+            "last_error": self.last_error,
+        }
+
+    async def _stream(self):
+        async with AsyncClient(TOKEN, options=GRPC_OPTIONS) as client:
+            self.status = "connecting"
+            backfills = set()
+
+            def on_added(ticker_uids):
+                task = asyncio.create_task(backfill(client, self.engine, self.writer, ticker_uids))
+                backfills.add(task)
+                task.add_done_callback(backfills.discard)
+
+            self.subscriptions.attach(lambda tickers: resolve_watchlist(self.engine, client, tickers), on_added)
+            try:
+                await self.subscriptions.add(self.subscriptions.tickers)
+                stream = client.market_data_stream.market_data_stream(self.subscriptions.request_iterator())
+                self.status = "streaming"
+                logger.info(f"Шард {self.id}: слушаем {len(self.subscriptions.uid_map)} инструментов")
+
+                stream_messages = metrics.STREAM_MESSAGES.labels(self.id)
+                async for marketdata in stream:
+                    self.messages += 1
+                    self.last_message = time.time()
+                    stream_messages.inc()
+                    if marketdata.candle:
+                        c = marketdata.candle
+                        ticker = self.subscriptions.uid_map.get(c.instrument_uid)
+                        if ticker is None:
+                            continue
+                        self.candles += 1
+                        metrics.observe_candle(ticker, c, self.last_message)
+                        await self.writer.put(candle_to_row(ticker, c), self.last_message)
+                        logger.debug(f"{ticker} | {c.time.strftime('%H:%M')} | Vol: {c.volume}")
+            finally:
+                self.subscriptions.detach()
+                for task in list(backfills):
+                    task.cancel()
+
+    async def run(self):
+        attempt = 0
+        while True:
+            while not len(self):
+                self.status = "idle"
+                self._wake.clear()
+                await self._wake.wait()
+
+            started = time.monotonic()
+            try:
+                await self._stream()
+                reason = "стрим закрыт сервером"
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                reason = str(e) or type(e).__name__
+            self.last_error = reason
+
+            if time.monotonic() - started > STABLE_SECONDS:
+                attempt = 0
+            delay = backoff_delay(attempt)
+            attempt += 1
+            self.restarts += 1
+            metrics.RECONNECTS.labels(self.id).inc()
+            self.status = "backoff"
+            logger.warning(f"Шард {self.id}: {reason}. Переподключение через {delay:.1f} сек")
+            await asyncio.sleep(delay)
+
+
+class Supervisor:
+    """
+    Раскладывает список наблюдения по K шардам (соединениям) и следит за ними.
+    Новые тикеры идут в наименее загруженный шард; если все заполнены до
+    max_per_shard, заводится еще один. После удаления тикеров шарды выравниваются.
+    Все шарды процесса пишут через общий CandleWriter.
+    """
+    def __init__(self, engine, tickers, shards=STREAM_SHARDS, max_per_shard=MAX_PER_SHARD):
+        self.engine = engine
+        self.max_per_shard = max_per_shard
+        bus = make_bus()
+        self.writer = CandleWriter(
+            lambda rows: save_candles(engine, rows), publish=candle_publisher(bus) if bus else None
+        )
+        count = max(shards, -(-len(tickers) // max_per_shard), 1)
+        self.shards = [Shard(i, engine, self.writer) for i in range(count)]
+        self._tasks = []
+        self._running = False
+        for shard, group in self._place(tickers).items():
+            shard.subscriptions.tickers.extend(group)
+
+    def tickers(self) -> list:
+        return [t for shard in self.shards for t in shard.subscriptions.tickers]
+
+    def owner(self, ticker):
+        return next((s for s in self.shards if ticker in s.subscriptions.tickers), None)
+
+    def _start(self, shard):
+        self._tasks.append(asyncio.create_task(shard.run()))
+
+    def _new_shard(self):
+        shard = Shard(len(self.shards), self.engine, self.writer)
+        self.shards.append(shard)
+        if self._running:
+            self._start(shard)
+        logger.info(f"Открываем шард {shard.id}")
+        return shard
+
+    def _place(self, tickers) -> dict:
+        """Раскладывает еще не размещенные тикеры по наименее загруженным шардам: {shard: [tickers]}."""
+        load = {shard: len(shard) for shard in self.shards}
+        groups = {}
+        for ticker in dict.fromkeys(tickers):
+            if self.owner(ticker) is not None:
+                continue
+            shard = min(load, key=load.get)
+            if load[shard] >= self.max_per_shard:
+                shard = self._new_shard()
+                load[shard] = 0
+            groups.setdefault(shard, []).append(ticker)
+            load[shard] += 1
+        return groups
+
+    async def add(self, tickers) -> tuple:
+        """
+        Подписывает новые тикеры, по одному сообщению на шард.
+        Возвращает ({ticker: номер шарда}, [неизвестные тикеры]). Неизвестные тикеры
+        шард не держит, поэтому после них нагрузка шардов выравнивается заново.
+        """
+        placement, unknown = {}, []
+        for shard, group in self._place(tickers).items():
+            missing = await shard.add(group)
+            unknown += missing
+            placement.update(dict.fromkeys((t for t in group if t not in missing), shard.id))
+        if unknown:
+            await self.rebalance()
+            placement = {t: self.owner(t).id for t in placement}
+        return placement, unknown
+
+    async def remove(self, tickers) -> list:
+        removed = []
+        for shard in self.shards:
+            removed += await shard.remove(tickers)
+        await self.rebalance()
+        return removed
+
+    async def rebalance(self):
+        """Переносит тикеры из самых загруженных шардов, пока разница больше одного."""
+        while True:
+            fullest = max(self.shards, key=len)
+            emptiest = min(self.shards, key=len)
+            if len(fullest) - len(emptiest) <= 1:
+                return
+            ticker = fullest.subscriptions.tickers[-1]
+            await fullest.remove([ticker])
+            await emptiest.add([ticker])
+            logger.info(f"{ticker}: шард {fullest.id} -> {emptiest.id}")
+
+    def health(self) -> dict:
+        return {
+            "shards": [shard.health() for shard in self.shards],
+            "writer": {**self.writer.stats, "queue": self.writer.queue.qsize()},
+        }
+
+    async def _report(self):
+        while True:
+            await asyncio.sleep(HEALTH_INTERVAL)
+            for h in self.health()["shards"]:
+                logger.info(
+                    f"Шард {h['shard']}: {h['status']}, тикеров {h['tickers']} (подписано {h['subscribed']}), "
+                    f"свечей {h['candles']}, рестартов {h['restarts']}, тишина {h['last_message_age']} сек"
+                )
+
+    async def run(self):
+        self._running = True
+        writer_task = asyncio.create_task(self.writer.run())
+        report_task = asyncio.create_task(self._report())
+        for shard in self.shards:
+            self._start(shard)
+        try:
+            await asyncio.gather(*self._tasks)
+        finally:
+            for task in self._tasks + [report_task]:
+                task.cancel()
+            await self.writer.close()
+            await writer_task
@@ -0,0 +1,270 @@
+import os
+import time
+import asyncio
+import logging
+
+import metrics
+
+logger = logging.getLogger("Muscle")
+
+WRITE_BATCH_SIZE = int(os.getenv("WRITE_BATCH_SIZE", "500"))
+WRITE_FLUSH_SECONDS = float(os.getenv("WRITE_FLUSH_SECONDS", "1.0"))
+WRITE_QUEUE_SIZE = int(os.getenv("WRITE_QUEUE_SIZE", "20000"))
+# Повторы записи пачки при ошибке БД: число и первая задержка (дальше удваивается, не больше 30 сек)
+WRITE_RETRIES = int(os.getenv("WRITE_RETRIES", "5"))
+WRITE_RETRY_SECONDS = float(os.getenv("WRITE_RETRY_SECONDS", "0.5"))
+MAX_RETRY_DELAY = 30.0
+# Как часто незакрытые бары сбрасываются в БД, не дожидаясь закрытия
+OPEN_BAR_FLUSH_SECONDS = float(os.getenv("OPEN_BAR_FLUSH_SECONDS", "15"))
+STATS_INTERVAL = 60
+
+BAR_SECONDS = 60
+
+_STOP = object()
+
+
+class OpenBars:
+    """
+    Незакрытые минутные бары по тикерам.
+    С waiting_close=False каждое обновление несет полный снимок бара, поэтому
+    обновления одного бара просто замещают друг друга (побеждает последнее).
+    Наружу бар отдается при закрытии (пришла следующая минута) или по таймеру.
+    """
+    def __init__(self):
+        self.bars = {}
+        self.dirty = set()
+
+    def update(self, row) -> list:
+        """Принимает обновление и возвращает бары, которые пора записать."""
+        ticker = row["ticker"]
+        current = self.bars.get(ticker)
+
+        if current is None or row["time"] > current["time"]:
+            # закрытый бар отдается всегда, даже если таймер уже записал этот снимок: о закрытии надо объявить
+            closed = [current] if current is not None else []
+            self.bars[ticker] = row
+            self.dirty.add(ticker)
+            return closed
+        if row["time"] == current["time"]:
+            self.bars[ticker] = row
+            self.dirty.add(ticker)
+            return []
+        # запоздавшее обновление уже закрытого бара пишется как есть
+        return [row]
+
+    def take_dirty(self) -> list:
+        """Снимки всех баров, изменившихся с прошлого сброса."""
+        rows = [self.bars[t] for t in self.dirty]
+        self.dirty.clear()
+        return rows
+
+
+class CandleWriter:
+    """
+    Очередь между потоком котировок и БД.
+    Поток кладет обновления через put() и не ждет базу. Обновления сначала
+    сливаются в OpenBars, в очередь попадает только закрытый бар или снимок
+    по таймеру open_bar_seconds. Закрытые бары после успешной записи отдаются
+    в publish(rows), если он задан (шина событий). Задача run() собирает пачку
+    до batch_size строк или flush_seconds секунд и пишет ее в отдельном потоке
+    через save(rows). Если база не успевает и очередь заполнилась, put() ждет
+    свободного места - это backpressure, он считается и виден в статистике.
+    Пачка, которую не удалось записать, повторяется retries раз с растущей задержкой,
+    а затем откладывается и уходит в БД вместе со следующей: короткий сбой базы
+    задерживает свечи, но не теряет их. Отложенных строк не больше max_queue.
+    """
+    def __init__(self, save, batch_size=WRITE_BATCH_SIZE, flush_seconds=WRITE_FLUSH_SECONDS,
+                 max_queue=WRITE_QUEUE_SIZE, open_bar_seconds=OPEN_BAR_FLUSH_SECONDS, publish=None,
+                 retries=WRITE_RETRIES, retry_seconds=WRITE_RETRY_SECONDS):
+        self.save = save
+        self.retries = retries
+        self.retry_seconds = retry_seconds
+        self.max_carry = max_queue
+        self._carry = []  # пачки, не записанные из-за ошибки БД
+        self.publish = publish
+        self.open_bars = OpenBars()
+        self.open_bar_seconds = open_bar_seconds
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.queue = asyncio.Queue(maxsize=max_queue)
+        self._arrived = asyncio.Event()
+        self.stats = {
+            "received": 0, "queued": 0, "written": 0, "flushes": 0, "failed": 0, "retries": 0, "published": 0,
+            "max_depth": 0, "backpressure_waits": 0, "backpressure_seconds": 0.0,
+        }
+        self._last_report = time.monotonic()
+        self._received = {}  # тикер -> когда пришло последнее обновление его бара
+        metrics.QUEUE_DEPTH.set_function(self.queue.qsize)
+
+    async def put(self, row, received=None):
+        """received - unix-время получения обновления из стрима (по умолчанию - сейчас)."""
+        received = received if received is not None else time.time()
+        self.stats["received"] += 1
+        for bar in self.open_bars.update(row):
+            if bar is row:
+                # запоздавшее обновление уже закрытого бара: событие - его получение
+                await self._enqueue(bar, closed=True, event_at=received)
+            else:
+                # бар закрылся: событие - конец его минуты
+                await self._enqueue(bar, closed=True, event_at=bar["time"].timestamp() + BAR_SECONDS)
+        if self.open_bars.bars.get(row["ticker"]) is row:
+            self._received[row["ticker"]] = received
+
+    async def write(self, row):
+        """Кладет готовый бар прямо в очередь записи, минуя OpenBars (докачка истории)."""
+        await self._enqueue(row)
+
+    async def _enqueue(self, row, closed=False, event_at=None):
+        """
+        closed=True - бар закрылся в живом потоке, после записи о нем объявляется в шину.
+        event_at - момент события (закрытие бара или получение снимка), от которого считается
+        задержка до коммита; у истории его нет, и она в задержки не идет.
+        """
+        item = (row, closed, event_at, time.time() if event_at is not None else None)
+        self.stats["queued"] += 1
+        try:
+            self.queue.put_nowait(item)
+        except asyncio.QueueFull:
+            self.stats["backpressure_waits"] += 1
+            metrics.BACKPRESSURE.inc()
+            started = time.monotonic()
+            await self.queue.put(item)
+            self.stats["backpressure_seconds"] += time.monotonic() - started
+        self._arrived.set()
+        self.stats["max_depth"] = max(self.stats["max_depth"], self.queue.qsize())
+
+    async def _next_batch(self):
+        """
+        Ждет первую строку, затем добирает пачку до лимита по размеру или времени.
+        Отложенные после сбоя БД строки идут в начало пачки и повторяются не позже
+        чем через flush_seconds, даже если новых строк нет.
+        Возвращает (пачка, пора ли остановиться).
+        """
+        batch, self._carry = self._carry, []
+        if batch:
+            deadline = time.monotonic() + self.flush_seconds
+            item = await self._next_item(deadline)
+        else:
+            item = await self.queue.get()
+            deadline = time.monotonic() + self.flush_seconds
+        while item is not None and item is not _STOP:
+            batch.append(item)
+            if len(batch) >= self.batch_size:
+                return batch, False
+            item = await self._next_item(deadline)
+        return batch, item is _STOP
+
+    async def _next_item(self, deadline):
+        """
+        Следующий бар из очереди или None, если до deadline ничего не пришло.
+        Бары забираются только get_nowait, а ждем сигнала от _enqueue: у wait_for(queue.get())
+        бар, пришедший ровно на границе flush_seconds, мог пропасть и не попасть в БД.
+        """
+        while True:
+            self._arrived.clear()
+            try:
+                return self.queue.get_nowait()
+            except asyncio.QueueEmpty:
+                pass
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                return None
+            try:
+                await asyncio.wait_for(self._arrived.wait(), timeout)
+            except asyncio.TimeoutError:
+                return None
+
+    async def _save(self, rows) -> bool:
+        """save(rows) с повторами и экспоненциальной задержкой; False, если все попытки неудачны."""
+        for attempt in range(self.retries + 1):
+            try:
+                await asyncio.to_thread(self.save, rows)
+                return True
+            except Exception as e:
+                if attempt == self.retries:
+                    logger.error(f"Ошибка БД: {e}. Пачка из {len(rows)} строк отложена до следующей записи")
+                    return False
+                delay = min(MAX_RETRY_DELAY, self.retry_seconds * 2 ** attempt)
+                self.stats["retries"] += 1
+                logger.warning(f"Ошибка БД: {e}. Повтор записи {len(rows)} строк через {delay:.1f} сек")
+                await asyncio.sleep(delay)
+
+    def _defer(self, batch):
+        self._carry = batch
+        overflow = len(self._carry) - self.max_carry
+        if overflow > 0:
+            # база лежит долго: отбрасываем самые старые строки, чтобы не расти без предела
+            self._carry = self._carry[overflow:]
+            self.stats["failed"] += overflow
+            metrics.WRITE_FAILED.inc(overflow)
+            logger.error(f"Отложенных строк больше {self.max_carry}: потеряно {overflow} самых старых")
+
+    async def _flush(self, batch):
+        rows = [row for row, *_ in batch]
+        started = time.monotonic()
+        if not await self._save(rows):
+            self._defer(batch)
+            return
+        self.stats["written"] += len(rows)
+        self.stats["flushes"] += 1
+
+        committed = time.time()
+        metrics.BATCH_SIZE.observe(len(rows))
+        metrics.BATCH_DURATION.observe(time.monotonic() - started)
+        for _, _, event_at, queued_at in batch:
+            if event_at is not None:
+                metrics.COMMIT_LATENCY.observe(max(0.0, committed - event_at))
+                metrics.QUEUE_LATENCY.observe(committed - queued_at)
+
+        closed = [row for row, is_closed, *_ in batch if is_closed]
+        if closed and self.publish:
+            try:
+                await self.publish(closed)
+                self.stats["published"] += len(closed)
+                metrics.PUBLISHED.inc(len(closed))
+            except Exception as e:
+                logger.warning(f"Шина недоступна: {e}. Не объявлено {len(closed)} свечей")
+
+    def _report(self):
+        if time.monotonic() - self._last_report < STATS_INTERVAL:
+            return
+        self._last_report = time.monotonic()
+        s = self.stats
+        logger.info(
+            f"Запись: очередь {self.queue.qsize()} (макс {s['max_depth']}), "
+            f"обновлений {s['received']} -> строк {s['queued']}, записано {s['written']} за {s['flushes']} пачек, "
+            f"ошибок {s['failed']}, в шину {s['published']}, backpressure {s['backpressure_waits']} раз / {s['backpressure_seconds']:.1f} сек"
+        )
+
+    async def _flush_open_bars(self):
+        while True:
+            await asyncio.sleep(self.open_bar_seconds)
+            await self._enqueue_snapshots()
+
+    async def _enqueue_snapshots(self):
+        """Снимки незакрытых баров; событие снимка - получение последнего обновления бара."""
+        for bar in self.open_bars.take_dirty():
+            await self._enqueue(bar, event_at=self._received.get(bar["ticker"], time.time()))
+
+    async def run(self):
+        timer = asyncio.create_task(self._flush_open_bars())
+        try:
+            while True:
+                batch, stopped = await self._next_batch()
+                if batch:
+                    await self._flush(batch)
+                self._report()
+                if stopped:
+                    return
+        finally:
+            timer.cancel()
+            if self._carry:
+                self.stats["failed"] += len(self._carry)
+                metrics.WRITE_FAILED.inc(len(self._carry))
+                logger.error(f"Запись остановлена: потеряно {len(self._carry)} отложенных строк")
+
+    async def close(self):
+        """Сбрасывает незакрытые бары и просит run() дописать очередь и завершиться."""
+        await self._enqueue_snapshots()
+        await self.queue.put(_STOP)
+        self._arrived.set()